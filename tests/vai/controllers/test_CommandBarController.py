@@ -13,6 +13,7 @@ class TestCommandBarController(unittest.TestCase):
         self.command_bar.returnPressed = Mock(spec=VSignal)
         self.command_bar.tabPressed = Mock(spec=VSignal)
         self.command_bar.escapePressed = Mock(spec=VSignal)
+        self.command_bar.textChanged = Mock(spec=VSignal)
 
         self.edit_area = Mock(spec=EditArea)
         self.edit_area.height.return_value = 20
@@ -41,5 +42,29 @@ class TestCommandBarController(unittest.TestCase):
 
         controller.autocompleteCommandBar()
 
+    def testSearchHighlight(self):
+        self.global_state.editor_mode = models.EditorMode.SEARCH_FORWARD
+        self.command_bar.command_text = "foo"
+
+        controller = controllers.CommandBarController(self.command_bar, self.edit_area,
+                                                      self.editor_controller, self.global_state)
+
+        controller.commandTextChanged("foo")
+        self.edit_area.setSearchHighlight.assert_called_with("foo")
+
+        controller.parseCommandBar()
+        self.edit_area.setSearchHighlight.assert_called_with(None)
+        self.editor_controller.searchForward.assert_called_with("foo")
+
+    def testNoSearchHighlightForCommands(self):
+        self.global_state.editor_mode = models.EditorMode.COMMAND_INPUT
+        self.command_bar.command_text = "w"
+
+        controller = controllers.CommandBarController(self.command_bar, self.edit_area,
+                                                      self.editor_controller, self.global_state)
+
+        controller.commandTextChanged("w")
+        self.assertFalse(self.edit_area.setSearchHighlight.called)
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import Mock, PropertyMock
 from vai.EditArea import EditArea
 from vai import models
+from vai.models import storage
 from vaitk.gui import events
 import vaitk
 from tests import fixtures
@@ -112,5 +113,42 @@ class TestEditAreaController(unittest.TestCase):
 
         self.assertEqual(global_state.clipboard, '#!python\n')
     
+    def testReadOnlyBuffer(self):
+        buffer = models.Buffer(storage.MmapStorage())
+        with open(fixtures.get("basic_python.py"), "r") as f:
+            buffer.document.read(f)
+        buffer.document.indexMore(1024*1024)
+        controller = controllers.EditAreaController(self.mock_edit_area,
+                                                    self.mock_global_state,
+                                                    self.mock_editor_controller)
+        controller.buffer = buffer
+        line_before = buffer.document.lineText(1)
+
+        controller.handleKeyEvent(events.VKeyEvent(vaitk.Key.Key_X))
+        controller.handleKeyEvent(events.VKeyEvent(vaitk.Key.Key_J | vaitk.KeyModifier.ShiftModifier))
+        self.assertEqual(buffer.document.lineText(1), line_before)
+
+        controller.handleKeyEvent(events.VKeyEvent(vaitk.Key.Key_J))
+        self.assertEqual(buffer.cursor.pos, (2, 1))
+
+    def testCtrlC(self):
+        buffer = fixtures.buffer("basic_python.py")
+        controller = controllers.EditAreaController(self.mock_edit_area,
+                                                    self.mock_global_state,
+                                                    self.mock_editor_controller)
+        controller.buffer = buffer
+
+        # Not loading: the event is left to the application
+        event = events.VKeyEvent(vaitk.Key.Key_C | vaitk.KeyModifier.ControlModifier)
+        controller.handleKeyEvent(event)
+        self.assertFalse(event.isAccepted())
+        self.assertFalse(self.mock_editor_controller.cancelLoading.called)
+
+        buffer.loader = Mock(spec=models.DocumentLoader)
+        event = events.VKeyEvent(vaitk.Key.Key_C | vaitk.KeyModifier.ControlModifier)
+        controller.handleKeyEvent(event)
+        self.assertTrue(event.isAccepted())
+        self.assertTrue(self.mock_editor_controller.cancelLoading.called)
+
 if __name__ == '__main__':
     unittest.main()
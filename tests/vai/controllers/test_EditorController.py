@@ -1,5 +1,9 @@
+import hashlib
+import os
+import shutil
+import tempfile
 import unittest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 from vai import controllers
 from vai import models
@@ -36,5 +40,48 @@ class TestEditorController(unittest.TestCase):
     def testBug206(self):
         self.editor_controller.doInsertFile(fixtures.get("basic_python.py"))
 
+    def testOpenFile(self):
+        fd, filename = tempfile.mkstemp(suffix=".txt")
+        os.close(fd)
+        text = "".join("line %d\n" % i for i in range(100000))
+        with open(filename, "w") as f:
+            f.write(text)
+
+        # Keeps the EditorState created by openFile out of the other tests
+        try:
+            with patch.object(models.EditorState, "_instance", None):
+                self.editor_controller.openFile(filename)
+        finally:
+            os.remove(filename)
+
+        buffer = self.buffer_list.current
+        document = buffer.document
+        self.assertEqual(document.documentText(), text)
+        self.assertEqual(document.documentMetaInfo("Filename").data(), filename)
+        self.assertEqual(document.documentMetaInfo("InitialMD5").data().hexdigest(),
+                         hashlib.md5(text.encode("utf-8")).hexdigest())
+        self.assertIsNone(buffer.loader)
+        self.assertIsNotNone(buffer.undo_journal)
+
+        # Not a python file
+        self.assertEqual(document.lineMetaInfo("LinterResult").notNoneData(), {})
+
+    def testSave(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "saved.txt")
+        buffer = self.buffer_list.current
+        buffer.document.insertLines(1, ["hello"])
+        buffer.document.documentMetaInfo("Modified").setData(True)
+        try:
+            self.editor_controller.doSaveAs(filename)
+            with open(filename) as f:
+                self.assertEqual(f.read(), "hello\n\n")
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertFalse(buffer.isModified())
+        self.assertIsNone(buffer.saver)
+        self.assertEqual(buffer.document.documentMetaInfo("Filename").data(), filename)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+from vai import models
+from vai.models import commands
+
+class TestCompleteWordCommand(unittest.TestCase):
+    def setUp(self):
+        self.buffer = models.Buffer()
+        self.buffer.document.read(["x = gLI(3)\n"])
+
+    def testCompleteWordCommand(self):
+        self.buffer.cursor.toPos((1,8))
+        command = commands.CompleteWordCommand(self.buffer, "gLI", "_getLexerInstance")
+        result = command.execute()
+        self.assertTrue(result.success)
+        self.assertEqual(self.buffer.document.lineText(1), "x = _getLexerInstance(3)\n")
+        self.assertEqual(self.buffer.cursor.pos, (1,22))
+
+    def testMismatch(self):
+        self.buffer.cursor.toPos((1,7))
+        command = commands.CompleteWordCommand(self.buffer, "gLI", "_getLexerInstance")
+        result = command.execute()
+        self.assertFalse(result.success)
+        self.assertEqual(self.buffer.document.lineText(1), "x = gLI(3)\n")
+
+    def testUndo(self):
+        self.buffer.cursor.toPos((1,8))
+        command = commands.CompleteWordCommand(self.buffer, "gLI", "_getLexerInstance")
+        command.execute()
+        command.undo()
+        self.assertEqual(self.buffer.document.lineText(1), "x = gLI(3)\n")
+        self.assertEqual(self.buffer.cursor.pos, (1,8))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from vai import models
+from vai import Search
+from vai.models.storage import MmapStorage, ListStorage
+
+def residentMemory():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+class TestMmapStorage(unittest.TestCase):
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+        self.files = []
+
+    def tearDown(self):
+        for f in self.files:
+            f.close()
+        os.remove(self.filename)
+
+    def openStorage(self, text, block_size=16):
+        with open(self.filename, "w") as f:
+            f.write(text)
+
+        f = open(self.filename, "r")
+        self.files.append(f)
+        storage = MmapStorage(block_size=block_size)
+        storage.load(f)
+        return storage
+
+    def testEmpty(self):
+        storage = self.openStorage("")
+        self.assertTrue(storage.indexMore(100))
+        self.assertEqual(storage.numLines(), 1)
+        self.assertEqual(storage.text(0), "\n")
+
+    def testSameAsListStorage(self):
+        rnd = random.Random(1)
+        words = ["", "a", "word", "àèìòù", "x"*40, "€ uro"]
+        for last_line in ("", "no eol"):
+            lines = [" ".join(rnd.choice(words) for _ in range(rnd.randint(0, 5)))+"\n" for _ in range(200)]
+            text = "".join(lines) + last_line
+            storage = self.openStorage(text)
+            reference = ListStorage()
+            reference.load(io.StringIO(text))
+
+            while not storage.indexMore(50):
+                self.assertLessEqual(storage.numLines(), reference.numLines())
+
+            self.assertEqual(storage.numLines(), reference.numLines())
+            self.assertEqual(storage.texts(0, storage.numLines()), reference.texts(0, reference.numLines()))
+            for index in range(storage.numLines()):
+                self.assertEqual(storage.lineIndex(storage.lineStart(index)), index)
+
+    def testLongLine(self):
+        storage = self.openStorage("a"*100000 + "\nb\r\n")
+        storage.indexMore(1000000)
+        self.assertEqual(storage.numLines(), 2)
+        self.assertEqual(len(storage.text(0)), 64*1024+1)
+        self.assertEqual(storage.text(1), "b\n")
+
+    def testReadOnly(self):
+        document = models.TextDocument(self.openStorage("line\n"))
+        self.assertTrue(document.isReadOnly())
+        with self.assertRaises(io.UnsupportedOperation):
+            document.insertLines(1, ["new"])
+
+    def testIndexingAddsLines(self):
+        document = models.TextDocument(MmapStorage(block_size=16))
+        document.createLineMetaInfo("Bookmark")
+        with open(self.filename, "w") as f:
+            f.write("".join("line %d\n" % i for i in range(100)))
+
+        loader = models.DocumentLoader(document)
+        loader.start(self.filename)
+        self.assertTrue(loader.isComplete())
+        self.assertIsNone(loader.md5())
+        self.assertEqual(document.numLines(), 100)
+        self.assertEqual(document.lineMetaInfo("Bookmark").numLines(), 100)
+        self.assertEqual(document.lineText(100), "line 99\n")
+
+    def testSearch(self):
+        text = "".join("line %d àè needle\n" % i if i % 7 == 0 else "line %d\n" % i for i in range(100))
+        buffer = models.Buffer(self.openStorage(text + "needle"))
+        while not buffer.document.indexMore(1000):
+            pass
+        reference = models.Buffer()
+        reference.document.read(io.StringIO(text + "needle"))
+
+        for interval in (None, (3, 50), (90, 200)):
+            self.assertEqual(Search.findAll(buffer.document, "needle", interval),
+                             Search.findAll(reference.document, "needle", interval))
+        self.assertEqual(Search.findAll(buffer.document, r"^line \d+ ", regex=True),
+                         Search.findAll(reference.document, r"^line \d+ ", regex=True))
+
+        for direction in (Search.SearchDirection.FORWARD, Search.SearchDirection.BACKWARD):
+            for _ in range(20):
+                self.assertTrue(Search.find(buffer, "needle", direction))
+                Search.find(reference, "needle", direction)
+                self.assertEqual(buffer.cursor.pos, reference.cursor.pos)
+
+    @unittest.skipUnless(os.path.exists("/proc/self/statm"), "Needs /proc to measure memory")
+    def testHugeSparseFile(self):
+        size = 3 * 1024 * 1024 * 1024
+        with open(self.filename, "w") as f:
+            f.write("first line\nsecond line\n")
+            f.seek(size)
+            f.write("\nthe needle is here\nlast line")
+
+        memory = residentMemory()
+        buffer = models.Buffer(MmapStorage())
+        models.DocumentLoader(buffer.document).start(self.filename)
+        document = buffer.document
+
+        self.assertEqual(document.numLines(), 5)
+        self.assertEqual(document.lineText(5), "last line\n")
+        self.assertEqual(Search.findAll(document, "needle"), [(4, 5, 11)])
+        self.assertTrue(Search.find(buffer, "needle", Search.SearchDirection.FORWARD))
+        self.assertEqual(buffer.cursor.pos, (4, 5))
+        self.assertLess(residentMemory() - memory, 64 * 1024 * 1024)
+
+        document.storage().close()
+
+if __name__ == '__main__':
+    unittest.main()
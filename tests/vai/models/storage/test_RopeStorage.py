@@ -0,0 +1,131 @@
+import io
+import os
+import random
+import unittest
+from vai.models.storage import RopeStorage, ListStorage
+from vai.models.TextDocument import TextDocument
+from tests import fixtures
+
+class TestRopeStorage(unittest.TestCase):
+    def testEmpty(self):
+        storage = RopeStorage()
+        self.assertEqual(storage.numLines(), 1)
+        self.assertEqual(storage.documentText(), '\n')
+
+        storage.load(io.StringIO(""))
+        self.assertEqual(storage.numLines(), 1)
+        self.assertEqual(storage.documentText(), '\n')
+
+    def testLazyLoad(self):
+        storage = RopeStorage(block_size=4, chunk_size=16)
+        text = "".join("line %d\n" % i for i in range(100))
+        storage.load(io.StringIO(text + "last"))
+
+        self.assertEqual(storage.numLines(), 101)
+        self.assertTrue(all(block.raw is not None for block in storage._blocks))
+        self.assertEqual(storage.documentText(), text + "last\n")
+
+        self.assertEqual(storage.text(50), "line 50\n")
+        self.assertEqual(storage.text(100), "last\n")
+        self.assertEqual(len([block for block in storage._blocks if block.raw is None]), 2)
+        self.assertEqual(storage.documentText(), text + "last\n")
+        self.assertEqual(storage.documentText(99), "line 99\nlast\n")
+
+    def testIterTexts(self):
+        storage = RopeStorage(block_size=4, chunk_size=16)
+        lines = ["line %d\n" % i for i in range(100)]
+        storage.load(io.StringIO("".join(lines)))
+        storage.text(50)
+
+        self.assertEqual(list(storage.iterTexts(0, 100)), lines)
+        self.assertEqual(list(storage.iterTexts(47, 9)), lines[47:56])
+        self.assertEqual(list(storage.iterTexts(99, 0)), [])
+        self.assertEqual(len([block for block in storage._blocks if block.raw is None]), 1)
+        with self.assertRaises(IndexError):
+            list(storage.iterTexts(95, 6))
+
+    def testInsertDelete(self):
+        storage = RopeStorage(block_size=3)
+        storage.load(["a", "b", "c"])
+        storage.insertLines(3, [({}, "%d\n" % i) for i in range(10)])
+        storage.insertLines(0, [({}, "first\n")])
+        self.assertEqual(storage.numLines(), 14)
+        self.assertEqual(storage.text(0), "first\n")
+        self.assertEqual(storage.text(13), "9\n")
+
+        storage.deleteLines(2, 10)
+        self.assertEqual(storage.documentText(), "first\na\n8\n9\n")
+
+        storage.deleteLines(0, 4)
+        self.assertEqual(storage.numLines(), 0)
+        storage.insertLines(0, [({}, "\n")])
+        self.assertEqual(storage.documentText(), "\n")
+
+    def testDeleteKeepsBlocksBounded(self):
+        rnd = random.Random(1)
+        storage = RopeStorage(block_size=16, chunk_size=100)
+        storage.load(io.StringIO("".join("line %d\n" % i for i in range(10000))))
+
+        storage.deleteLines(10, 9000)
+        self.assertEqual(storage.numLines(), 1000)
+        self.assertEqual(storage.text(9), "line 9\n")
+        self.assertEqual(storage.text(10), "line 9010\n")
+
+        for i in range(900):
+            storage.deleteLines(rnd.randrange(storage.numLines()), 1)
+        self.assertEqual(storage.numLines(), 100)
+        self.assertLessEqual(len(storage._blocks), 100 // 8 + 1)
+        self.assertTrue(all(block.size > 0 for block in storage._blocks))
+
+    def testDeleteInSplitRawBlock(self):
+        # Each raw chunk holds more than twice block_size lines, so it is
+        # split in pieces when materialized
+        storage = RopeStorage(block_size=16, chunk_size=1000)
+        lines = ["line %d\n" % i for i in range(1000)]
+        storage.load(io.StringIO("".join(lines)))
+
+        storage.deleteLines(200, 10)
+        del lines[200:210]
+        self.assertEqual(storage.numLines(), len(lines))
+        self.assertEqual(storage.documentText(), "".join(lines))
+        self.assertTrue(all(block.raw is not None or block.size == len(block.texts)
+                            for block in storage._blocks))
+
+    def testCharMeta(self):
+        storage = RopeStorage()
+        storage.charMeta(0)["LexerToken"] = [1]
+        self.assertEqual(storage.line(0), ({"LexerToken": [1]}, "\n"))
+
+    def testSameAsListStorage(self):
+        rnd = random.Random(1)
+        rope = TextDocument(RopeStorage(block_size=8, chunk_size=100))
+        reference = TextDocument(ListStorage())
+        for doc in (rope, reference):
+            with open(fixtures.get("bigfile.py", os.path.join("..", "fixtures"))) as f:
+                doc.read(f)
+
+        for step in range(500):
+            line_number = rnd.randint(1, reference.numLines())
+            operation = rnd.choice(["insertChars", "deleteChars", "breakLine",
+                                    "joinWithNextLine", "insertLines", "deleteLines"])
+            for doc in (rope, reference):
+                if operation == "insertChars":
+                    doc.insertChars((line_number, 1), "xyz")
+                elif operation == "deleteChars":
+                    doc.deleteChars((line_number, 1), 3)
+                elif operation == "breakLine":
+                    doc.breakLine((line_number, 1))
+                elif operation == "joinWithNextLine":
+                    doc.joinWithNextLine(line_number)
+                elif operation == "insertLines":
+                    doc.insertLines(line_number, ["foo", "bar"] * 10)
+                else:
+                    doc.deleteLines(line_number, min(20, doc.numLines()-line_number+1))
+
+            self.assertEqual(rope.numLines(), reference.numLines())
+
+        self.assertEqual(rope.documentText(), reference.documentText())
+        self.assertEqual(rope.documentText(100), reference.documentText(100))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ from vai.models.TextDocument import TextDocument
 from vai.models.TextDocumentCursor import TextDocumentCursor
 from vai.models.EditAreaModel import EditAreaModel
 from vai.models.Buffer import Buffer
+from vai.models.commands import InsertStringCommand, DeleteSingleCharCommand
 from unittest.mock import Mock
 
 class TestBuffer(unittest.TestCase):
@@ -47,7 +48,33 @@ class TestBuffer(unittest.TestCase):
         b = self.buf
         self.assertIsInstance(b.edit_area_model, EditAreaModel)
 
+    def testModifiedFollowsSavedText(self):
+        buffer = Buffer()
+        buffer.document.insertLines(1, ["hello"])
+        buffer.markSaved()
 
+        buffer.cursor.toPos((1, 6))
+        command = InsertStringCommand(buffer, "x")
+        command.execute()
+        buffer.command_history.add(command)
+        self.assertTrue(buffer.isModified())
+
+        buffer.markSaved()
+        buffer.command_history.undo()
+        self.assertTrue(buffer.isModified())
+
+        buffer.command_history.redo()
+        self.assertFalse(buffer.isModified())
+
+        command = DeleteSingleCharCommand(buffer)
+        command.execute()
+        buffer.command_history.add(command)
+        self.assertTrue(buffer.isModified())
+
+        command = InsertStringCommand(buffer, "x")
+        command.execute()
+        buffer.command_history.add(command)
+        self.assertFalse(buffer.isModified())
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,6 @@
 import unittest
+from vai import models
+from vai.models import commands
 from vai.models.CommandHistory import CommandHistory
 from unittest.mock import Mock
 
@@ -58,6 +60,90 @@ class TestCommandHistory(unittest.TestCase):
 
         self.assertEqual(command_history.numUndoableCommands(), 3)
         self.assertEqual(command_history.numRedoableCommands(), 0)
+    def testUndoRedo(self):
+        command_history = CommandHistory()
+        command = Mock()
+        command_history.add(command)
+
+        undone = []
+        command_history.commandUndone.connect(lambda c: undone.append((c, c.undo.called)))
+        self.assertEqual(command_history.undo(), command)
+        self.assertEqual(undone, [(command, True)])
+        self.assertRaises(IndexError, lambda : command_history.undo())
+
+        self.assertEqual(command_history.redo(), command)
+        self.assertTrue(command.execute.called)
+        self.assertRaises(IndexError, lambda : command_history.redo())
+
+    def testMergeTypingRun(self):
+        buffer = models.Buffer()
+        command_history = CommandHistory()
+        document = buffer.document
+
+        for text in ["h", "el", "lo"]:
+            command = commands.InsertStringCommand(buffer, text)
+            command.execute()
+            command_history.add(command)
+
+        self.assertEqual(document.lineText(1), "hello\n")
+        self.assertEqual(command_history.numUndoableCommands(), 1)
+
+        # Typing somewhere else starts a new step
+        buffer.cursor.toPos((1,1))
+        command = commands.InsertStringCommand(buffer, "!")
+        command.execute()
+        command_history.add(command)
+        self.assertEqual(command_history.numUndoableCommands(), 2)
+
+        command_history.prev().undo()
+        self.assertEqual(document.lineText(1), "hello\n")
+        command_history.prev().undo()
+        self.assertEqual(document.lineText(1), "\n")
+        self.assertEqual(buffer.cursor.pos, (1,1))
+        self.assertFalse(buffer.isModified())
+
+        command_history.next().execute()
+        self.assertEqual(document.lineText(1), "hello\n")
+        self.assertEqual(buffer.cursor.pos, (1,6))
+
+    def testMaxSteps(self):
+        command_history = CommandHistory(max_steps=3)
+        all_commands = [Mock() for i in range(5)]
+        for command in all_commands:
+            command_history.add(command)
+
+        self.assertEqual(command_history.numUndoableCommands(), 3)
+        self.assertEqual(command_history.prev(), all_commands[4])
+        self.assertEqual(command_history.prev(), all_commands[3])
+        self.assertEqual(command_history.prev(), all_commands[2])
+        self.assertRaises(IndexError, lambda : command_history.prev())
+
+    def testMaxMemory(self):
+        buffer = models.Buffer()
+        command_history = CommandHistory(max_memory=20000)
+
+        # A simulated typing session, breaking the line every few keys
+        for i in range(2000):
+            if i % 20 == 19:
+                command = commands.BreakLineCommand(buffer)
+            else:
+                command = commands.InsertStringCommand(buffer, "x")
+            command.execute()
+            command_history.add(command)
+
+        self.assertLessEqual(command_history.memoryUsage(), 20000)
+        self.assertGreater(command_history.numUndoableCommands(), 1)
+        self.assertLess(command_history.numUndoableCommands(), 200)
+
+        # Undone commands count until they are discarded by a new command
+        usage = command_history.memoryUsage()
+        command_history.prev().undo()
+        self.assertEqual(command_history.memoryUsage(), usage)
+
+        command = commands.InsertStringCommand(buffer, "y")
+        command.execute()
+        command_history.add(command)
+        self.assertLess(command_history.memoryUsage(), usage)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import tempfile
+import unittest
+from vai import models
+from vai.models import storage
+from vaitk import test
+
+class TestDocumentLoader(unittest.TestCase):
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def writeFile(self, text):
+        with open(self.filename, "w") as f:
+            f.write(text)
+
+    def testLoad(self):
+        text = "".join("line %d\n" % i for i in range(1000))
+        for last_line in ("", "last", "a long last line without EOL " * 10):
+            for document_storage in (storage.ListStorage(), storage.RopeStorage(block_size=8)):
+                self.writeFile(text + last_line)
+                document = models.TextDocument(document_storage)
+                loader = models.DocumentLoader(document, chunk_size=100, first_chunk_size=30)
+                progress_spy = test.VSignalSpy(loader.progress)
+                finished_spy = test.VSignalSpy(loader.finished)
+
+                loader.start(self.filename)
+
+                expected = text + last_line + ("\n" if last_line else "")
+                self.assertEqual(document.documentText(), expected)
+                self.assertEqual(loader.md5().hexdigest(), hashlib.md5(expected.encode("utf-8")).hexdigest())
+                self.assertTrue(loader.isComplete())
+                self.assertEqual(finished_spy.count(), 1)
+                self.assertGreater(progress_spy.count(), 50)
+                self.assertEqual(progress_spy.lastSignalParams()[0],
+                                 (len(expected), len(text+last_line)))
+
+    def testLongFirstLine(self):
+        self.writeFile("x" * 100 + "\ny\n")
+        document = models.TextDocument()
+        models.DocumentLoader(document, chunk_size=10, first_chunk_size=10).start(self.filename)
+        self.assertEqual(document.linesText2(1, document.numLines()), ["x" * 100 + "\n", "y\n"])
+
+    def testEmptyFile(self):
+        document = models.TextDocument()
+        document.read(["old\n"])
+        loader = models.DocumentLoader(document)
+        loader.start(self.filename)
+        self.assertTrue(document.isEmpty())
+        self.assertTrue(loader.isComplete())
+
+    def testCancel(self):
+        self.writeFile("".join("line %d\n" % i for i in range(1000)))
+        document = models.TextDocument()
+        loader = models.DocumentLoader(document, chunk_size=100, first_chunk_size=100)
+        finished_spy = test.VSignalSpy(loader.finished)
+        loader.progress.connect(lambda bytes_read, total_bytes: loader.cancel() if bytes_read > 1000 else None)
+
+        loader.start(self.filename)
+
+        self.assertTrue(loader.isCancelled())
+        self.assertFalse(loader.isComplete())
+        self.assertFalse(loader.isLoading())
+        self.assertEqual(finished_spy.count(), 1)
+        self.assertLess(document.numLines(), 200)
+        self.assertEqual(document.lineText(document.numLines()), "line %d\n" % (document.numLines()-1))
+
+    def testLinesAppendedAsChanges(self):
+        self.writeFile("".join("line %d\n" % i for i in range(100)))
+        document = models.TextDocument()
+        document.createLineMetaInfo("Bookmark")
+        changed_spy = test.VSignalSpy(document.changed)
+        models.DocumentLoader(document, chunk_size=100, first_chunk_size=100).start(self.filename)
+
+        changes = [args[0] for args, _ in changed_spy.signalParams()]
+        self.assertEqual(changes[0].kind, models.TextDocumentChange.RESET)
+        num_lines = changes[0].lines_added
+        for change in changes[1:]:
+            self.assertEqual(change.kind, models.TextDocumentChange.INSERT_LINES)
+            self.assertEqual(change.line_number, num_lines+1)
+            num_lines += change.lines_added
+
+        self.assertEqual(num_lines, 100)
+        self.assertEqual(document.lineMetaInfo("Bookmark").numLines(), 100)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from vai import models
+from vai.models.storage import RopeStorage
+from vaitk import test
+
+class TestDocumentSaver(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "file.txt")
+        with open(self.filename, "w") as f:
+            f.write("old text\n")
+        os.chmod(self.filename, 0o640)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testSave(self):
+        text = "".join("line %d àè\n" % i for i in range(10000))
+        document = models.TextDocument()
+        document.insertLines(1, text.splitlines())
+        document.deleteLine(document.numLines())
+        saver = models.DocumentSaver(document)
+        finished_spy = test.VSignalSpy(saver.finished)
+
+        saver.start(self.filename)
+
+        self.assertTrue(saver.isComplete())
+        self.assertFalse(saver.isSaving())
+        self.assertEqual(finished_spy.count(), 1)
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), text)
+        self.assertEqual(saver.md5().hexdigest(), hashlib.md5(text.encode("utf-8")).hexdigest())
+        self.assertEqual(os.stat(self.filename).st_mode & 0o777, 0o640)
+        self.assertEqual(os.listdir(self.directory), ["file.txt"])
+
+    def testRopeStorageSnapshot(self):
+        text = "".join("line %d\n" % i for i in range(100))
+        storage = RopeStorage(block_size=4, chunk_size=16)
+        document = models.TextDocument(storage)
+        document.read(io.StringIO(text))
+        document.insertChars((50, 1), "changed ")
+        expected = document.documentText()
+        num_raw = len([block for block in storage._blocks if block.raw is not None])
+
+        snapshot = document.snapshot()
+        self.assertEqual(len([block for block in storage._blocks if block.raw is not None]), num_raw)
+
+        document.insertChars((1, 1), "later ")
+        document.deleteLines(10, 20)
+        self.assertEqual("".join("".join(part) for part in snapshot), expected)
+
+        filename = os.path.join(self.directory, "new.txt")
+        models.DocumentSaver(document).start(filename)
+        with open(filename) as f:
+            self.assertEqual(f.read(), document.documentText())
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(os.stat(filename).st_mode & 0o777, 0o666 & ~umask)
+
+    def testFailureKeepsFile(self):
+        document = models.TextDocument()
+        document.insertLines(1, ["good", "bad \udc80"])
+        saver = models.DocumentSaver(document)
+        saver.start(self.filename)
+
+        self.assertFalse(saver.isComplete())
+        self.assertIsInstance(saver.error(), UnicodeEncodeError)
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), "old text\n")
+        self.assertEqual(os.listdir(self.directory), ["file.txt"])
+
+    def testHardLink(self):
+        link = os.path.join(self.directory, "link.txt")
+        os.link(self.filename, link)
+        document = models.TextDocument()
+        document.insertLines(1, ["new text"])
+        models.DocumentSaver(document).start(self.filename)
+
+        self.assertTrue(os.path.samefile(self.filename, link))
+        with open(link) as f:
+            self.assertEqual(f.read(), "new text\n\n")
+
+    def testReadOnlyDirectory(self):
+        document = models.TextDocument()
+        document.insertLines(1, ["new text"])
+        saver = models.DocumentSaver(document)
+        with mock.patch("tempfile.mkstemp", side_effect=PermissionError("read-only directory")):
+            saver.start(self.filename)
+
+        self.assertTrue(saver.isComplete())
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), "new text\n\n")
+        self.assertEqual(os.stat(self.filename).st_mode & 0o777, 0o640)
+
+    def testNewFileFailure(self):
+        filename = os.path.join(self.directory, "new.txt")
+        document = models.TextDocument()
+        document.insertLines(1, ["bad \udc80"])
+        saver = models.DocumentSaver(document)
+        saver.start(filename)
+
+        self.assertIsInstance(saver.error(), UnicodeEncodeError)
+        self.assertEqual(os.listdir(self.directory), ["file.txt"])
+
+    def testSymlink(self):
+        link = os.path.join(self.directory, "link.txt")
+        os.symlink(self.filename, link)
+        document = models.TextDocument()
+        document.insertLines(1, ["new text"])
+        models.DocumentSaver(document).start(link)
+
+        self.assertTrue(os.path.islink(link))
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), "new text\n\n")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import io
+import random
+import unittest
+from vai import models
+from vai.models.storage import RopeStorage
+
+class TestLineHashTree(unittest.TestCase):
+    def testSameTextSameDigest(self):
+        document = models.TextDocument()
+        tree = models.LineHashTree(document)
+        empty_digest = tree.digest()
+
+        document.insertLines(1, ["line %d" % i for i in range(500)])
+        self.assertEqual(tree.numLines(), document.numLines())
+        self.assertNotEqual(tree.digest(), empty_digest)
+
+        document.deleteLines(1, 500)
+        self.assertEqual(tree.digest(), empty_digest)
+
+    def testLoadedTextNotSplit(self):
+        storage = RopeStorage(block_size=4, chunk_size=16)
+        document = models.TextDocument(storage)
+        tree = models.LineHashTree(document)
+        text = "".join("line %d\n" % i for i in range(100))
+        document.appendText(text)
+
+        self.assertTrue(all(block.raw is not None for block in storage._blocks[1:]))
+
+        reference = models.TextDocument()
+        reference.read(io.StringIO(document.documentText()))
+        self.assertEqual(tree.digest(), models.LineHashTree(reference).digest())
+
+    def testRandomEdits(self):
+        rnd = random.Random(1)
+        document = models.TextDocument()
+        tree = models.LineHashTree(document)
+        digests = {}
+
+        for _ in range(300):
+            num_lines = document.numLines()
+            action = rnd.randint(0, 5)
+            line_number = rnd.randint(1, num_lines)
+            if action == 0:
+                document.insertLines(line_number, ["x%d" % rnd.randint(0, 3) for _ in range(rnd.randint(1, 150))])
+            elif action == 1:
+                document.deleteLines(line_number, rnd.randint(1, num_lines-line_number+1))
+            elif action == 2:
+                document.insertChars((line_number, 1), "y")
+            elif action == 3:
+                document.breakLine((line_number, 1))
+            elif action == 4:
+                document.joinWithNextLine(line_number)
+            else:
+                with document.transaction():
+                    document.newLineAfter(line_number)
+                    document.deleteLine(1)
+
+            # The digest is the one of a tree built from scratch
+            self.assertEqual(tree.digest(), models.LineHashTree(document).digest())
+
+            text = document.documentText()
+            self.assertEqual(digests.setdefault(tree.digest(), text), text)
+
+if __name__ == '__main__':
+    unittest.main()
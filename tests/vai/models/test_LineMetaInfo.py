@@ -1,4 +1,5 @@
 import os
+import random
 import unittest
 import time
 from vai.models.TextDocument import TextDocument
@@ -100,5 +101,107 @@ class TestLineMetaInfo(unittest.TestCase):
 
         self.assertEqual(meta_info.data(), [None, "damn", None, None])
 
+    def testSparseData(self):
+        doc = TextDocument()
+        doc.read(["line\n"] * 10)
+        meta_info = doc.createLineMetaInfo("whatever")
+        meta_info.setDataForLines({2: "a", 5: "b", 9: "c"})
+
+        self.assertEqual(meta_info.notNoneData(), {2: "a", 5: "b", 9: "c"})
+        self.assertEqual(meta_info.findWhere(lambda x: x == "b"), {5: "b"})
+        self.assertEqual(len(meta_info.findWhere(lambda x: x is None)), 7)
+        self.assertEqual(meta_info.data(4, 3), [None, "b", None])
+        self.assertEqual(meta_info.data(-1), "c")
+        self.assertEqual(meta_info.dataForLines([1, 2]), {1: None, 2: "a"})
+
+        doc.insertLines(3, ["new"] * 3)
+        self.assertEqual(meta_info.notNoneData(), {2: "a", 8: "b", 12: "c"})
+
+        doc.deleteLines(6, 4)
+        self.assertEqual(meta_info.notNoneData(), {2: "a", 8: "c"})
+        self.assertEqual(meta_info.numLines(), 9)
+
+        meta_info.setData([None, "d"], 1)
+        self.assertEqual(meta_info.notNoneData(), {2: "d", 8: "c"})
+
+        memento = meta_info.memento(2)
+        doc.deleteLine(2)
+        meta_info.insertFromMemento(2, memento)
+        self.assertEqual(meta_info.data(1, 3), [None, "d", None])
+
+        meta_info.clear()
+        self.assertEqual(meta_info.notNoneData(), {})
+
+    def testSameAsList(self):
+        rnd = random.Random(1)
+        doc = TextDocument()
+        doc.read(["line\n"] * 50)
+        meta_info = doc.createLineMetaInfo("whatever")
+        reference = [None] * 50
+
+        for i in range(500):
+            line_number = rnd.randint(1, len(reference))
+            operation = rnd.randint(0, 2)
+            if operation == 0:
+                value = rnd.choice([None, "x", "y"])
+                meta_info.setData(value, line_number)
+                reference[line_number-1] = value
+            elif operation == 1:
+                how_many = rnd.randint(1, 5)
+                doc.insertLines(line_number, ["new"] * how_many)
+                reference[line_number-1:line_number-1] = [None] * how_many
+            elif len(reference) > 1:
+                how_many = rnd.randint(1, len(reference)-line_number+1)
+                doc.deleteLines(line_number, how_many)
+                del reference[line_number-1:line_number-1+how_many]
+                if len(reference) == 0:
+                    reference = [None]
+
+            self.assertEqual(meta_info.data(), reference)
+
+    def testMarkers(self):
+        doc = TextDocument()
+        doc.read(["line\n"] * 10)
+        meta_info = doc.createLineMetaInfo("whatever")
+        meta_info.setDataForLines({2: "a", 5: "b", 8: "a"})
+
+        marker = meta_info.marker(5)
+        self.assertEqual((marker.line, marker.value), (5, "b"))
+        self.assertIsNone(meta_info.marker(4))
+        self.assertEqual([m.line for m in meta_info.markersWithValue("a")], [2, 8])
+        self.assertEqual([m.value for m in meta_info.markers(3, 6)], ["b", "a"])
+
+        # Markers follow their lines
+        doc.insertLines(1, ["new"] * 3)
+        self.assertEqual(marker.line, 8)
+        doc.deleteLines(1, 2)
+        self.assertEqual(marker.line, 6)
+        self.assertEqual([m.line for m in meta_info.markersWithValue("a")], [3, 9])
+
+        meta_info.setData("c", 6)
+        self.assertIs(meta_info.marker(6), marker)
+        self.assertEqual(meta_info.markersWithValue("b"), [])
+        self.assertEqual(meta_info.markersWithValue("c"), [marker])
+
+        doc.deleteLine(6)
+        self.assertFalse(marker.isValid())
+        self.assertIsNone(marker.line)
+        self.assertEqual(meta_info.markersWithValue("c"), [])
+
+        # Unhashable values can not be found by value
+        meta_info.setData([["x"]], 1)
+        self.assertEqual(meta_info.marker(1).value, ["x"])
+
+    def testDeleteManyLines(self):
+        doc = TextDocument()
+        doc.read(["line\n"] * 100000)
+        meta_info = doc.createLineMetaInfo("whatever")
+        meta_info.setDataForLines({1: "a", 50000: "b", 100000: "c"})
+
+        start = time.perf_counter()
+        doc.deleteLines(10, 10000)
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertEqual(meta_info.notNoneData(), {1: "a", 40000: "b", 90000: "c"})
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,64 @@
+import copy
+import unittest
+from vai.models.RunLengthList import RunLengthList
+
+class TestRunLengthList(unittest.TestCase):
+    def testInit(self):
+        rll = RunLengthList([1, 1, 1, None, None, 2])
+        self.assertEqual(len(rll), 6)
+        self.assertEqual(rll.runs(), [(1, 3), (None, 2), (2, 1)])
+        self.assertEqual(rll, [1, 1, 1, None, None, 2])
+        self.assertEqual(list(rll), [1, 1, 1, None, None, 2])
+        self.assertEqual(RunLengthList.repeat(None, 3), [None, None, None])
+        self.assertEqual(len(RunLengthList()), 0)
+
+    def testGetItem(self):
+        rll = RunLengthList([1, 1, 1, None, None, 2])
+        self.assertEqual(rll[0], 1)
+        self.assertEqual(rll[3], None)
+        self.assertEqual(rll[-1], 2)
+        self.assertRaises(IndexError, lambda: rll[6])
+        self.assertEqual(rll[2:5], [1, None, None])
+        self.assertEqual(rll[4:], [None, 2])
+        self.assertEqual(rll[:0], [])
+
+    def testSetItem(self):
+        rll = RunLengthList([1, 1, 1, 1])
+        rll[1:3] = [2, 2, 2]
+        self.assertEqual(rll, [1, 2, 2, 2, 1])
+        rll[0:0] = RunLengthList.repeat(None, 2)
+        self.assertEqual(rll, [None, None, 1, 2, 2, 2, 1])
+        rll[3] = 1
+        self.assertEqual(rll.runs(), [(None, 2), (1, 2), (2, 2), (1, 1)])
+        del rll[4:]
+        self.assertEqual(rll, [None, None, 1, 1])
+
+    def testIndexAfterChanges(self):
+        values = [i // 3 for i in range(30)]
+        rll = RunLengthList(values)
+        shared = RunLengthList(rll)
+        self.assertEqual([rll[i] for i in range(30)], values)
+
+        rll[5:20] = [7] * 4
+        values[5:20] = [7] * 4
+        self.assertEqual([rll[i] for i in range(len(rll))], values)
+        self.assertEqual(shared[10], 3)
+
+        rll = copy.deepcopy(rll)
+        self.assertEqual([rll[i] for i in range(len(rll))], values)
+
+    def testAdd(self):
+        rll = RunLengthList([1, 1]) + [1, 2]
+        self.assertEqual(rll.runs(), [(1, 3), (2, 1)])
+        rll = [3] + RunLengthList([1])
+        self.assertEqual(rll, [3, 1])
+
+    def testDeepCopy(self):
+        rll = RunLengthList([1, 1, 2])
+        rll_copy = copy.deepcopy(rll)
+        rll_copy[0:1] = [5]
+        self.assertEqual(rll, [1, 1, 2])
+        self.assertEqual(rll_copy, [5, 1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
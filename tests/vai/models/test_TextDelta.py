@@ -0,0 +1,50 @@
+import random
+import unittest
+from vai.models import TextDelta
+
+class TestTextDelta(unittest.TestCase):
+    def testBetween(self):
+        self.assertEqual(TextDelta.between(["hello\n"], ["hello\n"], 3), None)
+        self.assertEqual(TextDelta.between(["helo\n"], ["hello\n"], 3),
+                         TextDelta(3, 4, "", "l"))
+        self.assertEqual(TextDelta.between(["abc\n", "def\n"], ["abcdef\n"], 1),
+                         TextDelta(1, 4, "\n", ""))
+        self.assertEqual(TextDelta.between(["abc\n", "def\n"], ["abc\n", "xy\n", "def\n"], 5),
+                         TextDelta(6, 1, "", "xy\n"))
+
+    def testApply(self):
+        lines = ["abc\n", "def\n", "ghi\n"]
+        delta = TextDelta(1, 3, "c\nd", "X")
+        self.assertEqual(delta.applyToLines(list(lines)), ["abXef\n", "ghi\n"])
+        self.assertEqual(delta.inverse().applyToLines(["abXef\n", "ghi\n"]), lines)
+        self.assertEqual(delta.endPos(), (1, 4))
+        self.assertEqual(TextDelta(1, 1, "", "a\nb").endPos(), (2, 2))
+        self.assertRaises(ValueError, lambda : TextDelta(1, 1, "x", "").applyToLines(list(lines)))
+
+    def testRandom(self):
+        rnd = random.Random(3)
+        for i in range(200):
+            lines = [rnd.choice(["", "a", "ab", "ba"])+"\n" for n in range(rnd.randint(1, 5))]
+            steps = [lines]
+            for n in range(2):
+                text = "".join(steps[-1])
+                start = rnd.randint(0, len(text)-1)
+                end = rnd.randint(start, len(text)-1)
+                text = text[:start] + rnd.choice(["", "a", "\n", "b\n"]) + text[end:]
+                steps.append(text.splitlines(True))
+
+            delta1 = TextDelta.between(steps[0], steps[1], 1)
+            delta2 = TextDelta.between(steps[1], steps[2], 1)
+            if delta1 is not None:
+                self.assertEqual(delta1.applyToLines(list(steps[0])), steps[1])
+                self.assertEqual(delta1.inverse().applyToLines(list(steps[1])), steps[0])
+
+            if delta1 is not None and delta2 is not None:
+                composed = delta1.composed(delta2, steps[1])
+                if composed is None:
+                    self.assertEqual(steps[0], steps[2])
+                else:
+                    self.assertEqual(composed.applyToLines(list(steps[0])), steps[2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,14 @@
 import os
+import random
+import re
+import sys
 import unittest
 import time
-from vai.models.TextDocument import TextDocument
+from vai.models.TextDocument import TextDocument, CharMeta
+from vai.models.RunLengthList import RunLengthList
 from vai.models.TextDocument import _withEOL, _withoutEOL
+from vai.models.TextDocumentChange import TextDocumentChange
+from vaitk import test
 from tests import fixtures
 
 class TestTextDocument(unittest.TestCase):
@@ -458,6 +464,20 @@ class TestTextDocument(unittest.TestCase):
         self.assertEqual(doc.documentText(), initial_text)
         self.assertEqual(meta_info1.data(1), "hello")
 
+    def testMementoSharesText(self):
+        doc = TextDocument()
+        doc.read(["hello\n", "world\n"])
+        doc.updateCharMeta((1, 1), {CharMeta.LexerToken: [1]*6})
+
+        memento = doc.lineMemento(1)
+        self.assertIs(memento[0][1], doc.lineText(1))
+        self.assertIsNone(memento[0][0])
+
+        doc.insertChars((1, 1), "xx")
+        doc.replaceFromMemento(1, memento)
+        self.assertEqual(doc.lineText(1), "hello\n")
+        self.assertEqual(doc.charMeta((1, 1)), {})
+
     def testExtractFragment(self):
         doc = TextDocument()
         with open(fixtures.get("bigfile.py"), 'r') as f:
@@ -500,5 +520,145 @@ class TestTextDocument(unittest.TestCase):
         self.assertEqual(fragment.lineText(3), doc.lineText(12))
         self.assertEqual(fragment.lineText(4), doc.lineText(13))
 
+    def testCharMetaBigFile(self):
+        # bigfile.py scaled up 100x, with token-like char meta on every line
+        with open(fixtures.get("bigfile.py"), 'r') as f:
+            lines = f.readlines() * 100
+
+        doc = TextDocument()
+        doc.read(lines)
+
+        start = time.perf_counter()
+        for line_number, line in enumerate(lines, 1):
+            meta = [(match.lastgroup, len(match.group())) for match in _TOKEN_RE.finditer(line)]
+            doc.updateCharMeta((line_number, 1), {CharMeta.LexerToken: RunLengthList.fromRuns(meta)})
+        fill_time = time.perf_counter() - start
+
+        # Memory compared to one list entry per character
+        run_length_size = 0
+        list_size = 0
+        for line_number in range(1, doc.numLines()+1):
+            values = doc.charMeta((line_number, 1))[CharMeta.LexerToken]
+            run_length_size += sys.getsizeof(values) + sys.getsizeof(values._values) + sys.getsizeof(values._lengths)
+            list_size += sys.getsizeof([None] * len(values))
+
+        self.assertEqual(len(doc.charMeta((1, 1))[CharMeta.LexerToken]), doc.lineLength(1))
+        self.assertLess(run_length_size, list_size)
+        self.assertLess(fill_time, 10.0)
+
+        # Keystroke latency must not depend on the file size
+        def keystrokeTime(document, line_number):
+            best = None
+            for attempt in range(5):
+                start = time.perf_counter()
+                for i in range(50):
+                    document.insertChars((line_number, 5), "x")
+                    document.deleteChars((line_number, 5), 1)
+                elapsed = (time.perf_counter() - start) / 100
+                best = elapsed if best is None else min(best, elapsed)
+            return best
+
+        small_doc = TextDocument()
+        small_doc.read(lines[:50])
+        for line_number in range(1, 51):
+            small_doc.updateCharMeta((line_number, 1), doc.charMeta((line_number, 1)))
+
+        self.assertLess(keystrokeTime(doc, 30), keystrokeTime(small_doc, 30) * 3)
+
+    def testChangedSignal(self):
+        doc = TextDocument()
+        doc.read(["hello\n", "world\n"])
+        changed_spy = test.VSignalSpy(doc.changed)
+        num_lines_spy = test.VSignalSpy(doc.numLinesChanged)
+
+        doc.insertChars((1, 3), "xy")
+        doc.deleteChars((2, 2), 10)
+        doc.breakLine((1, 4))
+        doc.joinWithNextLine(1)
+        doc.insertLines(2, ["a", "b"])
+        doc.deleteLines(2, 2)
+
+        changes = [args[0] for args, _ in changed_spy.signalParams()]
+        self.assertEqual([change.kind for change in changes],
+                         [TextDocumentChange.INSERT_CHARS,
+                          TextDocumentChange.DELETE_CHARS,
+                          TextDocumentChange.BREAK_LINE,
+                          TextDocumentChange.JOIN_LINES,
+                          TextDocumentChange.INSERT_LINES,
+                          TextDocumentChange.DELETE_LINES])
+        self.assertEqual([change[2:] for change in changes],
+                         [(1, 1, 1, 3, 0, 2),
+                          (2, 1, 1, 2, 4, 0),
+                          (1, 1, 2, 4, 0, 0),
+                          (1, 2, 1, 4, 0, 0),
+                          (2, 0, 2, None, 0, 0),
+                          (2, 2, 0, None, 0, 0)])
+        self.assertEqual([change.version for change in changes], list(range(2, 8)))
+        self.assertEqual(doc.version(), 7)
+        self.assertEqual(changes[4].last_line_added, 3)
+        self.assertEqual(changes[5].num_lines_delta, -2)
+
+        # Changes within a line do not change the number of lines
+        self.assertEqual(num_lines_spy.count(), 4)
+
+    def testTransaction(self):
+        doc = TextDocument()
+        doc.read(["line %d\n" % i for i in range(20)])
+        doc.createLineMetaInfo("whatever")
+        changed_spy = test.VSignalSpy(doc.changed)
+        content_spy = test.VSignalSpy(doc.contentChanged)
+        meta_spy = test.VSignalSpy(doc.lineMetaInfo("whatever").contentChanged)
+
+        with doc.transaction():
+            doc.insertChars((5, 1), "x")
+            with doc.transaction():
+                doc.insertLines(10, ["a", "b", "c"])
+                doc.lineMetaInfo("whatever").setData(["added"]*3, 10)
+            doc.deleteLine(3)
+            self.assertEqual(changed_spy.count(), 0)
+            self.assertEqual(meta_spy.count(), 0)
+            self.assertEqual(doc.version(), 4)
+
+        self.assertEqual(changed_spy.count(), 1)
+        self.assertEqual(content_spy.count(), 1)
+        self.assertEqual(meta_spy.count(), 1)
+        change = changed_spy.lastSignalParams()[0][0]
+        self.assertEqual(change.kind, TextDocumentChange.MULTIPLE)
+        self.assertEqual(change.version, 4)
+        self.assertEqual(change[2:5], (3, 7, 9))
+        self.assertEqual(doc.lineMetaInfo("whatever").data(9, 3), ["added"]*3)
+
+    def testTransactionChangeCoversModifiedLines(self):
+        rnd = random.Random(42)
+        for attempt in range(50):
+            doc = TextDocument()
+            doc.read(["line %d\n" % i for i in range(30)])
+            old_lines = doc.linesText2(1, doc.numLines())
+            spy = test.VSignalSpy(doc.changed)
+
+            with doc.transaction():
+                for i in range(rnd.randint(1, 5)):
+                    line_number = rnd.randint(1, doc.numLines()-1)
+                    operation = rnd.randint(0, 4)
+                    if operation == 0:
+                        doc.insertChars((line_number, 1), "x")
+                    elif operation == 1:
+                        doc.insertLines(line_number, ["new"]*rnd.randint(1, 3))
+                    elif operation == 2:
+                        doc.deleteLine(line_number)
+                    elif operation == 3:
+                        doc.breakLine((line_number, 3))
+                    else:
+                        doc.joinWithNextLine(line_number)
+
+            change = spy.lastSignalParams()[0][0]
+            new_lines = doc.linesText2(1, doc.numLines())
+            start = change.line_number - 1
+            self.assertEqual(len(new_lines), len(old_lines)+change.num_lines_delta)
+            self.assertEqual(new_lines[:start], old_lines[:start])
+            self.assertEqual(new_lines[start+change.lines_added:], old_lines[start+change.lines_removed:])
+
+_TOKEN_RE = re.compile(r"(?P<name>\w+)|(?P<space>\s+)|(?P<punct>[^\w\s]+)")
+
 if __name__ == '__main__':
     unittest.main()
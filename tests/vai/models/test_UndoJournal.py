@@ -0,0 +1,191 @@
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from vai import models
+from vai.models import commands
+
+def md5(document):
+    return hashlib.md5(document.documentText().encode("utf-8")).hexdigest()
+
+class TestUndoJournal(unittest.TestCase):
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.journal_dir)
+
+    def openBuffer(self, text, max_size=1024*1024):
+        buffer = models.Buffer()
+        buffer.document.insertLines(1, text.splitlines(True))
+        buffer.document.deleteLine(buffer.document.numLines())
+        journal = models.UndoJournal(buffer, md5(buffer.document), max_size, self.journal_dir)
+        return buffer, journal
+
+    def execute(self, buffer, command):
+        result = command.execute()
+        if result.success:
+            buffer.command_history.add(command)
+        return result.success
+
+    def testReopen(self):
+        buffer, journal = self.openBuffer("def foo():\n    pass\n")
+        cursor = buffer.cursor
+
+        cursor.toPos((1,4))
+        for char in "_bar":
+            self.execute(buffer, commands.InsertStringCommand(buffer, char))
+        cursor.toPos((2,9))
+        self.execute(buffer, commands.BreakLineCommand(buffer))
+        self.execute(buffer, commands.InsertStringCommand(buffer, "return"))
+        buffer.command_history.undo()
+
+        text = buffer.document.documentText()
+        self.assertEqual(text, "def_bar foo():\n    pass\n    \n")
+        self.assertEqual(journal.numSteps(), 3)
+        journal.save(md5(buffer.document))
+
+        buffer, journal = self.openBuffer(text)
+        history = buffer.command_history
+        self.assertEqual(journal.numSteps(), 3)
+        self.assertEqual(history.numUndoableCommands(), 2)
+        self.assertEqual(history.numRedoableCommands(), 1)
+
+        # Nothing is applied until needed
+        self.assertEqual(buffer.document.documentText(), text)
+
+        history.redo()
+        self.assertEqual(buffer.document.documentText(), "def_bar foo():\n    pass\n    return\n")
+        self.assertTrue(buffer.isModified())
+
+        history.undo()
+        history.undo()
+        history.undo()
+        self.assertEqual(buffer.document.documentText(), "def foo():\n    pass\n")
+        self.assertEqual(buffer.cursor.pos, (1,4))
+
+    def testModifiedAfterSaveIsIgnored(self):
+        buffer, journal = self.openBuffer("a\n")
+        self.execute(buffer, commands.InsertStringCommand(buffer, "b"))
+        journal.save(md5(buffer.document))
+        self.execute(buffer, commands.BreakLineCommand(buffer))
+
+        buffer, journal = self.openBuffer("ba\n")
+        self.assertEqual(journal.numSteps(), 1)
+        buffer.command_history.undo()
+        self.assertEqual(buffer.document.documentText(), "a\n")
+
+        # A different content does not find the journal
+        buffer, journal = self.openBuffer("a\n")
+        self.assertEqual(journal.numSteps(), 0)
+
+    def testCompaction(self):
+        buffer, journal = self.openBuffer("\n", max_size=2000)
+        texts = [buffer.document.documentText()]
+        for i in range(100):
+            self.execute(buffer, commands.InsertStringCommand(buffer, "line %d" % i))
+            texts.append(buffer.document.documentText())
+            self.execute(buffer, commands.BreakLineCommand(buffer))
+            texts.append(buffer.document.documentText())
+            journal.save(md5(buffer.document))
+
+        filename = os.path.join(self.journal_dir, journal.key+".journal")
+        self.assertLessEqual(os.path.getsize(filename), 2000)
+        self.assertEqual(os.listdir(self.journal_dir), [journal.key+".journal"])
+
+        # The oldest steps were dropped
+        buffer, journal = self.openBuffer(texts[-1])
+        num_steps = buffer.command_history.numUndoableCommands()
+        self.assertGreater(num_steps, 10)
+        self.assertLess(num_steps, 200)
+
+        for i in range(num_steps):
+            buffer.command_history.undo()
+            self.assertEqual(buffer.document.documentText(), texts[-2-i])
+
+    def testRandomSessions(self):
+        rnd = random.Random(7)
+        text = "one\ntwo\nthree\n"
+        for session in range(5):
+            buffer, journal = self.openBuffer(text)
+            history = buffer.command_history
+            document = buffer.document
+            cursor = buffer.cursor
+
+            # The texts of the steps, as restored from the journal.
+            # The current text is states[pos].
+            pos = history.numUndoableCommands()
+            states = [document.documentText()]
+            while history.numUndoableCommands() != 0:
+                history.undo()
+                states.insert(0, document.documentText())
+            for i in range(pos):
+                history.redo()
+            while history.numRedoableCommands() != 0:
+                history.redo()
+                states.append(document.documentText())
+            while history.numUndoableCommands() != pos:
+                history.undo()
+            self.assertEqual(document.documentText(), text)
+
+            for i in range(40):
+                action = rnd.randint(0, 9)
+                if action < 2 and history.numUndoableCommands() != 0:
+                    history.undo()
+                    pos -= 1
+                    if states[pos] != document.documentText():
+                        # Some commands do not restore the same text
+                        states[pos] = document.documentText()
+                        states[:pos] = [None] * pos
+                elif action < 3 and history.numRedoableCommands() != 0:
+                    history.redo()
+                    pos += 1
+                    if states[pos] != document.documentText():
+                        states[pos] = document.documentText()
+                        states[pos+1:] = [None] * (len(states)-pos-1)
+                else:
+                    line = rnd.randint(1, document.numLines())
+                    cursor.toPos((line, rnd.randint(1, document.lineLength(line))))
+                    command_type = rnd.choice([commands.InsertStringCommand,
+                                               commands.BreakLineCommand,
+                                               commands.DeleteSingleCharCommand,
+                                               commands.DeleteLineAtCursorCommand,
+                                               commands.DeleteToEndOfLineCommand])
+                    if command_type is commands.InsertStringCommand:
+                        command = command_type(buffer, rnd.choice(["x", "yz"]))
+                    else:
+                        command = command_type(buffer)
+
+                    num_steps = history.numUndoableCommands()
+                    if self.execute(buffer, command):
+                        if history.numUndoableCommands() != num_steps:
+                            pos += 1
+                        del states[pos:]
+                        states.append(document.documentText())
+
+                if rnd.randint(0, 9) == 0:
+                    journal.save(md5(document))
+
+            text = document.documentText()
+            journal.save(md5(document))
+
+            # The reopened file has the known steps
+            num_undoable = 0
+            while num_undoable < pos and states[pos-num_undoable-1] is not None:
+                num_undoable += 1
+            num_redoable = 0
+            while pos+num_redoable+1 < len(states) and states[pos+num_redoable+1] is not None:
+                num_redoable += 1
+
+            reopened, _ = self.openBuffer(text)
+            self.assertEqual(reopened.command_history.numUndoableCommands(), num_undoable)
+            self.assertEqual(reopened.command_history.numRedoableCommands(), num_redoable)
+
+            for i in range(num_undoable):
+                reopened.command_history.undo()
+                self.assertEqual(reopened.document.documentText(), states[pos-i-1])
+
+if __name__ == '__main__':
+    unittest.main()
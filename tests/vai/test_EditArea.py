@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import Mock, patch
+from vaitk import test, gui, core
+from vai.EditArea import EditArea
+from vai import models
+from vai import controllers
+from tests import fixtures
+
+class EditAreaTest(unittest.TestCase):
+    def setUp(self):
+        self.screen = test.VTextScreen((100,40))
+        self.app = gui.VApplication([], screen=self.screen)
+        self.editor_controller = Mock(spec=controllers.EditorController)
+        self.editor_controller.lexer = Mock()
+        self.edit_area = EditArea(models.GlobalState(), self.editor_controller, parent=None)
+        self.edit_area.setGeometry((0,0,100,40))
+
+    def tearDown(self):
+        del self.screen
+        self.app.exit()
+        core.VCoreApplication.vApp=None
+        del self.app
+
+    def testWordHighlightCache(self):
+        buffer = fixtures.buffer("bug_113")
+        document = buffer.document
+        self.edit_area.buffer = buffer
+
+        word_entries = self.edit_area._wordHighlight(document, "all", (1, 41))
+        self.assertEqual(word_entries, {1: [(7, 10)], 2: [(1, 4)], 3: [(1, 4)]})
+        self.assertIs(self.edit_area._wordHighlight(document, "all", (1, 41)), word_entries)
+
+        document.insertChars((1, 1), "all ")
+        word_entries = self.edit_area._wordHighlight(document, "all", (1, 41))
+        self.assertEqual(word_entries, {1: [(1, 4), (11, 14)], 2: [(1, 4)], 3: [(1, 4)]})
+
+    def testPartialRepaint(self):
+        buffer = models.Buffer()
+        document = buffer.document
+        document.insertLines(1, ["line %d\n" % i for i in range(100)])
+        self.edit_area.buffer = buffer
+
+        with patch.object(gui, "VPainter"):
+            self.edit_area.paintEvent(None)
+            self.assertEqual(self.edit_area.painted_rows, 40)
+
+            self.edit_area.paintEvent(None)
+            self.assertEqual(self.edit_area.painted_rows, 0)
+
+            document.insertChars((5, 1), "x")
+            self.edit_area.paintEvent(None)
+            self.assertEqual(self.edit_area.painted_rows, 1)
+
+            # The rows after a new line move down
+            document.breakLine((31, 1))
+            self.edit_area.paintEvent(None)
+            self.assertEqual(self.edit_area.painted_rows, 10)
+
+            # Lines out of the view are not redrawn
+            document.insertChars((80, 1), "x")
+            self.edit_area.updateLines(70, 90)
+            self.edit_area.paintEvent(None)
+            self.assertEqual(self.edit_area.painted_rows, 0)
+
+            self.edit_area.setSearchHighlight("line 1")
+            self.edit_area.paintEvent(None)
+            self.assertEqual(self.edit_area.painted_rows, 11)
+
+            buffer.edit_area_model.document_pos_at_top = (2, 1)
+            self.edit_area.updateLines(2, 2)
+            self.edit_area.paintEvent(None)
+            self.assertEqual(self.edit_area.painted_rows, 40)
+
+    def testRenderCache(self):
+        buffer = models.Buffer()
+        document = buffer.document
+        document.insertLines(1, ["line %d\n" % i for i in range(100)])
+        self.edit_area.buffer = buffer
+        no_decorations = (False, (), ())
+
+        rendered = self.edit_area._renderLine(document, 10, 1, no_decorations)
+        self.assertEqual(rendered[0], "line 9 ")
+        self.assertIs(self.edit_area._renderLine(document, 10, 1, no_decorations), rendered)
+
+        selected = self.edit_area._renderLine(document, 10, 1, (True, (), ()))
+        self.assertIsNot(selected, rendered)
+        self.assertEqual(selected[1][0][2], gui.VGlobalColor.yellow)
+
+        # Changed lines are rendered again, the others are reused
+        rendered_50 = self.edit_area._renderLine(document, 50, 1, no_decorations)
+        document.insertChars((10, 1), "x")
+        self.assertEqual(self.edit_area._renderLine(document, 10, 1, no_decorations)[0], "xline 9 ")
+        self.assertIs(self.edit_area._renderLine(document, 50, 1, no_decorations), rendered_50)
+
+        # Lines after an insertion move down
+        document.insertLines(20, ["new\n"])
+        self.assertEqual(self.edit_area._renderLine(document, 50, 1, no_decorations)[0], "line 48 ")
+
+        rendered_5 = self.edit_area._renderLine(document, 5, 1, no_decorations)
+        self.edit_area._linesLexed(1, 5)
+        self.assertIsNot(self.edit_area._renderLine(document, 5, 1, no_decorations), rendered_5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import random
+import string
+import time
+from vai.FuzzyIndex import FuzzyIndex, wordInitials
+
+class TestFuzzyIndex(unittest.TestCase):
+    def testInitials(self):
+        self.assertEqual(wordInitials("_getLexerInstance"), "gli")
+        self.assertEqual(wordInitials("EXTENSION_TO_LEXER"), "etl")
+        self.assertEqual(wordInitials("HTTPServer2"), "hs2")
+        self.assertEqual(wordInitials("__"), "")
+
+    def testLookup(self):
+        index = FuzzyIndex()
+        for word in ["_getLexerInstance", "getLine", "gLIMIT", "global_line_info", "other"]:
+            index.add(word)
+
+        self.assertEqual(index.lookup("gLI"), ["global_line_info", "_getLexerInstance", "gLIMIT", "getLine"])
+        self.assertEqual(index.lookup("getl"), ["getLine", "_getLexerInstance"])
+        self.assertEqual(index.lookup("oth"), ["other"])
+        self.assertEqual(index.lookup("xyz"), [])
+        self.assertEqual(index.lookup("gLIMIT"), ["gLIMIT"])
+
+    def testMatchInLaterSegment(self):
+        index = FuzzyIndex()
+        for word in ["getLexerInstance", "getLexer", "lexer", "EXTENSION_TO_LEXER"]:
+            index.add(word)
+
+        self.assertEqual(index.lookup("Instance"), ["getLexerInstance"])
+        self.assertEqual(index.lookup("lex"), ["lexer", "getLexer", "getLexerInstance", "EXTENSION_TO_LEXER"])
+        self.assertEqual(index.lookup("LI"), ["getLexerInstance"])
+        self.assertEqual(index.lookup("tol"), ["EXTENSION_TO_LEXER"])
+
+        index.remove("getLexer")
+        self.assertEqual(index.lookup("lex"), ["lexer", "getLexerInstance", "EXTENSION_TO_LEXER"])
+        self.assertEqual(len(index), 3)
+
+    def testWeight(self):
+        index = FuzzyIndex()
+        index.add("getLexerInstance")
+        index.add("globalLineIndex")
+
+        weights = { "getLexerInstance": 1, "globalLineIndex": 10 }
+        self.assertEqual(index.lookup("gli", limit=1, weight=weights.get), ["globalLineIndex"])
+
+    def testRemove(self):
+        index = FuzzyIndex()
+        index.add("getLine")
+        index.add("getLexer")
+        self.assertEqual(index.lookup("gl"), ["getLine", "getLexer"])
+
+        index.remove("getLine")
+        self.assertEqual(index.lookup("gl"), ["getLexer"])
+        self.assertEqual(len(index), 1)
+
+    def testPerformance(self):
+        random.seed(0)
+        vocabulary = ["".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(2, 8)))
+                      for _ in range(2000)]
+        index = FuzzyIndex()
+        words = []
+        while len(index) < 100000:
+            segments = random.sample(vocabulary, random.randint(1, 4))
+            if random.random() < 0.5:
+                word = segments[0] + "".join(segment.capitalize() for segment in segments[1:])
+            else:
+                word = "_".join(segments)
+            index.add(word)
+            words.append(word)
+
+        queries = []
+        for word in random.sample(words, 20):
+            queries.append(wordInitials(word))
+            queries.append(word[:2]+word[-2:])
+
+        index.lookup("a")
+        start = time.perf_counter()
+        for query in queries:
+            index.lookup(query, limit=10)
+        elapsed = (time.perf_counter() - start) / len(queries)
+        self.assertLess(elapsed, 0.02)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,27 @@
 import unittest
+import time
 from vai.lexer import Lexer
+from vai.lexer.Lexer import _tokenizeLines, LOOKAHEAD
+from pygments import lexers
 from vai.models import TextDocument
+from vai.models.TextDocument import CharMeta
+from vai import models
+from vai.models import commands
 from pygments import token
 from tests import fixtures
+from vaitk import test
+
+def _lexedBuffer(filename, lines, lazy=False, background=False):
+    buffer = models.Buffer()
+    buffer.document.documentMetaInfo("Filename").setData(filename)
+    buffer.document.read(lines)
+    lexer = Lexer(lazy=lazy, background=background)
+    lexer.setModel(buffer.document, buffer.symbol_lookup_db)
+    return buffer, lexer
+
+def _allLexerTokens(document):
+    return [document.charMeta((line_number, 1)).get(CharMeta.LexerToken)
+            for line_number in range(1, document.numLines()+1)]
 
 class LexerTest(unittest.TestCase):
     def testBug58(self):
@@ -17,5 +36,205 @@ class LexerTest(unittest.TestCase):
         lexer.setModel(document)
         self.assertEqual(document.charMeta((1,1))["LexerToken"][0], token.Token.Text)
 
+    def testIncrementalLexing(self):
+        with open(fixtures.get("real_case_editareacontroller.py")) as f:
+            buffer, lexer = _lexedBuffer("foo.py", f.readlines())
+        document = buffer.document
+
+        document.insertChars((20, 5), "x = '")
+        document.breakLine((30, 9))
+        document.joinWithNextLine(40)
+        document.deleteLines(50, 3)
+        document.insertLines(60, ['"hello"', 'def foo():'])
+        document.insertChars((20, 10), "'")
+        document.deleteChars((1, 1), 6)
+
+        reference, _ = _lexedBuffer("foo.py", document.documentText().splitlines(True))
+        self.assertEqual(_allLexerTokens(document), _allLexerTokens(reference.document))
+
+    def testTransaction(self):
+        with open(fixtures.get("real_case_editareacontroller.py")) as f:
+            buffer, lexer = _lexedBuffer("foo.py", f.readlines())
+        document = buffer.document
+
+        with document.transaction():
+            document.insertChars((20, 5), "x = '")
+            document.deleteLines(50, 3)
+            document.insertLines(10, ['"hello"', 'def foo():'])
+            document.insertChars((30, 10), "'")
+
+        reference, _ = _lexedBuffer("foo.py", document.documentText().splitlines(True))
+        self.assertEqual(_allLexerTokens(document), _allLexerTokens(reference.document))
+
+    def testUndoRelexes(self):
+        with open(fixtures.get("real_case_editareacontroller.py")) as f:
+            buffer, lexer = _lexedBuffer("foo.py", f.readlines())
+        document = buffer.document
+        original_tokens = _allLexerTokens(document)
+
+        buffer.cursor.toPos((20, 5))
+        command = commands.InsertStringCommand(buffer, "x = '")
+        command.execute()
+        command.undo()
+
+        self.assertEqual(_allLexerTokens(document), original_tokens)
+
+    def testIncrementalLexingMultiLineMatch(self):
+        buffer, lexer = _lexedBuffer("foo.c", ["int x;\n"] * 10)
+        document = buffer.document
+
+        document.insertChars((3, 1), "/* ")
+        self.assertEqual(document.charMeta((9,1))[CharMeta.LexerToken][0], token.Comment.Multiline)
+
+        document.insertChars((5, 7), " */")
+        self.assertEqual(document.charMeta((4,1))[CharMeta.LexerToken][0], token.Comment.Multiline)
+        self.assertEqual(document.charMeta((9,1))[CharMeta.LexerToken][0], token.Keyword.Type)
+
+    def testLinesLexedRange(self):
+        buffer, lexer = _lexedBuffer("foo.py", ["x = 1\n"] * 10)
+        spy = test.VSignalSpy(lexer.linesLexed)
+
+        buffer.document.insertChars((3, 1), "x")
+        self.assertEqual(spy.lastSignalParams(), ((3, 3), {}))
+
+        # The string changes the tokens of all the following lines
+        buffer.document.insertChars((5, 1), "'''")
+        self.assertEqual(spy.lastSignalParams(), ((5, 10), {}))
+
+    def testKeystrokeCostIndependentOfFileSize(self):
+        with open(fixtures.get("real_case_editareacontroller.py")) as f:
+            lines = f.readlines()
+
+        def keystrokeCost(num_copies, lazy):
+            buffer, lexer = _lexedBuffer("foo.py", lines * num_copies, lazy=lazy)
+            document = buffer.document
+            lexer.setVisibleLines(1, 60)
+            line_number = 30 if lazy else document.numLines() // 2
+            best = None
+            for attempt in range(3):
+                start = time.perf_counter()
+                for i in range(10):
+                    document.insertChars((line_number, 1), "x")
+                elapsed = (time.perf_counter() - start) / 10
+                best = elapsed if best is None else min(best, elapsed)
+            return best
+
+        for lazy, num_copies in ((True, 200), (False, 100)):
+            small = keystrokeCost(1, lazy)
+            large = keystrokeCost(num_copies, lazy)
+            self.assertLess(large, small * 3)
+
+    def testTokenizeInChunks(self):
+        with open(fixtures.get("real_case_editareacontroller.py")) as f:
+            lines = f.readlines()
+        lines[10:10] = ['x = """\n'] + ["a long string line\n"] * 1000 + ['"""\n']
+        lexer = lexers.PythonLexer(stripnl=False, stripall=False)
+
+        whole = list(_tokenizeLines(lexer, ["".join(lines)], ('root',)))
+        self.assertEqual(list(_tokenizeLines(lexer, lines, ('root',))), whole)
+
+        # Without the end of the document, the last lines are not tokenized
+        partial = list(_tokenizeLines(lexer, lines[:500], ('root',), complete=False))
+        self.assertLess(len(partial), 500)
+        self.assertEqual(partial, whole[:len(partial)])
+
+    def testTokenLongerThanLookahead(self):
+        lines = ["class Foo {\n", "/*\n"] + ["  a / comment * line + x\n"] * 1000 + ["*/\n", "}\n"]
+        self.assertGreater(sum(map(len, lines)), LOOKAHEAD)
+        lexer = lexers.JavaLexer(stripnl=False, stripall=False)
+
+        whole = list(_tokenizeLines(lexer, ["".join(lines)], ('root',)))
+        self.assertEqual(list(_tokenizeLines(lexer, lines, ('root',))), whole)
+        self.assertEqual(set(ttype for line_tokens, _ in whole[1:-2] for ttype, _ in line_tokens),
+                         {token.Comment.Multiline})
+
+    def testLazyLexing(self):
+        with open(fixtures.get("real_case_editareacontroller.py")) as f:
+            lines = f.readlines() * 30
+
+        start = time.perf_counter()
+        buffer, lexer = _lexedBuffer("foo.py", lines, lazy=True)
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+        document = buffer.document
+        self.assertIn(CharMeta.LexerToken, document.charMeta((50, 1)))
+        self.assertNotIn(CharMeta.LexerToken, document.charMeta((3000, 1)))
+
+        # Far away lines are lexed immediately, but approximately
+        lexer.setVisibleLines(5500, 5540)
+        self.assertIn(CharMeta.LexerToken, document.charMeta((5540, 1)))
+        self.assertNotIn(CharMeta.LexerToken, document.charMeta((3000, 1)))
+
+        lexer.setVisibleLines(1000, 1040)
+        self.assertIn(CharMeta.LexerToken, document.charMeta((1040, 1)))
+        self.assertNotIn(CharMeta.LexerToken, document.charMeta((3000, 1)))
+
+        document.insertChars((1010, 1), "'")
+
+        while lexer._dirty_range is not None:
+            lexer._idleLex()
+
+        reference, _ = _lexedBuffer("foo.py", document.documentText().splitlines(True))
+        self.assertEqual(_allLexerTokens(document), _allLexerTokens(reference.document))
+
+    def testBackgroundLexing(self):
+        with open(fixtures.get("real_case_editareacontroller.py")) as f:
+            lines = f.readlines() * 10
+
+        buffer, lexer = _lexedBuffer("foo.py", lines, lazy=True, background=True)
+        document = buffer.document
+        completed = []
+        lexer.lexingCompleted.connect(completed.append)
+
+        lexer._waitForJobs()
+        self.assertEqual(completed, [document.version()])
+
+        # Results for an outdated version are discarded, and lexing restarts
+        document.insertChars((20, 1), "'")
+        job = lexer._job
+        job.future.result()
+        document.insertChars((30, 1), "'")
+        lexer._applyJob()
+        self.assertIsNot(lexer._job, job)
+
+        lexer._waitForJobs()
+        self.assertEqual(completed[-1], document.version())
+
+        reference, _ = _lexedBuffer("foo.py", document.documentText().splitlines(True))
+        self.assertEqual(_allLexerTokens(document), _allLexerTokens(reference.document))
+
+    def testBackgroundJobWindow(self):
+        lines = ["x = 1\n"] * 100 + ['s = """\n'] + ["text\n"] * 3000 + ['"""\n'] + ["y = 2\n"] * 3000
+
+        buffer, lexer = _lexedBuffer("foo.py", lines, background=True)
+        document = buffer.document
+        self.assertLess(len(lexer._job.texts), document.numLines())
+
+        lexer._waitForJobs()
+        self.assertIsNone(lexer._dirty_range)
+
+        reference, _ = _lexedBuffer("foo.py", lines)
+        self.assertEqual(_allLexerTokens(document), _allLexerTokens(reference.document))
+
+        lexer.close()
+        self.assertIsNone(lexer._executor)
+
+    def testSymbolsUpdatedPerLine(self):
+        buffer, lexer = _lexedBuffer("foo.py", ["foobar = 1\n", "foobaz = foobar\n"])
+        symdb = buffer.symbol_lookup_db
+        self.assertEqual(set(symdb.lookup("foo")), {"bar", "baz"})
+
+        buffer.document.deleteLine(2)
+        self.assertEqual(set(symdb.lookup("foo")), {"bar"})
+
+        buffer.document.replaceChars((1, 1), 6, "fooqux")
+        self.assertEqual(set(symdb.lookup("foo")), {"qux"})
+
+        buffer.document.insertLine(2, "foobar = fooqux\n")
+        self.assertEqual(set(symdb.lookup("foo")), {"bar", "qux"})
+
+        buffer.document.deleteLine(1)
+        self.assertEqual(set(symdb.lookup("foo")), {"bar", "qux"})
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from unittest import mock
+from vai.lexer import ProjectSymbolIndex
+
+class ProjectSymbolIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.project_dir, ".cache.json")
+        os.makedirs(os.path.join(self.project_dir, "pkg"))
+        os.makedirs(os.path.join(self.project_dir, ".git"))
+        self._write("pkg/a.py", "def alphaFunction():\n    alphaValue = 1\n")
+        self._write("b.py", "class BetaClass:\n    pass\n")
+        self._write(".git/c.py", "hiddenName = 1\n")
+        self._write("notes.unknownext", "unknownName = 1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.project_dir)
+
+    def _write(self, path, text):
+        with open(os.path.join(self.project_dir, path), "w") as f:
+            f.write(text)
+
+    def _scannedIndex(self):
+        index = ProjectSymbolIndex(self.project_dir, self.cache_file)
+        index.scan()
+        index._waitForScan()
+        return index
+
+    def testScan(self):
+        index = self._scannedIndex()
+        symdb = index.symbol_lookup_db
+
+        self.assertEqual(set(symdb.lookup("alpha")), {"Function", "Value"})
+        self.assertEqual(symdb.lookup("Beta"), ["Class"])
+        self.assertEqual(symdb.lookup("hidden"), [])
+        self.assertEqual(symdb.lookup("unknown"), [])
+        self.assertTrue(index.contains(os.path.join(self.project_dir, "pkg", "a.py")))
+        self.assertFalse(index.contains(self.project_dir + "2"))
+
+    def testIncrementalRescan(self):
+        self._scannedIndex()
+
+        # Unchanged files are taken from the cache without tokenizing them
+        with open(self.cache_file) as f:
+            data = json.load(f)
+        data["files"][os.path.join(self.project_dir, "pkg", "a.py")][2] = ["cachedName"]
+        with open(self.cache_file, "w") as f:
+            json.dump(data, f)
+
+        self._write("b.py", "class GammaClass:\n    pass\n")
+        os.utime(os.path.join(self.project_dir, "b.py"), (0, 0))
+
+        index = self._scannedIndex()
+        symdb = index.symbol_lookup_db
+        self.assertEqual(symdb.lookup("cached"), ["Name"])
+        self.assertEqual(symdb.lookup("alpha"), [])
+        self.assertEqual(symdb.lookup("Gamma"), ["Class"])
+        self.assertEqual(symdb.lookup("Beta"), [])
+
+        # Removed files disappear from the database of a live index
+        os.remove(os.path.join(self.project_dir, "b.py"))
+        index.scan()
+        index._waitForScan()
+        self.assertEqual(symdb.lookup("Gamma"), [])
+        self.assertEqual(symdb.lookup("cached"), ["Name"])
+
+    def testFailedScan(self):
+        index = self._scannedIndex()
+        completed = []
+        index.scanCompleted.connect(lambda: completed.append(True))
+
+        module = sys.modules[ProjectSymbolIndex.__module__]
+        with mock.patch.object(module, "_scanProject", side_effect=OSError("boom")):
+            with self.assertLogs("vai.lexer.ProjectSymbolIndex", "ERROR"):
+                index.scan()
+                index._waitForScan()
+
+        self.assertEqual(completed, [])
+        self.assertEqual(index.symbol_lookup_db.lookup("Beta"), ["Class"])
+
+    def testClose(self):
+        index = ProjectSymbolIndex(self.project_dir, self.cache_file)
+        index.scan()
+        future = index._future
+        index.close()
+
+        self.assertIsNone(index._executor)
+        self.assertIsNone(index._future)
+        future.result()
+        index._applyScan()
+
+        # A cancelled scan leaves the cache alone
+        module = sys.modules[ProjectSymbolIndex.__module__]
+        cancelled = threading.Event()
+        cancelled.set()
+        cache_file = os.path.join(self.project_dir, ".other_cache.json")
+        self.assertIsNone(module._scanProject(self.project_dir, cache_file, cancelled))
+        self.assertFalse(os.path.exists(cache_file))
+
+if __name__ == '__main__':
+    unittest.main()
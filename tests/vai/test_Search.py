@@ -1,4 +1,8 @@
 import unittest
+import io
+import re
+from vai import models
+from vai.models.storage import RopeStorage
 from .. import fixtures
 from vai import Search
 
@@ -49,5 +53,70 @@ class TestSearch(unittest.TestCase):
         all_finds = Search.find(buffer, 'all', Search.SearchDirection.FORWARD)
         self.assertEqual(buffer.cursor.pos, (1,7))
 
+    def testFindWrapsBackward(self):
+        buffer = fixtures.buffer("bug_113")
+        Search.find(buffer, 'all', Search.SearchDirection.BACKWARD)
+        self.assertEqual(buffer.cursor.pos, (4,6))
+        Search.find(buffer, 'all', Search.SearchDirection.BACKWARD)
+        self.assertEqual(buffer.cursor.pos, (3,1))
+        self.assertFalse(Search.find(buffer, 'notthere', Search.SearchDirection.BACKWARD))
+        self.assertEqual(buffer.cursor.pos, (3,1))
+
+    def testSearchIndexCache(self):
+        buffer = fixtures.buffer("bug_113")
+        doc = buffer.document
+        index = Search.searchIndex(doc)
+        regexp = Search.compilePattern('all')
+        self.assertIs(index.matches(regexp), index.matches(regexp))
+        self.assertIs(Search.searchIndex(doc), index)
+        self.assertEqual(index.position(index.offset((2, 3))), (2, 3))
+
+        doc.insertChars((1, 1), "all ")
+        self.assertIsNot(Search.searchIndex(doc), index)
+        self.assertEqual(Search.findAll(doc, 'all')[:2], [(1, 1, 4), (1, 11, 14)])
+
+    def testSearchIndexKeepsRawBlocks(self):
+        storage = RopeStorage(block_size=4, chunk_size=64)
+        doc = models.TextDocument(storage)
+        doc.read(io.StringIO("".join("line %d\n" % i for i in range(100))))
+
+        self.assertEqual(Search.findAll(doc, 'line 42'), [(43, 1, 8)])
+        self.assertTrue(all(block.raw is not None for block in storage._blocks))
+
+    def testFindAllInterval(self):
+        buffer = fixtures.buffer("real_case_editareacontroller.py")
+        doc = buffer.document
+        all_finds = Search.findAll(doc, 'Key')
+        in_interval = [x for x in all_finds if 10 <= x[0] < 50]
+
+        # Computed on the lines, then from the cached matches
+        self.assertEqual(Search.findAll(doc, 'Key', line_interval=(10, 50)), in_interval)
+        doc.insertChars((100, 1), " ")
+        self.assertEqual(Search.findAll(doc, 'Key', line_interval=(10, 50)), in_interval)
+
+    def testRegexSearch(self):
+        buffer = fixtures.buffer("bug_113")
+        doc = buffer.document
+        self.assertEqual(Search.findAll(doc, 'a.l', regex=True), [(1, 7, 10), (2, 1, 4), (3, 1, 4), (4, 6, 9)])
+        self.assertEqual(Search.findAll(doc, '^all', regex=True), [(2, 1, 4), (3, 1, 4)])
+        self.assertRaises(re.error, Search.findAll, doc, 'a(l', regex=True)
+        self.assertRaises(re.error, Search.find, buffer, 'a(l', Search.SearchDirection.FORWARD, regex=True)
+
+    def testMultiLineSearch(self):
+        buffer = models.Buffer()
+        doc = buffer.document
+        doc.read(["foo bar\n", "baz quux\n", "bar\n", "baz\n"])
+
+        # A match across lines gives an entry for each line
+        self.assertEqual(Search.findAll(doc, 'bar\\nbaz', regex=True),
+                         [(1, 5, 9), (2, 1, 4), (3, 1, 5), (4, 1, 4)])
+        self.assertEqual(Search.findAll(doc, 'bar\\nbaz', line_interval=(2, 4), regex=True),
+                         [(2, 1, 4), (3, 1, 5)])
+
+        Search.find(buffer, 'bar\\nbaz', Search.SearchDirection.FORWARD, regex=True)
+        self.assertEqual(buffer.cursor.pos, (1, 5))
+        Search.find(buffer, 'bar\\nbaz', Search.SearchDirection.FORWARD, regex=True)
+        self.assertEqual(buffer.cursor.pos, (3, 1))
+
 if __name__ == '__main__':
     unittest.main()
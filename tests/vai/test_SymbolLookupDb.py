@@ -1,5 +1,10 @@
 import unittest
-from vai.SymbolLookupDb import SymbolLookupDb
+import os
+import random
+import string
+import time
+from vai.SymbolLookupDb import SymbolLookupDb, SymbolLookupDbUnion
+from vai.FuzzyIndex import INITIALS_MATCH
 
 class TestSymbolLookupDb(unittest.TestCase):
     def testLookup(self):
@@ -26,5 +31,138 @@ class TestSymbolLookupDb(unittest.TestCase):
 
         self.assertEqual(set(symdb.lookup("handle")), set([ "KeyEvent"]) )
 
+    def testRemove(self):
+        symdb = SymbolLookupDb()
+
+        symdb.add("foobar")
+        symdb.add("foobar")
+        symdb.add("foobaz")
+
+        symdb.remove("foobar")
+        self.assertEqual(set(symdb.lookup("foo")), set([ "bar", "baz"]))
+
+        symdb.remove("foobar")
+        self.assertEqual(set(symdb.lookup("foo")), set([ "baz"]))
+
+        symdb.remove("foobaz")
+        symdb.remove("notthere")
+        self.assertEqual(symdb.lookup("f"), [])
+        self.assertEqual(len(symdb), 0)
+
+    def testRanking(self):
+        symdb = SymbolLookupDb()
+
+        for word in ["foobar", "foobaz", "foobaz", "fooquux", "fooquux", "fooquux", "bar"]:
+            symdb.add(word)
+
+        self.assertEqual(symdb.lookup("foo"), [ "quux", "baz", "bar"])
+        self.assertEqual(symdb.lookup("foo", limit=2), [ "quux", "baz"])
+        self.assertEqual(symdb.lookup("", limit=1), [ "fooquux"])
+
+    def testCommonPrefix(self):
+        symdb = SymbolLookupDb()
+
+        symdb.add("foo")
+        symdb.add("foobar")
+        symdb.add("foobaz")
+        symdb.add("other")
+
+        self.assertEqual(symdb.commonPrefix("fo"), "o")
+        self.assertEqual(symdb.commonPrefix("foo"), "ba")
+        self.assertEqual(symdb.commonPrefix("foobar"), None)
+        self.assertEqual(symdb.commonPrefix("x"), None)
+        self.assertEqual(symdb.commonPrefix(""), "")
+
+    def testFuzzyLookup(self):
+        symdb = SymbolLookupDb()
+
+        symdb.add("_getLexerInstance")
+        symdb.add("getLine")
+        symdb.add("getLine")
+        self.assertEqual(symdb.fuzzyLookup("gLI"), ["_getLexerInstance", "getLine"])
+        self.assertEqual(symdb.fuzzyLookup("gl"), ["getLine", "_getLexerInstance"])
+
+        symdb.remove("_getLexerInstance")
+        self.assertEqual(symdb.fuzzyLookup("gLI"), ["getLine"])
+
+    def testWordsWithPrefix(self):
+        symdb = SymbolLookupDb()
+        for word in ["getLine", "getLexer", "other", "getLine"]:
+            symdb.add(word)
+
+        self.assertEqual(symdb.wordsWithPrefix("get"), ["getLexer", "getLine"])
+        self.assertEqual(symdb.wordsWithPrefix("x"), [])
+        self.assertEqual(sorted(symdb.fuzzyMatches("gl")), [(INITIALS_MATCH, "getLexer"), (INITIALS_MATCH, "getLine")])
+
+    def testCompletionBenchmark(self):
+        random.seed(0)
+        words = set()
+        while len(words) < 50000:
+            words.add("".join(random.choice(string.ascii_letters) for _ in range(random.randint(3, 20))))
+
+        symdb = SymbolLookupDb()
+        trie = _RecursiveTrie()
+        for word in words:
+            symdb.add(word)
+            trie.add(word)
+
+        symdb.lookup("")
+        start = time.perf_counter()
+        for prefix in string.ascii_letters:
+            symdb.commonPrefix(prefix)
+            symdb.lookup(prefix, limit=10)
+        elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for prefix in string.ascii_letters:
+            os.path.commonprefix([x for x in trie.lookup(prefix) if x != ''])
+        elapsed_trie = time.perf_counter() - start
+
+        self.assertLess(elapsed, elapsed_trie)
+
+    def testUnion(self):
+        symdb1 = SymbolLookupDb()
+        symdb2 = SymbolLookupDb()
+        symdb1.add("foobar")
+        symdb2.add("foobar")
+        symdb2.add("foobaz")
+
+        union = SymbolLookupDbUnion([symdb1, symdb2])
+        self.assertEqual(union.lookup("foo"), [ "bar", "baz"])
+        self.assertEqual(union.commonPrefix("foo"), "ba")
+        self.assertEqual(union.commonPrefix("x"), None)
+        self.assertEqual(union.fuzzyLookup("fba"), [ "foobar", "foobaz"])
+
+class _RecursiveTrie:
+    """
+    The previous implementation, a trie of dictionaries
+    walked recursively. Used as a reference for the benchmark.
+    """
+    def __init__(self):
+        self._db = {}
+
+    def add(self, word):
+        d = self._db
+        for char in word:
+            d = d.setdefault(char, {})
+        d[''] = None
+
+    def lookup(self, prefix):
+        d = self._db
+        for char in prefix:
+            if char not in d:
+                return []
+            d = d[char]
+        return self._composePostfix(d)
+
+    def _composePostfix(self, d):
+        if d is None:
+            return ['']
+        ret = []
+        for k, v in d.items():
+            for postfix in self._composePostfix(v):
+                ret.append(k+postfix)
+        return ret
+
 if __name__ == '__main__':
     unittest.main()
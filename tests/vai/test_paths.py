@@ -1,6 +1,9 @@
 import unittest
 from vai import paths
 import os
+import shutil
+import tempfile
+from unittest import mock
 
 class PathsTest(unittest.TestCase):
     def testSystemPluginsDir(self):
@@ -16,5 +19,16 @@ class PathsTest(unittest.TestCase):
                                         )
                         )
 
+    def testSymbolIndexFile(self):
+        cache_home = tempfile.mkdtemp()
+        try:
+            with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": cache_home}):
+                index_file = paths.symbolIndexFile("/some/project")
+                self.assertEqual(os.path.dirname(index_file), os.path.join(cache_home, "vai", "symbols"))
+                self.assertEqual(paths.symbolIndexFile("/some/project/"), index_file)
+                self.assertNotEqual(paths.symbolIndexFile("/other/project"), index_file)
+        finally:
+            shutil.rmtree(cache_home)
+
 if __name__ == '__main__':
     unittest.main()
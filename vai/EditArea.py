@@ -1,3 +1,5 @@
+import re
+import collections
 import vaitk
 from vaitk import core, gui, utils
 from . import controllers
@@ -5,25 +7,45 @@ from .models.TextDocument import CharMeta
 from . import models
 from . import Search
 
+# Number of word highlights kept, for cursor motions back and forth between words
+WORD_HIGHLIGHT_CACHE_SIZE = 16
+
+# Number of rendered lines kept, so that scrolling back does not render them again
+RENDER_CACHE_SIZE = 1000
 
 class EditArea(gui.VWidget):
     def __init__(self, global_state, editor_controller, parent):
         super().__init__(parent)
         self._buffer = None
+        self._editor_controller = editor_controller
 
         self._controller = controllers.EditAreaController(self, global_state, editor_controller)
+        self._editor_controller.lexer.linesLexed.connect(self._linesLexed)
         self._color_schema = models.SyntaxColors(
                                     models.Configuration.get("colors.syntax_schema"),
                                     gui.VApplication.vApp.screen().numColors()
                              ).colorMap()
 
         self._visual_cursor_pos = (0,0)
+        self._search_highlight = None
+        self._word_highlight_cache = collections.OrderedDict()
         self._highlight_current_identifier = False
         self._current_identifier_highlight_timer = core.VTimer()
         self._current_identifier_highlight_timer.setSingleShot(True)
         self._current_identifier_highlight_timer.setInterval(500)
         self._current_identifier_highlight_timer.timeout.connect(self.identifierHighlightTimeout)
 
+        # Document lines to redraw at the next paint, or None to redraw all
+        self._dirty_lines = None
+
+        # What the last paint showed, to find the rows that changed since
+        self._painted_view = None
+        self._painted_decorations = {}
+        self._painted_rows = 0
+
+        # document line -> ((h_offset, decorations), (text, colors))
+        self._render_cache = collections.OrderedDict()
+
         self.setFocusPolicy(vaitk.FocusPolicy.StrongFocus)
 
         self._icons = models.Icons.getCollection(
@@ -40,10 +62,27 @@ class EditArea(gui.VWidget):
         if buffer is None:
             raise Exception("Cannot set buffer to None")
 
+        if self._buffer is not None:
+            self._buffer.document.changed.disconnect(self._documentChanged)
+
         self._buffer = buffer
+        self._buffer.document.changed.connect(self._documentChanged)
+        self._render_cache.clear()
         self._controller.buffer = buffer
         self.update()
 
+    @property
+    def search_highlight(self):
+        return self._search_highlight
+
+    def setSearchHighlight(self, search_text):
+        """
+        Highlights the matches of search_text, or nothing if None.
+        """
+        if search_text != self._search_highlight:
+            self._search_highlight = search_text
+            super().update()
+
     @property
     def visual_cursor_pos(self):
         return self._visual_cursor_pos
@@ -59,17 +98,44 @@ class EditArea(gui.VWidget):
         self._current_identifier_highlight_timer.start()
         gui.VCursor.setPos(self.mapToGlobal((pos_x, pos_y)))
 
+    @property
+    def painted_rows(self):
+        """
+        Number of rows redrawn by the last paint
+        """
+        return self._painted_rows
+
     def identifierHighlightTimeout(self):
         self._current_identifier_highlight_timer.stop()
         self._highlight_current_identifier = True
-        self.update()
+        super().update()
+
+    def update(self):
+        """
+        Schedules a repaint of all the rows
+        """
+        self._dirty_lines = None
+        super().update()
+
+    def updateLines(self, first_line, last_line):
+        """
+        Schedules a repaint of the document lines from first_line to
+        last_line included. Other rows are redrawn at the same time
+        only if their selection or highlights changed.
+        """
+        if self._dirty_lines is not None and self._buffer is not None:
+            top_line = self._buffer.edit_area_model.document_pos_at_top[0]
+            first_line = max(first_line, top_line)
+            last_line = min(last_line, top_line+self.height()-1)
+            self._dirty_lines.update(range(first_line, last_line+1))
+        super().update()
 
     def paintEvent(self, event):
         painter = gui.VPainter(self)
-        painter.erase()
 
         buffer = self._buffer
         if buffer is None:
+            painter.erase()
             return
 
         w, h = self.size()
@@ -78,56 +144,176 @@ class EditArea(gui.VWidget):
         cursor_pos = buffer.cursor.pos
         document = buffer.document
 
+        # Make sure the visible lines are lexed before painting them
+        self._editor_controller.lexer.setVisibleLines(*visible_line_interval)
+
         # Find the current hovered word to set highlighting
-        current_word, current_word_pos = document.wordAt(cursor_pos)
-        word_entries = []
-        if current_word_pos is not None:
-            # find all the words only in the visible area
-            word_entries = Search.findAll(document,
-                                          current_word,
-                                          line_interval=visible_line_interval,
-                                          word=True)
+        word_entries = {}
+        if self._highlight_current_identifier:
+            current_word, current_word_pos = document.wordAt(cursor_pos)
+            if current_word_pos is not None:
+                word_entries = self._wordHighlight(document, current_word, visible_line_interval)
+
+        search_entries = {}
+        if self._search_highlight is not None:
+            # Uses the matches of the whole document, if already found
+            try:
+                search_entries = _groupByLine(Search.findAll(document,
+                                                             self._search_highlight,
+                                                             line_interval=visible_line_interval,
+                                                             regex=models.Configuration.get("search.regex")))
+            except re.error:
+                pass
 
+        # A scroll or a resize moves all the rows. Otherwise, only the dirty
+        # lines and the rows whose decorations changed are redrawn.
+        view = (buffer, pos_at_top, (w, h))
+        full_repaint = self._dirty_lines is None or view != self._painted_view
+        if full_repaint:
+            painter.erase()
 
+        selection = buffer.selection
+        painted_decorations = {}
+        painted_rows = 0
         for visual_line_num, doc_line_num in enumerate(range(*visible_line_interval)):
+            selected = selection.isValid() and \
+                        (selection.low_line <= doc_line_num <= selection.high_line)
+            decorations = (selected,
+                           tuple(word_entries.get(doc_line_num, ())),
+                           tuple(search_entries.get(doc_line_num, ())))
+            painted_decorations[doc_line_num] = decorations
+
+            if not full_repaint:
+                if doc_line_num not in self._dirty_lines and \
+                        self._painted_decorations.get(doc_line_num) == decorations:
+                    continue
+                painter.eraseRect((0, visual_line_num, w, 1))
+
+            painted_rows += 1
             if doc_line_num > document.numLines():
                 continue
 
-            # Get the relevant text
-            line_text = document.lineText(doc_line_num)[pos_at_top[1]-1:]
-            line_text.replace('\n', ' ')
+            text, colors = self._renderLine(document, doc_line_num, pos_at_top[1], decorations)
+            painter.drawText((0, visual_line_num), text)
+            painter.recolor((0, visual_line_num), colors)
 
-            # Apply colors. First through the Lexer designation
-            colors = [(None, None, None)]*len(line_text)
+        self._dirty_lines = set()
+        self._painted_view = view
+        self._painted_decorations = painted_decorations
+        self._painted_rows = painted_rows
 
-            # Add markers for the indentation
-            indent_spaces = len(line_text)-len(line_text.lstrip())
-            for i in range(5, indent_spaces, 4):
-                line_text = line_text[:i-1]+self._icons["tabulator"]+line_text[i:]
+        #self.visual_cursor_pos = (cursor_pos[1]-pos_at_top[1], cursor_pos[0]-pos_at_top[0])
 
-            char_meta = document.charMeta( (doc_line_num,1))
-            if CharMeta.LexerToken in char_meta:
-                colors = [self._color_schema[tok] for tok in char_meta.get(CharMeta.LexerToken)]
+    def _renderLine(self, document, doc_line_num, h_offset, decorations):
+        """
+        Returns the text to display for a document line, starting from column
+        h_offset, and its colors. decorations is the (selected, word entries,
+        search entries) of the line. The result is cached until the text or
+        the lexer tokens of the line change.
+        """
+        key = (h_offset, decorations)
+        entry = self._render_cache.get(doc_line_num)
+        if entry is not None and entry[0] == key:
+            self._render_cache.move_to_end(doc_line_num)
+            return entry[1]
 
-            for i in range(5, indent_spaces, 4):
-                colors[i-1] = (gui.VGlobalColor.term_303030, None, None)
+        selected, word_entries, search_entries = decorations
 
-            selection = buffer.selection
-            if selection.isValid() and \
-                (selection.low_line <= doc_line_num <= selection.high_line):
-                colors = [ (c[0], c[1], gui.VGlobalColor.yellow) for c in colors]
+        # Get the relevant text
+        line_text = document.lineText(doc_line_num)[h_offset-1:]
 
-            # Then, if there's a word, replace (None, None) entries with the highlight color
-            word_entries_for_line = [x[1] for x in word_entries if x[0] == doc_line_num]
-            for word_start in word_entries_for_line:
-                for pos in range(word_start-1, word_start-1+len(current_word)):
-                    if colors[pos] == (None, None, None) and self._highlight_current_identifier:
-                        colors[pos] = (gui.VGlobalColor.lightred, None, None)
+        # Apply colors. First through the Lexer designation
+        colors = [(None, None, None)]*len(line_text)
 
-            painter.drawText( (0, visual_line_num), line_text.replace('\n', ' '))
-            painter.recolor((0, visual_line_num), colors[pos_at_top[1]-1:])
+        # Add markers for the indentation
+        indent_spaces = len(line_text)-len(line_text.lstrip())
+        for i in range(5, indent_spaces, 4):
+            line_text = line_text[:i-1]+self._icons["tabulator"]+line_text[i:]
 
-        #self.visual_cursor_pos = (cursor_pos[1]-pos_at_top[1], cursor_pos[0]-pos_at_top[0])
+        char_meta = document.charMeta( (doc_line_num,1))
+        if CharMeta.LexerToken in char_meta:
+            colors = [self._color_schema[tok] for tok in char_meta.get(CharMeta.LexerToken)]
+
+        for i in range(5, indent_spaces, 4):
+            colors[i-1] = (gui.VGlobalColor.term_303030, None, None)
+
+        if selected:
+            colors = [ (c[0], c[1], gui.VGlobalColor.yellow) for c in colors]
+
+        # Then, if there's a word, replace (None, None) entries with the highlight color
+        for word_start, word_end in word_entries:
+            for pos in range(word_start-1, word_end-1):
+                if colors[pos] == (None, None, None):
+                    colors[pos] = (gui.VGlobalColor.lightred, None, None)
+
+        for start, end in search_entries:
+            for pos in range(start-1, min(end-1, len(colors))):
+                colors[pos] = (gui.VGlobalColor.black, None, gui.VGlobalColor.cyan)
+
+        rendered = (line_text.replace('\n', ' '), colors[h_offset-1:])
+        self._render_cache[doc_line_num] = (key, rendered)
+        self._render_cache.move_to_end(doc_line_num)
+        if len(self._render_cache) > RENDER_CACHE_SIZE:
+            self._render_cache.popitem(last=False)
+
+        return rendered
+
+    def _invalidateRender(self, first_line, last_line=None):
+        """
+        Drops the cached rendering of the lines from first_line
+        to last_line included, or to the end if last_line is None.
+        """
+        cache = self._render_cache
+        if last_line is not None and last_line-first_line < len(cache):
+            stale = range(first_line, last_line+1)
+        else:
+            stale = [line for line in cache
+                     if line >= first_line and (last_line is None or line <= last_line)]
+
+        for line in stale:
+            cache.pop(line, None)
+
+    def _wordHighlight(self, document, word, line_interval):
+        """
+        Returns the occurrences of word in the lines of line_interval, as a
+        dictionary from line number to the list of (start, end) columns.
+        The result is reused until the document changes.
+        """
+        key = (document, word, line_interval)
+        version = document.version()
+        entry = self._word_highlight_cache.get(key)
+        if entry is not None and entry[0] == version:
+            self._word_highlight_cache.move_to_end(key)
+            return entry[1]
+
+        word_entries = _groupByLine(Search.findAll(document, word, line_interval=line_interval, word=True))
+        self._word_highlight_cache[key] = (version, word_entries)
+        self._word_highlight_cache.move_to_end(key)
+        if len(self._word_highlight_cache) > WORD_HIGHLIGHT_CACHE_SIZE:
+            self._word_highlight_cache.popitem(last=False)
+
+        return word_entries
+
+    def _documentChanged(self, change):
+        if change.num_lines_delta == 0:
+            self._invalidateRender(change.line_number, change.last_line_added)
+            self.updateLines(change.line_number, change.last_line_added)
+        else:
+            # The following lines move up or down
+            self._invalidateRender(change.line_number)
+            self.updateLines(change.line_number, self._buffer.document.numLines()-change.num_lines_delta)
+
+    def _linesLexed(self, first_line, last_line):
+        self._invalidateRender(first_line, last_line)
+
+        # Lines lexed out of sight are drawn when scrolled into view.
+        # The visible ones are redrawn now, not when the whole document
+        # is lexed, which can take long for a large file.
+        if self._buffer is None:
+            return
+        top_line = self._buffer.edit_area_model.document_pos_at_top[0]
+        if first_line <= top_line+self.height()-1 and last_line >= top_line:
+            self.updateLines(first_line, last_line)
 
     def keyEvent(self, event):
         self._controller.handleKeyEvent(event)
@@ -135,3 +321,12 @@ class EditArea(gui.VWidget):
     def focusInEvent(self, event):
         gui.VCursor.setPos(self.mapToGlobal((self._visual_cursor_pos[0], self._visual_cursor_pos[1])))
 
+def _groupByLine(match_pos):
+    """
+    Groups the (line, start, end) entries returned by Search.findAll
+    in a dictionary from line to the list of (start, end)
+    """
+    grouped = {}
+    for line_num, start, end in match_pos:
+        grouped.setdefault(line_num, []).append((start, end))
+    return grouped
@@ -33,6 +33,10 @@ class EditorApp(gui.VApplication):
         file_list = []
 
         for buffer in self._buffer_list.buffers:
+            if buffer.isReadOnly():
+                # Nothing to lose, and possibly huge
+                continue
+
             document_text = buffer.document.documentText()
             document_name = buffer.document.documentMetaInfo("Filename").data() or "noname"
             random_number = random.randint(1, 100000)
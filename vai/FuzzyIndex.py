@@ -0,0 +1,140 @@
+import heapq
+import re
+
+# Segments of an identifier: ACRONYM, Capitalized, lowercase, digits
+_SEGMENT_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+# Ranks of a match, the lower the better
+EXACT_MATCH, INITIALS_MATCH, SEGMENTS_MATCH, PREFIX_MATCH, SUBSEQUENCE_MATCH = list(range(5))
+
+class FuzzyIndex:
+    """
+    Index for fuzzy completion of identifiers. A query matches a word if
+    its characters appear in the word in the same order, ignoring case.
+    Matches on the camelCase or snake_case segments come first, so that
+    gLI finds _getLexerInstance, and lexInst finds lexerInstance.
+
+    A word is in the group of the first letter of each of its segments,
+    so the first character of a query must start a segment, in any
+    position: Instance and lex both find getLexerInstance. A query is
+    matched only against its group, with a single regular expression run
+    over the group words joined by newlines.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """
+        Removes all the words
+        """
+        # word -> (initials, lowercase segments)
+        self._words = {}
+
+        # initial letter -> {word: None}, in the order the words were added
+        self._groups = {}
+
+        # initial letter -> newline separated words, rebuilt when needed
+        self._group_texts = {}
+
+    def add(self, word):
+        """
+        Adds a word to the index. Adding a word twice has no effect.
+        """
+        segments = _SEGMENT_RE.findall(word)
+        if len(segments) == 0 or word in self._words:
+            return
+
+        initials = "".join(segment[0] for segment in segments).lower()
+        self._words[word] = (initials, " ".join(segments).lower())
+        for initial in set(initials):
+            self._groups.setdefault(initial, {})[word] = None
+            self._group_texts.pop(initial, None)
+
+    def remove(self, word):
+        """
+        Removes a word from the index
+        """
+        entry = self._words.pop(word, None)
+        if entry is None:
+            return
+
+        for initial in set(entry[0]):
+            del self._groups[initial][word]
+            self._group_texts.pop(initial, None)
+
+    def lookup(self, query, limit=None, weight=None):
+        """
+        Returns the words matching the query, best first. Among matches of
+        the same kind, words with a higher weight(word) come first, then
+        the shortest ones. At most limit words are returned, if given.
+        """
+        return [word for _, word in self.matches(query, limit, weight)]
+
+    def matches(self, query, limit=None, weight=None):
+        """
+        Like lookup, but returns a list of (rank, word) pairs, where rank is
+        one of EXACT_MATCH, INITIALS_MATCH, SEGMENTS_MATCH, PREFIX_MATCH,
+        SUBSEQUENCE_MATCH.
+        """
+        lowercase_query = query.lstrip("_").lower()
+        if lowercase_query == '' or lowercase_query[0] not in self._groups:
+            return []
+
+        initial = lowercase_query[0]
+        group = self._groups[initial]
+        text = self._group_texts.get(initial)
+        if text is None:
+            text = "\n".join(group)
+            self._group_texts[initial] = text
+
+        # Every character class stops at the first occurrence of the next
+        # character, so that a failing line is not backtracked.
+        pattern = "^" + "".join("[^\\n%s]*[%s]" % (_bothCases(char), _bothCases(char))
+                                for char in lowercase_query) + "[^\\n]*"
+        found = re.findall(pattern, text, re.MULTILINE)
+
+        # The query segments must start segments of the word, in the same order
+        query_segments = [segment.lower() for segment in _SEGMENT_RE.findall(query)]
+        if len(query_segments) != 0:
+            segments_match = re.compile("(?:.* )?" + "[^ ]* (?:.* )?".join(map(re.escape, query_segments))).match
+        else:
+            segments_match = lambda lowercase_segments: None
+
+        def key(word):
+            initials, lowercase_segments = self._words[word]
+            if word == query:
+                rank = EXACT_MATCH
+            elif initials.startswith(lowercase_query):
+                rank = INITIALS_MATCH
+            elif segments_match(lowercase_segments):
+                rank = SEGMENTS_MATCH
+            elif word.lstrip("_").lower().startswith(lowercase_query):
+                rank = PREFIX_MATCH
+            else:
+                rank = SUBSEQUENCE_MATCH
+            return (rank, -weight(word) if weight is not None else 0, len(word), word)
+
+        if limit is None:
+            keys = sorted(map(key, found))
+        else:
+            keys = heapq.nsmallest(limit, map(key, found))
+
+        return [(k[0], k[-1]) for k in keys]
+
+    def __len__(self):
+        return len(self._words)
+
+def wordInitials(word):
+    """
+    Returns the lowercase initials of the segments of an identifier,
+    e.g. "gli" for _getLexerInstance and "etl" for EXTENSION_TO_LEXER
+    """
+    return "".join(segment[0] for segment in _SEGMENT_RE.findall(word)).lower()
+
+def _bothCases(char):
+    """
+    Returns the lowercase and uppercase versions of char, escaped
+    for use in a regular expression character class
+    """
+    return re.escape(char) + re.escape(char.upper()) if char.upper() != char else re.escape(char)
@@ -1,86 +1,314 @@
+import bisect
+import collections
+import functools
+import itertools
 import re
+import weakref
+
+# Number of patterns whose matches are kept for each document
+MAX_CACHED_PATTERNS = 8
+
+# For read-only documents, number of bytes of the file scanned at once,
+# and how far past them a match can end
+SCAN_WINDOW = 64 * 1024 * 1024
+SCAN_OVERLAP = 64 * 1024
+
+_EOL = re.compile("\n")
 
 class SearchDirection:
     FORWARD = 1
     BACKWARD = -1
 
-def findAll(document, search_text, line_interval=None, case_sensitive=True, word=False):
+class SearchIndex:
     """
-    Find all occurrences of a given search text (evt. regexp text).
+    Snapshot of a document text as a single string, with the offset where
+    each line starts. The compiled patterns run once over the whole text,
+    and their matches are kept until the document version changes.
     """
-    match_pos = []
-    if line_interval is None:
-        line_interval = (1, document.numLines()+1)
-    else:
-        line_interval = (max(1, line_interval[0]), min(document.numLines()+1, line_interval[1]))
+    def __init__(self, document):
+        # documentText does not split the lines a storage keeps unsplit
+        self.version = document.version()
+        self.text = document.documentText()
+        self.line_starts = [0] + [m.end() for m in _EOL.finditer(self.text)]
+        self._matches = collections.OrderedDict()
+
+    def matches(self, regexp):
+        """
+        Returns the start offsets and the end offsets of all
+        the matches of a compiled pattern, as two lists.
+        """
+        key = (regexp.pattern, regexp.flags)
+        result = self._matches.get(key)
+        if result is None:
+            spans = [m.span() for m in regexp.finditer(self.text)]
+            result = ([span[0] for span in spans], [span[1] for span in spans])
+            self._matches[key] = result
+            if len(self._matches) > MAX_CACHED_PATTERNS:
+                self._matches.popitem(last=False)
+        else:
+            self._matches.move_to_end(key)
+
+        return result
+
+    def hasMatches(self, regexp):
+        """
+        True if the matches of the pattern are already known
+        """
+        return (regexp.pattern, regexp.flags) in self._matches
+
+    def offset(self, pos):
+        """
+        Returns the offset in the text of a (line, column) position
+        """
+        return self.line_starts[pos[0]-1] + pos[1] - 1
+
+    def position(self, offset):
+        """
+        Returns the (line, column) position of an offset in the text
+        """
+        line_index = bisect.bisect_right(self.line_starts, offset) - 1
+        return (line_index+1, offset-self.line_starts[line_index]+1)
+
+# One SearchIndex for each document, dropped with the document
+_indexes = weakref.WeakKeyDictionary()
+
+def searchIndex(document):
+    """
+    Returns the SearchIndex of the current version of the document
+    """
+    index = _indexes.get(document)
+    if index is None or index.version != document.version():
+        index = SearchIndex(document)
+        _indexes[document] = index
+    return index
 
+@functools.lru_cache(maxsize=64)
+def compilePattern(search_text, case_sensitive=True, word=False, regex=False):
+    """
+    Returns the compiled regular expression searching for a text. If regex
+    is True, the text is a regular expression, where ^ and $ match at the
+    line boundaries, and \n matches a line break.
+    """
     flags = 0
     if not case_sensitive:
        flags = re.IGNORECASE
 
-    if word:
-        search_text = r'\b'+re.escape(search_text)+r'\b'
+    if regex:
+        flags |= re.MULTILINE
     else:
         search_text = re.escape(search_text)
 
-    allMatches = re.compile(search_text, flags).finditer
+    if word:
+        search_text = r'\b(?:'+search_text+r')\b'
 
-    for line_num in range(*line_interval):
-        line_text = document.lineText(line_num)
-        match_pos.extend( ((line_num, m.start()+1, m.end()+1) for m in allMatches(line_text)) )
+    return re.compile(search_text, flags)
 
-    return match_pos
+def findAll(document, search_text, line_interval=None, case_sensitive=True, word=False, regex=False):
+    """
+    Find all occurrences of a given search text (evt. regexp text).
+    Returns a list of (line, start column, end column). A match spanning
+    several lines gives an entry for each of its lines in the interval.
+    Raises re.error if regex is True and search_text is not valid.
+    """
+    if line_interval is None:
+        line_interval = (1, document.numLines()+1)
+    else:
+        line_interval = (max(1, line_interval[0]), min(document.numLines()+1, line_interval[1]))
+
+    if line_interval[0] >= line_interval[1]:
+        return []
+
+    regexp = compilePattern(search_text, case_sensitive, word, regex)
+
+    if document.isReadOnly():
+        return _findAllMapped(document.storage(), regexp, line_interval)
+
+    index = _indexes.get(document)
+    if line_interval != (1, document.numLines()+1) and \
+            (index is None or index.version != document.version() or not index.hasMatches(regexp)):
+        # Searching a few lines. Don't build the index of the whole
+        # document for them, as it would be outdated at the next change.
+        # Matches coming from lines before the interval are not found.
+        lines = document.linesText2(line_interval[0], line_interval[1]-line_interval[0])
+        line_starts = [0] + list(itertools.accumulate(map(len, lines)))
+        spans = [m.span() for m in regexp.finditer("".join(lines))]
+        return _matchPositions(spans, line_starts, 0, len(lines), line_interval[0])
+
+    index = searchIndex(document)
+    starts, ends = index.matches(regexp)
+    first_offset = index.line_starts[line_interval[0]-1]
 
-def find(buffer, text, direction):
+    # Matches do not overlap, so the ends are sorted as well
+    first = bisect.bisect_right(ends, first_offset)
+    if first > 0 and starts[first-1] == ends[first-1] == first_offset:
+        first -= 1
+    last = bisect.bisect_left(starts, index.line_starts[line_interval[1]-1])
+
+    return _matchPositions(zip(starts[first:last], ends[first:last]),
+                           index.line_starts,
+                           line_interval[0]-1,
+                           line_interval[1]-1,
+                           1)
+
+def find(buffer, text, direction, regex=False):
     """
     Find the next occurrence of text in the buffer, with a given direction.
     If found, it moves the cursor to the appropriate position and returns True
     If not found, it returns false.
+    The matches are cached, so that repeated searches are fast until the
+    document changes. Raises re.error if regex is True and text is not valid.
     """
+    regexp = compilePattern(text, regex=regex)
+    if buffer.document.isReadOnly():
+        return _findMapped(buffer, regexp, direction)
+
+    index = searchIndex(buffer.document)
+    starts, _ = index.matches(regexp)
+    if len(starts) == 0:
+        return False
 
-    document = buffer.document
     cursor = buffer.cursor
+    cursor_offset = index.offset(cursor.pos)
+
+    # Wrap around at the end (or the beginning) of the document
+    if direction == SearchDirection.FORWARD:
+        match_index = bisect.bisect_right(starts, cursor_offset)
+        if match_index == len(starts):
+            match_index = 0
+    else:
+        match_index = bisect.bisect_left(starts, cursor_offset) - 1
+
+    cursor.toPos(index.position(starts[match_index]))
+    return True
+
+@functools.lru_cache(maxsize=64)
+def _bytesPattern(pattern, flags):
+    """
+    Returns the compiled pattern matching the UTF-8 encoded text, for
+    a str pattern with the given flags. Case insensitive matching and
+    the character classes only apply to ASCII characters.
+    """
+    return re.compile(pattern.encode("utf-8"), flags & ~re.UNICODE)
 
-    pos = cursor.pos
+def _mappedSpans(storage, pattern, start, end):
+    """
+    Generates the (start, end) byte offsets of the matches of a bytes
+    pattern in the mapped file of a MmapStorage, starting between the
+    offsets start and end. The file is scanned a window at a time, and
+    the scanned pages are released.
+    """
+    data = storage.data()
+    while start < end:
+        window_end = min(start + SCAN_WINDOW, end)
+        scan_end = min(window_end + SCAN_OVERLAP, storage.size())
+        for match in pattern.finditer(data, start, scan_end):
+            if match.start() >= window_end:
+                break
+            yield match.span()
+            # Matches do not overlap
+            window_end = max(window_end, match.end())
 
-    current_line, current_col = pos
+        storage.release(start, scan_end)
+        start = window_end
+
+def _mappedColumn(storage, line_index, offset):
+    """
+    Returns the column of the character at a byte offset in a line
+    """
+    line_start = storage.lineStart(line_index)
+    return len(storage.data()[line_start:offset].decode("utf-8", "replace")) + 1
+
+def _findAllMapped(storage, regexp, line_interval):
+    """
+    findAll for a document kept in a MmapStorage. The mapped bytes are
+    scanned directly, instead of building the text of the document.
+    """
+    pattern = _bytesPattern(regexp.pattern, regexp.flags)
+    first_index, last_index = line_interval[0]-1, line_interval[1]-1
+    start = storage.lineStart(first_index)
+    end = storage.lineStart(last_index) if last_index < storage.numLines() else storage.size()
 
-    # We do either forward or reverse search all with the same code.
-    # We just switch the lookup function depending on the direction.
-    # and apply it to each line string.
+    match_pos = []
+    for match_start, match_end in _mappedSpans(storage, pattern, start, end):
+        line_index = storage.lineIndex(match_start)
+        while line_index < last_index:
+            line_start = storage.lineStart(line_index)
+            line_end = storage.lineStart(line_index+1) if line_index+1 < storage.numLines() else match_end
+            match_pos.append((line_index+1,
+                              _mappedColumn(storage, line_index, max(match_start, line_start)),
+                              _mappedColumn(storage, line_index, min(match_end, line_end))))
+
+            if match_end <= line_end:
+                break
+            line_index += 1
+
+    return match_pos
+
+def _findMapped(buffer, regexp, direction):
+    """
+    find for a buffer whose document is kept in a MmapStorage. The file
+    is scanned from the cursor, until a match is found.
+    """
+    storage = buffer.document.storage()
+    pattern = _bytesPattern(regexp.pattern, regexp.flags)
+    cursor = buffer.cursor
+    line_start = storage.lineStart(cursor.pos[0]-1)
+    cursor_offset = line_start + len(buffer.document.lineText(cursor.pos[0])[:cursor.pos[1]-1].encode("utf-8"))
+
+    # Wrap around at the end (or the beginning) of the indexed lines
+    size = storage.indexedSize()
+    found = None
     if direction == SearchDirection.FORWARD:
-        first_half, second_half = ((pos[0], document.numLines()+1), (1, pos[0]+1))
-        find_routine = "find"
+        for start, end in ((cursor_offset+1, size), (0, cursor_offset+1)):
+            found = next(_mappedSpans(storage, pattern, start, end), None)
+            if found is not None:
+                break
     else:
-        first_half, second_half = ((pos[0], 0, -1), (document.numLines(), pos[0]-1, -1))
-        find_routine = "rfind"
-
-
-    # Perform the lookup in the first half.
-    for line_num in range(*first_half):
-        start, stop = (None, None)
-        if line_num == current_line:
-            # current_col - 1 + 1 = next char
-            start, stop = (current_col, None) if direction == SearchDirection.FORWARD else (None, current_col)
-
-        index = getattr(document.lineText(line_num), find_routine)(text, start, stop)
-        if index != -1:
-            cursor.toPos((line_num, index+1))
-            return True
-
-    # Reached the end, start from the other side
-    for line_num in range(*second_half):
-        start, stop = (None, None)
-        if line_num == current_line:
-            start, stop = (None, current_col) if direction == SearchDirection.FORWARD else (current_col, None)
-        else:
-            start, stop = (0, None)
+        window_end = cursor_offset
+        wrapped = False
+        while found is None:
+            window_start = max(window_end - SCAN_WINDOW, 0)
+            for span in _mappedSpans(storage, pattern, window_start, window_end):
+                found = span
+
+            if window_start > 0:
+                window_end = window_start
+            elif wrapped:
+                break
+            else:
+                window_end = size
+                wrapped = True
+
+    if found is None:
+        return False
+
+    line_index = storage.lineIndex(found[0])
+    cursor.toPos((line_index+1, _mappedColumn(storage, line_index, found[0])))
+    return True
 
-        index = getattr(document.lineText(line_num), find_routine)(text, start, stop)
+def _matchPositions(spans, line_starts, first_index, last_index, first_line):
+    """
+    Converts the (start, end) offsets of the matches in (line, start column,
+    end column) entries, split at the line boundaries, for the line indexes
+    in [first_index, last_index). line_starts are the offsets of the lines,
+    and the line with index 0 is the document line first_line.
+    """
+    match_pos = []
+    for start, end in spans:
+        line_index = bisect.bisect_right(line_starts, start) - 1
+        while True:
+            line_start = line_starts[line_index]
+            line_end = line_starts[line_index+1] if line_index+1 < len(line_starts) else end
+            if line_index >= last_index:
+                break
 
-        if index != -1:
-            cursor.toPos((line_num, index+1))
-            return True
+            if line_index >= first_index:
+                match_pos.append((first_line+line_index,
+                                  max(start, line_start)-line_start+1,
+                                  min(end, line_end)-line_start+1))
 
-    return False
+            if end <= line_end:
+                break
+            line_index += 1
 
+    return match_pos
@@ -1,80 +1,225 @@
+import bisect
+import heapq
+import os
+from .FuzzyIndex import FuzzyIndex
+
+# Above this number of new words, the sorted list is rebuilt
+# instead of inserting them one by one
+_MAX_INSERTIONS = 16
+
 class SymbolLookupDb:
     """
-    Singleton class. Contains the database storing the various symbols in the current open codes.
-    At the moment, this is filled up by the Lexer.
-    Implemented as a simple trie. Nothing fancy.
+    Contains the database storing the symbols found in a buffer.
+    At the moment, this is filled up by the Lexer, one line at a time.
+
+    Words are kept in a sorted list, so that the words having a given
+    prefix are a contiguous range found with bisect. Every word keeps
+    a count of its occurrences, used to rank the results, and it is
+    removed only when the last occurrence goes away. The words are also
+    kept in a FuzzyIndex for fuzzyLookup.
     """
 
-    _db = {}
+    def __init__(self):
+        self.clear()
 
-    @classmethod
-    def clear(cls):
+    def clear(self):
         """
         Completely clears the database
         """
-        cls._db = {}
+        self._counts = {}
+        self._words = []
+        self._fuzzy_index = FuzzyIndex()
+
+        # Words added since the last lookup, not yet in _words
+        self._pending = set()
 
-    @classmethod
-    def add(cls, word):
+    def add(self, word):
         """
-        Adds a word to the database
+        Adds an occurrence of a word to the database
         """
-        _add(cls._db, word)
+        count = self._counts.get(word)
+        if count is None:
+            self._counts[word] = 1
+            self._pending.add(word)
+            self._fuzzy_index.add(word)
+        else:
+            self._counts[word] = count + 1
 
-    @classmethod
-    def lookup(cls, prefix):
+    def remove(self, word):
         """
-        Given a prefix, looks up all entries having that prefix.
-        Returns a list of all postfixes, or an empty list if
-        nothing is available.
+        Removes an occurrence of a word from the database. The word
+        is no longer found once all its occurrences have been removed.
         """
-        d = _walkDown(cls._db, prefix)
-        if d is None:
-            return []
+        count = self._counts.get(word)
+        if count is None:
+            return
 
-        ret = _composePostfix(d)
-        return ret
+        if count > 1:
+            self._counts[word] = count - 1
+            return
 
-# Helper routines for the above class
+        del self._counts[word]
+        self._fuzzy_index.remove(word)
+        if word in self._pending:
+            self._pending.remove(word)
+        else:
+            index = bisect.bisect_left(self._words, word)
+            del self._words[index]
 
-def _add(d, word):
-    """
-    Recursive function to add a word to the trie
-    """
-    if len(word) == 0:
-        d[''] = None
-        return
-    if word[0] not in d:
-        d[word[0]] = {}
+    def count(self, word):
+        """
+        Returns the number of occurrences of a word
+        """
+        return self._counts.get(word, 0)
 
-    _add(d[word[0]], word[1:])
+    def lookup(self, prefix, limit=None):
+        """
+        Given a prefix, looks up all entries having that prefix.
+        Returns a list of the postfixes, the most frequent words first,
+        or an empty list if nothing is available. If limit is given,
+        at most limit postfixes are returned.
+        """
+        return [word[len(prefix):] for word in self._rankedWords(prefix, limit)]
 
-def _walkDown(d, prefix):
-    """
-    Recursive. Performs traversal of the trie given a prefix
-    """
-    if len(prefix) == 1:
-        if prefix[0] not in d:
+    def commonPrefix(self, prefix):
+        """
+        Returns the postfix shared by all the words that start with, and
+        are longer than, the given prefix. Returns None if there is no
+        such word. Only the first and last words of the range are compared.
+        """
+        words = self._sortedWords()
+        first, last = self._prefixRange(prefix)
+        if first < last and words[first] == prefix:
+            first += 1
+
+        if first == last:
             return None
-        return d[prefix[0]]
 
-    try:
-        return _walkDown(d[prefix[0]], prefix[1:])
-    except KeyError:
-        return None
+        return os.path.commonprefix([words[first], words[last-1]])[len(prefix):]
+
+    def fuzzyLookup(self, query, limit=None):
+        """
+        Returns the full words matching the query as a subsequence, or
+        on the camelCase/snake_case initials, best match first. Words
+        of the same kind of match are ranked by number of occurrences.
+        """
+        return self._fuzzy_index.lookup(query, limit, self.count)
+
+    def wordsWithPrefix(self, prefix):
+        """
+        Returns the full words with the given prefix, in alphabetical order
+        """
+        words = self._sortedWords()
+        first, last = self._prefixRange(prefix)
+        return words[first:last]
+
+    def fuzzyMatches(self, query):
+        """
+        Returns the (rank, word) pairs of the words matching the query,
+        where rank is the kind of match, as in FuzzyIndex.matches
+        """
+        return self._fuzzy_index.matches(query)
 
-def _composePostfix(d, tab=0):
+    def __len__(self):
+        return len(self._counts)
+
+    # Private
+
+    def _rankedWords(self, prefix, limit=None):
+        """
+        Returns the words with the given prefix, by decreasing
+        number of occurrences, then alphabetically.
+        """
+        words = self.wordsWithPrefix(prefix)
+        counts = self._counts
+        key = lambda word: (-counts[word], word)
+
+        if limit is None:
+            return sorted(words, key=key)
+        return heapq.nsmallest(limit, words, key=key)
+
+    def _sortedWords(self):
+        """
+        Merges the pending words in the sorted list, and returns it
+        """
+        if len(self._pending) > _MAX_INSERTIONS:
+            self._words.extend(self._pending)
+            self._words.sort()
+        else:
+            for word in self._pending:
+                bisect.insort(self._words, word)
+
+        self._pending = set()
+        return self._words
+
+    def _prefixRange(self, prefix):
+        """
+        Returns the interval [first, last) of the sorted words
+        starting with prefix.
+        """
+        words = self._words
+        first = bisect.bisect_left(words, prefix)
+        if prefix == '':
+            return first, len(words)
+
+        # The smallest string greater than all the strings starting with prefix
+        if ord(prefix[-1]) < 0x10FFFF:
+            upper = prefix[:-1] + chr(ord(prefix[-1])+1)
+            return first, bisect.bisect_left(words, upper, first)
+
+        last = first
+        while last < len(words) and words[last].startswith(prefix):
+            last += 1
+        return first, last
+
+class SymbolLookupDbUnion:
     """
-    Recursive function. Builds the postfixes list
-    from a given trie branch.
+    Performs lookups on a group of SymbolLookupDb, for example
+    to complete with the symbols of all the open buffers.
     """
 
-    ret = []
-    if d is None:
-        return ['']
+    def __init__(self, dbs):
+        self._dbs = list(dbs)
+
+    def lookup(self, prefix, limit=None):
+        """
+        Returns the postfixes found in any of the databases, without
+        repetitions, ranked by the total number of occurrences.
+        """
+        counts = {}
+        for db in self._dbs:
+            for word in db.wordsWithPrefix(prefix):
+                counts[word] = counts.get(word, 0) + db.count(word)
+
+        ranked = sorted(counts, key=lambda word: (-counts[word], word))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [word[len(prefix):] for word in ranked]
 
-    for k, v in d.items():
-        for postfix in _composePostfix(v, tab+1):
-            ret.append(k+postfix)
+    def fuzzyLookup(self, query, limit=None):
+        """
+        Returns the words matching the query in any of the databases,
+        ranked by kind of match, then by total number of occurrences.
+        """
+        ranks = {}
+        counts = {}
+        for db in self._dbs:
+            for rank, word in db.fuzzyMatches(query):
+                ranks[word] = rank
+                counts[word] = counts.get(word, 0) + db.count(word)
+
+        ranked = sorted(ranks, key=lambda word: (ranks[word], -counts[word], len(word), word))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return ranked
 
-    return ret
+    def commonPrefix(self, prefix):
+        """
+        Returns the postfix shared by all the words longer than prefix
+        in any of the databases, or None if there is no such word.
+        """
+        postfixes = [db.commonPrefix(prefix) for db in self._dbs]
+        postfixes = [postfix for postfix in postfixes if postfix is not None]
+        if len(postfixes) == 0:
+            return None
+        return os.path.commonprefix(postfixes)
@@ -9,6 +9,11 @@ import sys
 import io
 import argparse
 import locale
+import logging
+
+# Log records are dropped unless logging is configured, so that they
+# are not written over the curses screen
+logging.getLogger(__name__).addHandler(logging.NullHandler())
 
 def _workaroundNCurses():
     """
@@ -1,7 +1,17 @@
+import re
 import shlex
+from vaitk import core
 from .. import models
+from .. import Search
 import os
 
+# Msecs without typing before the matches of the search text are highlighted
+SEARCH_HIGHLIGHT_DELAY = 150
+
+# Msecs after the highlight of the visible matches before searching the
+# whole document, so that the other matches are ready when needed
+FULL_SEARCH_DELAY = 300
+
 class CommandBarController:
     def __init__(self, command_bar, edit_area, editor_controller, global_state):
         self._command_bar = command_bar
@@ -12,11 +22,16 @@ class CommandBarController:
         self._command_bar.returnPressed.connect(self.parseCommandBar)
         self._command_bar.escapePressed.connect(self.abortCommandBar)
         self._command_bar.tabPressed.connect(self.autocompleteCommandBar)
+        self._command_bar.textChanged.connect(self.commandTextChanged)
+
+        self._highlight_timer = None
+        self._full_search_timer = None
 
         self._global_state.editorModeChanged.connect(self.editorModeChanged)
 
     def parseCommandBar(self):
         command_text = self._command_bar.command_text
+        self._clearSearchHighlight()
         mode = self._global_state.editor_mode
         self._global_state.editor_mode = models.EditorMode.COMMAND
         if mode == models.EditorMode.COMMAND_INPUT:
@@ -30,13 +45,72 @@ class CommandBarController:
         self._edit_area.setFocus()
 
     def abortCommandBar(self):
+        self._clearSearchHighlight()
         self._command_bar.clear()
         self._global_state.editor_mode = models.EditorMode.COMMAND
         self._edit_area.setFocus()
 
+    def commandTextChanged(self, *args):
+        """
+        While typing a search, highlights the matches once the typing pauses.
+        """
+        if self._global_state.editor_mode not in (models.EditorMode.SEARCH_FORWARD,
+                                                  models.EditorMode.SEARCH_BACKWARD):
+            return
+
+        if self._highlight_timer is None and core.VCoreApplication.vApp is not None:
+            self._highlight_timer = _singleShotTimer(SEARCH_HIGHLIGHT_DELAY, self.highlightSearch)
+            self._full_search_timer = _singleShotTimer(FULL_SEARCH_DELAY, self.searchWholeDocument)
+
+        if self._highlight_timer is None:
+            self.highlightSearch()
+            return
+
+        self._full_search_timer.stop()
+        self._highlight_timer.stop()
+        self._highlight_timer.start()
+
+    def highlightSearch(self):
+        """
+        Highlights the matches of the search text. Only the visible area is
+        searched now, the rest of the document after FULL_SEARCH_DELAY.
+        """
+        search_text = self._command_bar.command_text
+        self._edit_area.setSearchHighlight(search_text if len(search_text) != 0 else None)
+        if self._full_search_timer is not None:
+            self._full_search_timer.stop()
+            self._full_search_timer.start()
+
+    def searchWholeDocument(self):
+        """
+        Finds and caches the matches in the whole document, for the search
+        text currently highlighted.
+        """
+        search_text = self._edit_area.search_highlight
+        if search_text is None or self._edit_area.buffer is None:
+            return
+
+        # Matches are not cached for read-only documents
+        if self._edit_area.buffer.isReadOnly():
+            return
+
+        try:
+            Search.findAll(self._edit_area.buffer.document, search_text,
+                           regex=models.Configuration.get("search.regex"))
+        except re.error:
+            return
+
+        self._edit_area.update()
+
     def editorModeChanged(self, *args):
         self._command_bar.editor_mode = self._global_state.editor_mode
 
+    def _clearSearchHighlight(self):
+        if self._highlight_timer is not None:
+            self._highlight_timer.stop()
+            self._full_search_timer.stop()
+        self._edit_area.setSearchHighlight(None)
+
     def autocompleteCommandBar(self):
         command_text = self._command_bar.command_text
         if len(command_text.strip()) == 0:
@@ -64,3 +138,9 @@ class CommandBarController:
 
                     self._command_bar.command_text = new_command_text
 
+def _singleShotTimer(interval, slot):
+    timer = core.VTimer()
+    timer.setSingleShot(True)
+    timer.setInterval(interval)
+    timer.timeout.connect(slot)
+    return timer
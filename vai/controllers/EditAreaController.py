@@ -1,10 +1,8 @@
 import vaitk
-import os
 from vaitk import core, Key, KeyModifier
-from ..models import EditorMode
+from ..models import EditorMode, Configuration
 from .. import Search
 from ..models import commands
-from ..SymbolLookupDb import SymbolLookupDb
 
 DIRECTIONAL_KEYS = [ Key.Key_Up,
                      Key.Key_Down,
@@ -16,6 +14,27 @@ DIRECTIONAL_KEYS = [ Key.Key_Up,
                      Key.Key_End,
                      ]
 
+# Keys of the command mode that do not modify the document. Only these
+# are handled for a read-only buffer.
+READ_ONLY_KEYS = [ Key.Key_H,
+                   Key.Key_J,
+                   Key.Key_K,
+                   Key.Key_L,
+                   Key.Key_G,
+                   Key.Key_N,
+                   Key.Key_M,
+                   Key.Key_Y,
+                   Key.Key_Z,
+                   Key.Key_C,
+                   Key.Key_Space,
+                   Key.Key_Backspace,
+                   Key.Key_Dollar,
+                   Key.Key_AsciiCircum,
+                   Key.Key_Asterisk,
+                   Key.Key_Apostrophe,
+                   Key.Key_Escape,
+                   ]
+
 class BaseState:
     @classmethod
     def handleEvent(cls, event, buffer, global_state, edit_area, editor_controller):
@@ -25,7 +44,8 @@ class BaseState:
             return new_state
 
         new_state = cls._handleNonDirectionalKey(event, buffer, global_state, edit_area, editor_controller)
-        event.accept()
+        if new_state is not UnknownState:
+            event.accept()
         return new_state
 
     @classmethod
@@ -146,12 +166,15 @@ class CommandState(BaseState):
             return CommandState
 
         if key == Key.Key_U:
-            try:
-                command = buffer.command_history.prev()
-            except IndexError:
-                return CommandState
+            if buffer.command_history.numUndoableCommands() != 0:
+                buffer.command_history.undo()
+            return CommandState
 
-            command.undo()
+        if key == Key.Key_C and modifiers & KeyModifier.ControlModifier:
+            # When not loading, Ctrl-C is left to the application, to quit
+            if buffer.loader is None:
+                return UnknownState
+            editor_controller.cancelLoading()
             return CommandState
 
         if key == Key.Key_V and modifiers & KeyModifier.ShiftModifier:
@@ -160,12 +183,8 @@ class CommandState(BaseState):
             return VisualLineSelectionState
 
         if key == Key.Key_R and modifiers & KeyModifier.ControlModifier:
-            try:
-                command = buffer.command_history.next()
-            except IndexError:
-                return CommandState
-
-            command.execute()
+            if buffer.command_history.numRedoableCommands() != 0:
+                buffer.command_history.redo()
             return CommandState
 
         if key == Key.Key_N:
@@ -175,7 +194,7 @@ class CommandState(BaseState):
                     direction = {Search.SearchDirection.FORWARD: Search.SearchDirection.BACKWARD,
                                  Search.SearchDirection.BACKWARD: Search.SearchDirection.FORWARD}[direction]
 
-                Search.find(buffer, text, direction)
+                Search.find(buffer, text, direction, regex=Configuration.get("search.regex"))
             return CommandState
 
         if key == Key.Key_Asterisk:
@@ -262,11 +281,16 @@ class InsertState(BaseState):
                     if prefix[1] is None:
                         text = " "*4
                     else:
-                        lookup = [x for x in SymbolLookupDb.lookup(prefix[0]) if x != '']
-                        if len(lookup) >= 1:
-                            text = os.path.commonprefix(lookup)
-                        else:
+                        symbol_lookup_db = editor_controller.symbolLookupDb()
+                        text = symbol_lookup_db.commonPrefix(prefix[0])
+                        if text is None:
+                            # No word starts with it. Try a fuzzy match on
+                            # the part of the word before the cursor.
                             text = ''
+                            partial_word = prefix[0][:cursor.pos[1]-prefix[1]]
+                            matches = symbol_lookup_db.fuzzyLookup(partial_word, limit=1)
+                            if len(matches) != 0 and matches[0] != partial_word:
+                                command = commands.CompleteWordCommand(buffer, partial_word, matches[0])
             elif event.key() in (Key.Key_ParenRight,
                                  Key.Key_BraceRight,
                                  Key.Key_BracketRight,
@@ -405,7 +429,7 @@ class BookmarkState(BaseState):
             marker = vaitk.vaiKeyCodeToText(event.key())
 
             data_dict = {}
-            found = buffer.document.lineMetaInfo("Bookmark").findWhere(lambda x: x == marker)
+            found = [m.line for m in buffer.document.lineMetaInfo("Bookmark").markersWithValue(marker)]
             for line_num in found:
                 data_dict[line_num] = None
             if buffer.cursor.line not in found:
@@ -423,9 +447,9 @@ class GoToBookmarkState(BaseState):
     def _handleNonDirectionalKey(cls, event, buffer, global_state, edit_area, editor_controller):
         if Key.Key_A <= event.key() <= Key.Key_Z:
             marker = vaitk.vaiKeyCodeToText(event.key())
-            found = buffer.document.lineMetaInfo("Bookmark").findWhere(lambda x: x == marker)
+            found = buffer.document.lineMetaInfo("Bookmark").markersWithValue(marker)
             if len(found) != 0:
-                buffer.cursor.toLine(list(found.keys())[0])
+                buffer.cursor.toLine(found[0].line)
 
         return CommandState
 
@@ -523,11 +547,9 @@ class EditAreaController(core.VObject):
 
         if self._buffer is not None:
             self._buffer.cursor.positionChanged.disconnect(self._cursorPositionChanged)
-            self._buffer.document.contentChanged.disconnect(self._documentContentChanged)
 
         self._buffer = buffer
         self._buffer.cursor.positionChanged.connect(self._cursorPositionChanged)
-        self._buffer.document.contentChanged.connect(self._documentContentChanged)
 
     def handleKeyEvent(self, event):
         if self._buffer is None:
@@ -538,6 +560,10 @@ class EditAreaController(core.VObject):
         if not state:
             return
 
+        if self._buffer.isReadOnly() and state is CommandState and not _isReadOnlyKey(event):
+            event.accept()
+            return
+
         new_state = state.handleEvent(event, self._buffer, self._global_state, self._edit_area, self._editor_controller)
 
         if new_state is UnknownState:
@@ -546,7 +572,9 @@ class EditAreaController(core.VObject):
             self._global_state.editor_mode = STATE_TO_MODE[new_state]
             event.accept()
 
-        self._edit_area.update()
+        # The edit area redraws the rows whose contents or selection changed
+        cursor_line = self._buffer.cursor.pos[0]
+        self._edit_area.updateLines(cursor_line, cursor_line)
 
     # Private
 
@@ -590,7 +618,17 @@ class EditAreaController(core.VObject):
                                               doc_cursor_pos[0]-new_top_pos[0]
                                               )
 
-        self._edit_area.update()
+        self._edit_area.updateLines(doc_cursor_pos[0], doc_cursor_pos[0])
+
+def _isReadOnlyKey(event):
+    """
+    True if the key event of the command mode can not modify the document
+    """
+    if event.key() in DIRECTIONAL_KEYS:
+        return True
+
+    # Shift-J joins lines
+    if event.key() == Key.Key_J and event.modifiers() & KeyModifier.ShiftModifier:
+        return False
 
-    def _documentContentChanged(self, *args):
-        self._edit_area.update()
+    return event.key() in READ_ONLY_KEYS
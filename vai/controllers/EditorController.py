@@ -1,23 +1,32 @@
 import os
+import re
 import shlex
-import hashlib
 
 from vaitk import gui
 from .. import Search
 from .. import linting
 from .. import paths
-from ..lexer import Lexer
+from ..lexer import Lexer, ProjectSymbolIndex
 from .. import models
 from ..models import commands
+from ..models import storage
+from ..SymbolLookupDb import SymbolLookupDbUnion
 
 from yapsy.PluginManager import PluginManager
 
+# Files bigger than this (in bytes) are opened with a RopeStorage
+LARGE_FILE_SIZE = 16 * 1024 * 1024
+
+# Files bigger than this (in bytes) are opened read-only, with a MmapStorage
+HUGE_FILE_SIZE = 1024 * 1024 * 1024
+
 class EditorController:
     def __init__(self, editor, global_state, buffer_list):
         self._editor = editor
         self._global_state = global_state
         self._buffer_list = buffer_list
-        self._lexer = Lexer()
+        self._lexer = Lexer(lazy=True, background=True)
+        self._project_index = None
         self._plugin_manager = PluginManager()
         self._plugin_manager.getPluginLocator().setPluginInfoExtension("ini")
         self._plugin_manager.setPluginPlaces([paths.pluginsDir("user", "commands"), paths.pluginsDir("system", "commands")])
@@ -36,7 +45,34 @@ class EditorController:
         self._editor.status_bar_controller.buffer = self._buffer_list.current
         self._editor.side_ruler_controller.buffer = self._buffer_list.current
         self._editor.info_hover_box.buffer = self._buffer_list.current
-        self._lexer.setModel(self._buffer_list.current.document)
+        self._lexer.setModel(self._buffer_list.current.document,
+                             self._buffer_list.current.symbol_lookup_db)
+
+    @property
+    def lexer(self):
+        return self._lexer
+
+    @property
+    def project_index(self):
+        return self._project_index
+
+    def symbolLookupDb(self):
+        """
+        Returns the symbols database to use for completion in the current
+        buffer. If so configured, it contains the symbols of all buffers,
+        and those of the project index.
+        """
+        if models.Configuration.get("completion.all_buffers"):
+            dbs = [b.symbol_lookup_db for b in self._buffer_list.buffers]
+        else:
+            dbs = [self._buffer_list.current.symbol_lookup_db]
+
+        if self._project_index is not None:
+            dbs.append(self._project_index.symbol_lookup_db)
+
+        if len(dbs) == 1:
+            return dbs[0]
+        return SymbolLookupDbUnion(dbs)
 
     def forceQuit(self):
         for b in self._buffer_list.buffers:
@@ -49,6 +85,9 @@ class EditorController:
 
         models.EditorState.instance().save()
         models.Configuration.save()
+        self._lexer.close()
+        if self._project_index is not None:
+            self._project_index.close()
         gui.VApplication.vApp.exit()
 
     def doSave(self):
@@ -77,22 +116,10 @@ class EditorController:
             self.forceQuit()
 
     def searchForward(self, search_text):
-        if search_text == '':
-            if self._global_state.current_search is not None:
-                search_text = self._global_state.current_search[0]
-
-        if search_text != '':
-            self._global_state.current_search = (search_text, Search.SearchDirection.FORWARD)
-            Search.find(self._buffer_list.current, search_text, Search.SearchDirection.FORWARD)
+        self._search(search_text, Search.SearchDirection.FORWARD)
 
     def searchBackward(self, search_text):
-        if search_text == '':
-            if self._global_state.current_search is not None:
-                search_text = self._global_state.current_search[0]
-
-        if search_text != '':
-            self._global_state.current_search = (search_text, Search.SearchDirection.BACKWARD)
-            Search.find(self._buffer_list.current, search_text, Search.SearchDirection.BACKWARD)
+        self._search(search_text, Search.SearchDirection.BACKWARD)
 
     def selectPrevBuffer(self):
         self._buffer_list.selectPrev()
@@ -101,22 +128,35 @@ class EditorController:
         self._buffer_list.selectNext()
 
     def doSaveAndExit(self):
-        self._doSave()
-        self.forceQuit()
+        self._doSave(background=False)
+        if not self._buffer_list.current.isModified():
+            self.forceQuit()
 
-    def openFile(self, filename):
+    def openFile(self, filename, read_only=False):
+        """
+        Opens a file in a new buffer, or selects the buffer already showing
+        it. If read_only is True, or if the file is huge, the file is only
+        viewed, without reading it in memory.
+        """
         buffer = self._buffer_list.bufferForFilename(filename)
         if buffer is not None:
             self._buffer_list.select(buffer)
             return
 
         current_buffer = self._buffer_list.current
-        new_buffer = models.Buffer()
+        document_storage = None
+        if read_only or _fileSize(filename) > HUGE_FILE_SIZE:
+            document_storage = storage.MmapStorage()
+        elif _isLargeFile(filename):
+            document_storage = storage.RopeStorage()
+        new_buffer = models.Buffer(document_storage)
         status_bar = self._editor.status_bar
 
+        # Only the first chunk is read here. The rest is read while the
+        # editor is idle, and the buffer is set up at the end.
+        loader = models.DocumentLoader(new_buffer.document)
         try:
-            with open(filename,'r') as f:
-                new_buffer.document.read(f)
+            loader.start(filename)
         except FileNotFoundError:
             status_bar.setMessage("%s [New file]" % filename, 3000)
         except Exception as e:
@@ -125,21 +165,33 @@ class EditorController:
         new_buffer.document.documentMetaInfo("Filename").setData(filename)
         new_buffer.document.documentMetaInfo("Modified").setData(False)
 
-        initial_md5 = None
-        if not new_buffer.document.isEmpty():
-            initial_md5 = hashlib.md5(new_buffer.document.documentText().encode("utf-8"))
-        new_buffer.document.documentMetaInfo("InitialMD5").setData(initial_md5)
-
         if current_buffer.isEmpty() and not current_buffer.document.documentMetaInfo("Modified").data():
             self._buffer_list.replaceAndSelect(current_buffer, new_buffer)
         else:
             self._buffer_list.addAndSelect(new_buffer)
 
         recovered_cursor_pos = models.EditorState.instance().cursorPosForPath(os.path.abspath(filename))
-        if recovered_cursor_pos is not None:
+        if recovered_cursor_pos is not None and recovered_cursor_pos[0] <= new_buffer.document.numLines():
             new_buffer.cursor.toPos(recovered_cursor_pos)
+            recovered_cursor_pos = None
 
-        self._doLint()
+        self._updateProjectIndex(filename)
+
+        new_buffer.loader = loader
+        if loader.isLoading():
+            loader.progress.connect(lambda bytes_read, total_bytes:
+                                    self._loadingProgress(filename, bytes_read, total_bytes))
+            loader.finished.connect(lambda: self._loadingFinished(new_buffer, recovered_cursor_pos, True))
+        else:
+            self._loadingFinished(new_buffer, recovered_cursor_pos)
+
+    def cancelLoading(self):
+        """
+        Stops reading the file of the current buffer, if still loading
+        """
+        loader = self._buffer_list.current.loader
+        if loader is not None:
+            loader.cancel()
 
     def createEmptyBuffer(self):
         self._buffer_list.addAndSelect(models.Buffer())
@@ -192,6 +244,11 @@ class EditorController:
             else:
                 status_bar.setMessage("Only one filename allowed", 3000)
                 return
+        elif keyword == "view":
+            if len(command_tokens) == 2:
+                self.openFile(command_tokens[1], read_only=True)
+            else:
+                status_bar.setMessage("Specify one filename", 3000)
         elif keyword == "bp":
             self.selectPrevBuffer()
         elif keyword == "bn":
@@ -212,8 +269,72 @@ class EditorController:
 
     # Private
 
-    def _doLint(self):
-        document = self._buffer_list.current.document
+    def _loadingProgress(self, filename, bytes_read, total_bytes):
+        percent = 100 * bytes_read // total_bytes if total_bytes != 0 else 0
+        self._editor.status_bar.setMessage("%s [Loading %d%%, Ctrl-C to cancel]" % (filename, min(percent, 100)))
+
+    def _loadingFinished(self, buffer, recovered_cursor_pos, show_progress=False):
+        """
+        Completes the opening of a buffer once its file is read. A buffer
+        only partially read is detached from its file, so that it can not
+        be saved over it. show_progress is True if the loading progress
+        was shown on the status bar.
+        """
+        loader = buffer.loader
+        buffer.loader = None
+
+        document = buffer.document
+        filename = document.documentMetaInfo("Filename").data()
+        status_bar = self._editor.status_bar
+
+        if loader.isCancelled() or (loader.error() is not None and loader.bytesRead() != 0):
+            document.documentMetaInfo("Filename").setData(None)
+            reason = "Cancelled" if loader.isCancelled() else "Error: %s" % str(loader.error())
+            status_bar.setMessage("%s [%s. Only %d lines read, not associated to the file]" %
+                                  (filename, reason, document.numLines()), 3000)
+            return
+
+        if loader.error() is not None:
+            status_bar.setMessage("%s [Error: %s]" % (filename, str(loader.error())), 3000)
+        elif show_progress or buffer.isReadOnly():
+            status_bar.setMessage("%s [%d lines%s]" % (filename,
+                                                      document.numLines(),
+                                                      ", read-only" if buffer.isReadOnly() else ""), 3000)
+
+        if not buffer.isModified():
+            buffer.markSaved()
+
+        initial_md5 = None
+        if not document.isEmpty():
+            initial_md5 = loader.md5()
+        document.documentMetaInfo("InitialMD5").setData(initial_md5)
+
+        if not _isLargeFile(filename) and not buffer.isReadOnly():
+            # The steps of a journal would not apply to a text
+            # modified while loading
+            key = None
+            if initial_md5 is not None and not buffer.isModified():
+                key = initial_md5.hexdigest()
+            buffer.undo_journal = models.UndoJournal(buffer,
+                                                     key,
+                                                     models.Configuration.get("undo.journal_max_size"))
+
+        if recovered_cursor_pos is not None and buffer.cursor.pos == (1, 1):
+            buffer.cursor.toPos(recovered_cursor_pos)
+
+        self._doLint(buffer)
+
+    def _doLint(self, buffer=None):
+        if buffer is None:
+            buffer = self._buffer_list.current
+        document = buffer.document
+        if document.isReadOnly():
+            return
+
+        # Other files would only give syntax errors
+        filename = document.documentMetaInfo("Filename").data()
+        if filename is not None and os.path.splitext(filename)[1] not in ("", ".py"):
+            return
 
         linter1 = linting.PyFlakesLinter(document)
         all_info = linter1.runOnce()
@@ -227,16 +348,67 @@ class EditorController:
         line_info.clear()
         line_info.setDataForLines(meta_info)
 
-    def _doSave(self, filename=None):
+    def _search(self, search_text, direction):
+        """
+        Searches the text in the current buffer, as a regular expression if
+        so configured. An empty text repeats the previous search.
+        """
+        if search_text == '':
+            if self._global_state.current_search is not None:
+                search_text = self._global_state.current_search[0]
+
+        if search_text == '':
+            return
+
+        try:
+            Search.find(self._buffer_list.current, search_text, direction,
+                        regex=models.Configuration.get("search.regex"))
+        except re.error as e:
+            self._editor.status_bar.setMessage("Invalid search pattern: %s" % str(e), 3000)
+            return
+
+        self._global_state.current_search = (search_text, direction)
+
+    def _updateProjectIndex(self, filename):
+        """
+        If the project index is enabled, rescans the project containing
+        filename. A file outside the current project directory starts
+        a new index on its directory.
+        """
+        if filename is None or not models.Configuration.get("completion.project_index"):
+            return
+
+        if self._project_index is None or not self._project_index.contains(filename):
+            if self._project_index is not None:
+                self._project_index.close()
+            self._project_index = ProjectSymbolIndex(os.path.dirname(os.path.abspath(filename)))
+
+        self._project_index.scan()
+
+    def _doSave(self, filename=None, background=True):
+        """
+        Saves the current buffer. With background, the file is written
+        while editing goes on, and the buffer is set up as saved once done.
+        """
         status_bar = self._editor.status_bar
-        document = self._buffer_list.current.document
+        buffer = self._buffer_list.current
+        document = buffer.document
 
         if filename is not None and len(filename) == 0:
             status_bar.setMessage("Error! Unspecified file name.", 3000)
             return
 
-        status_bar.setMessage("Saving...")
-        gui.VApplication.vApp.processEvents()
+        if buffer.isReadOnly():
+            status_bar.setMessage("Error! The buffer is read-only.", 3000)
+            return
+
+        if buffer.loader is not None:
+            status_bar.setMessage("Error! Cannot save while the file is loading. Ctrl-C cancels loading.", 3000)
+            return
+
+        if buffer.saver is not None:
+            status_bar.setMessage("Error! The file is still being saved.", 3000)
+            return
 
         if filename is None:
             filename = document.documentMetaInfo("Filename").data()
@@ -245,16 +417,46 @@ class EditorController:
             status_bar.setMessage("Error! Cannot save unnamed file. Please specify a filename with :w filename", 3000)
             return
 
-        try:
-            with open(filename,'w') as f:
-                document.write(f)
-        except Exception as e:
-            status_bar.setMessage("Error! Cannot save file. %s" % str(e), 3000)
+        status_bar.setMessage("Saving...")
+
+        # The text being written, that the buffer has once saved
+        digest = buffer.digest()
+
+        saver = models.DocumentSaver(document)
+        buffer.saver = saver
+        saver.finished.connect(lambda: self._savingFinished(buffer, filename, digest))
+        saver.start(filename, background)
+
+    def _savingFinished(self, buffer, filename, digest):
+        saver = buffer.saver
+        buffer.saver = None
+
+        document = buffer.document
+        status_bar = self._editor.status_bar
+
+        if saver.error() is not None:
+            status_bar.setMessage("Error! Cannot save file. %s" % str(saver.error()), 3000)
             return
-        else:
-            status_bar.setMessage("Saved %s" % filename, 3000)
+
+        status_bar.setMessage("Saved %s" % filename, 3000)
 
         document.documentMetaInfo("Filename").setData(filename)
-        document.documentMetaInfo("Modified").setData(False)
-        document.lineMetaInfo("Change").clear()
+        buffer.markSaved(digest)
+
+        # Otherwise the text was modified during the save
+        if not buffer.isModified():
+            document.lineMetaInfo("Change").clear()
+            if buffer.undo_journal is not None:
+                buffer.undo_journal.save(saver.md5().hexdigest())
+
+        self._updateProjectIndex(filename)
+
+
+def _isLargeFile(filename):
+    return _fileSize(filename) > LARGE_FILE_SIZE
 
+def _fileSize(filename):
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
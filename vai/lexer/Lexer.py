@@ -1,7 +1,13 @@
 from pygments import lexers, util
+from vaitk import core
+from pygments.lexer import RegexLexer
+from pygments.token import _TokenType
 from ..SymbolLookupDb import SymbolLookupDb
 from ..models.TextDocument import CharMeta
+from ..models.RunLengthList import RunLengthList
 from . import token
+import concurrent.futures
+import threading
 import os
 
 # Faster lookup than the one provided in lexers.get_lexer_for_filename.
@@ -25,6 +31,33 @@ EXTENSION_TO_LEXER = {
     ".bat" : lexers.BatchLexer,
 }
 
+# In lazy mode, number of lines lexed past the last visible line
+PREFETCH_LINES = 100
+
+# In lazy mode, number of lines lexed at every idle step, and delay in
+# msecs between steps
+IDLE_LINES = 1000
+IDLE_INTERVAL = 20
+
+# In lazy mode, visible lines farther than this from the lexed part of the
+# document are lexed from a clean state, until the idle lexing reaches them
+APPROXIMATE_DISTANCE = 5000
+
+# Number of characters of text kept after the lexing position, so that
+# most tokens spanning several lines are matched at once, and number of
+# lines read from the document at a time
+LOOKAHEAD = 4096
+CHUNK_LINES = 100
+
+# Length of the longest token that is surely matched. A rule failing
+# on a text cut before this many characters is tried again with more.
+MAX_TOKEN_LENGTH = 64 * 1024
+
+# Number of lines past the last one to lex that a background job takes
+# from the document, enough for MAX_TOKEN_LENGTH characters with lines of
+# usual length. Doubled when a token does not fit in them.
+JOB_LINES = 4000
+
 def _getLexerInstance(filename):
     """Get the lexer instance from the filename"""
     if filename is None:
@@ -44,48 +77,661 @@ def _getLexerInstance(filename):
 
     return lexer
 
+def _supportsCheckpoints(lexer):
+    """
+    True if the lexer is a plain pygments RegexLexer, whose state is fully
+    described by its state stack. Only these lexers can be restarted from
+    the middle of the document.
+    """
+    return type(lexer).get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed
+
+class _TextWindow:
+    """
+    The text being tokenized, read as needed from an iterator of chunks
+    made of whole lines. The lines already tokenized are dropped, so only
+    a few lines around the lexing position are kept.
+    """
+    def __init__(self, chunks):
+        self.text = ""
+        self.exhausted = False
+        self._chunks = iter(chunks)
+
+    def read(self, pos, min_chars):
+        """
+        Drops the lines before pos, and reads chunks until there are at
+        least min_chars characters after it. Returns the new position.
+        """
+        cut = self.text.rfind("\n", 0, pos) + 1
+        if cut != 0:
+            self.text = self.text[cut:]
+            pos -= cut
+
+        parts = [self.text]
+        available = len(self.text) - pos
+        while not self.exhausted and available < min_chars:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.exhausted = True
+            else:
+                parts.append(chunk)
+                available += len(chunk)
+        self.text = "".join(parts)
+
+        return pos
+
+def _tokenizeLines(lexer, chunks, stack, complete=True):
+    """
+    Generator. Tokenizes text with the same algorithm of RegexLexer.get_tokens_unprocessed,
+    starting from the given state stack, and yields a tuple for every line completed:
+
+        (line_tokens, end_stack)
+
+    line_tokens is the list of (ttype, token_string) for that line.
+    end_stack is the state stack (as a tuple) at the end of the line, or None if the line
+    ends in the middle of a match, meaning that lexing cannot be restarted from the next line.
+
+    The text is read from the iterable chunks, each made of whole lines, keeping at least
+    LOOKAHEAD characters after the lexing position. A match reaching the end of the text read
+    is tried again with more text. So is a rule failing on a text cut less than
+    MAX_TOKEN_LENGTH characters after the lexing position, as its token may end further on.
+    If complete is False, chunks do not reach the end of the document, and tokenizing stops
+    where more text would be needed.
+    """
+    tokendefs = lexer._tokens
+    statestack = list(stack)
+    statetokens = tokendefs[statestack[-1]]
+    line_tokens = []
+    window = _TextWindow(chunks)
+    pos = 0
+    min_chars = LOOKAHEAD
+
+    while True:
+        if len(window.text) - pos < min_chars:
+            pos = window.read(pos, min_chars)
+            min_chars = LOOKAHEAD
+        text = window.text
+
+        completed = []
+        for rexmatch, action, new_state in statetokens:
+            m = rexmatch(text, pos)
+            if not m:
+                if len(text) - pos < MAX_TOKEN_LENGTH:
+                    if not window.exhausted:
+                        # The rule may match a long token ending in the text not
+                        # read yet. The text is read well past the limit, so this
+                        # happens once every MAX_TOKEN_LENGTH characters.
+                        min_chars = 2 * MAX_TOKEN_LENGTH
+                        break
+                    if not complete:
+                        return
+                continue
+
+            if m.end() == len(text) and not window.exhausted:
+                # The token may go on in the text not read yet
+                min_chars = 2 * (len(text) - pos)
+                break
+
+            if m.end() == len(text) and not complete:
+                return
+
+            if action is not None:
+                if type(action) is _TokenType:
+                    matched_tokens = [(action, m.group())]
+                else:
+                    matched_tokens = [(ttype, value) for _, ttype, value in action(lexer, m)]
+
+                for ttype, value in matched_tokens:
+                    for token_line in value.splitlines(True):
+                        line_tokens.append((ttype, token_line))
+                        if token_line.endswith("\n"):
+                            completed.append(line_tokens)
+                            line_tokens = []
+
+            pos = m.end()
+            if new_state is not None:
+                if isinstance(new_state, tuple):
+                    for state in new_state:
+                        if state == '#pop':
+                            if len(statestack) > 1:
+                                statestack.pop()
+                        elif state == '#push':
+                            statestack.append(statestack[-1])
+                        else:
+                            statestack.append(state)
+                elif isinstance(new_state, int):
+                    if abs(new_state) >= len(statestack):
+                        del statestack[1:]
+                    else:
+                        del statestack[new_state:]
+                elif new_state == '#push':
+                    statestack.append(statestack[-1])
+                statetokens = tokendefs[statestack[-1]]
+            break
+        else:
+            # No rule matched. At EOL the lexer resets to root.
+            if pos >= len(text):
+                if not window.exhausted:
+                    min_chars = 1
+                    continue
+                break
+
+            if text[pos] == "\n":
+                statestack = ['root']
+                statetokens = tokendefs['root']
+                line_tokens.append((token.Text, "\n"))
+                completed.append(line_tokens)
+                line_tokens = []
+            else:
+                line_tokens.append((token.Error, text[pos]))
+            pos += 1
+
+        # Only the last line completed by this step ends on a token boundary
+        # where the state is known.
+        for line in completed[:-1]:
+            yield line, None
+
+        if len(completed) != 0:
+            end_stack = tuple(statestack) if text[pos-1] == "\n" else None
+            yield completed[-1], end_stack
+
+def _textChunks(texts, chunk_lines=CHUNK_LINES):
+    """
+    Generator. Joins the line texts in chunks of chunk_lines lines.
+    """
+    for index in range(0, len(texts), chunk_lines):
+        yield "".join(texts[index:index+chunk_lines])
+
+
+class LexingDoneEvent(core.VEvent):
+    """
+    Posted to the Lexer from the worker thread when a background
+    lexing job is finished.
+    """
+    def __init__(self):
+        super().__init__(core.VEvent.EventType.NoEvent)
+
+class _LexingJob:
+    """
+    Snapshot of the data needed to lex a part of the document in the
+    background, together with the results.
+    """
+    def __init__(self, version, texts, complete, stack, first, last, limit, checkpoints):
+        self.version = version
+        self.texts = texts
+        # True if texts go to the end of the document
+        self.complete = complete
+        self.stack = stack
+        self.first = first
+        self.last = last
+        self.limit = limit
+        self.checkpoints = checkpoints
+
+        # (meta, names, end_stack) for each lexed line
+        self.lines = []
+        self.in_sync = False
+        self.cancelled = threading.Event()
+        self.future = None
+
 
-class Lexer:
+class Lexer(core.VObject):
     """
     Observes the TextDocument for changes, and performs lexing
     of its contents synchronously. The text is parsed with the
     lexer as specified by the document meta information FileType.
+
+    For pygments RegexLexers, lexing is incremental: the lexer state at
+    the end of each line is kept as a checkpoint, and after a change only
+    the lines from the first modified one are tokenized again, until the
+    lexer state matches the checkpoint recorded in the previous pass.
+    A non-greedy multi-line rule that failed to match before an edit may
+    still be tried from an earlier, unchanged line; such cases are only
+    corrected when that line is relexed.
+
+    In lazy mode, only the lines up to the visible ones (see setVisibleLines)
+    are lexed immediately. The rest of the document is lexed in small steps
+    when the event loop is idle.
+
+    In background mode, lexing runs on a worker thread against a snapshot
+    of the text. Results are applied from the event loop only if the
+    document version did not change meanwhile.
+    lexingCompleted(version) is emitted when the whole document is lexed.
+
+    After every lexing step, linesLexed(first_line, last_line) is emitted
+    with the range of lines whose tokens were set.
+
+    The names found in each line are kept, so that the SymbolLookupDb
+    is updated only for the lines that changed.
     """
-    def __init__(self):
+    def __init__(self, lazy=False, background=False):
+        super().__init__()
         self._document = None
         self._lexer = None
+        self._lazy = lazy
+        self._background = background
+
+        # Background lexing
+        self._executor = None
+        self._job = None
+        self._job_lines = JOB_LINES
+        self.lexingCompleted = core.VSignal(self)
+
+        # Indexes of the first and last visible lines, in lazy mode
+        self._visible_lines = None
+        self._idle_timer = None
+        self.linesLexed = core.VSignal(self)
+
+        # Range of line indexes lexed since linesLexed was last emitted
+        self._lexed_range = None
+
+        # State stack at the end of each line, or None if unknown.
+        self._checkpoints = []
+
+        # Range of line indexes (first, last) that must be lexed again.
+        # After last, lexing stops as soon as the state is back in sync.
+        self._dirty_range = None
 
-    def setModel(self, document):
-        """Sets the textdocument as a model for the lexer"""
+        # The symbol names found in each line, and where they are stored
+        self._line_names = []
+        self._symbol_lookup_db = None
+
+    def setModel(self, document, symbol_lookup_db=None):
+        """
+        Sets the textdocument as a model for the lexer. The symbols found
+        are stored in symbol_lookup_db, or in a private one if not given.
+        """
+        if self._document is not None:
+            self._document.changed.disconnect(self._documentChanged)
+            self._document.contentChanged.disconnect(self._lexContents)
+
+        self.close()
         self._document = document
+        if document.isReadOnly():
+            # Read-only documents can be huge. They are shown as plain
+            # text, without the per line state kept for lexing.
+            self._lexer = None
+            self._visible_lines = None
+            self._checkpoints = []
+            self._dirty_range = None
+            self._lexed_range = None
+            self._symbol_lookup_db = symbol_lookup_db if symbol_lookup_db is not None else SymbolLookupDb()
+            self._symbol_lookup_db.clear()
+            self._line_names = []
+            return
+
         filename = self._document.documentMetaInfo("Filename").data()
         self._lexer = _getLexerInstance(filename)
+        self._document.changed.connect(self._documentChanged)
         self._document.contentChanged.connect(self._lexContents)
         file_type_meta = self._document.documentMetaInfo("FileType")
         if file_type_meta.data() is None:
             file_type_meta.setData(self._lexer.name)
+
+        num_lines = self._document.numLines()
+        self._visible_lines = None
+        self._checkpoints = [None] * num_lines
+        self._dirty_range = (0, num_lines-1)
+        self._lexed_range = None
+        self._symbol_lookup_db = symbol_lookup_db if symbol_lookup_db is not None else SymbolLookupDb()
+        self._symbol_lookup_db.clear()
+        self._line_names = [()] * num_lines
         self._lexContents()
 
+    def close(self):
+        """
+        Stops the background lexing and its worker thread.
+        Meant to be called when the lexer or its model is replaced.
+        """
+        self._cancelJob()
+        self._job_lines = JOB_LINES
+        if self._executor is not None:
+            # A cancelled job stops at its next line, without being waited for
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def setVisibleLines(self, first_line, last_line):
+        """
+        In lazy mode, informs the lexer of the lines currently displayed,
+        so that they are lexed before being painted.
+        """
+        if not self._lazy:
+            return
+
+        self._visible_lines = (first_line-1, last_line-1)
+        if self._dirty_range is not None and self._dirty_range[0] <= last_line-1:
+            if self._background:
+                self._lexApproximateIfFar()
+                self._startJob()
+            else:
+                self._lexVisible()
+            self._emitLinesLexed()
+
+    def event(self, event):
+        if isinstance(event, LexingDoneEvent):
+            self._applyJob()
+            return True
+        return super().event(event)
+
+    def _documentChanged(self, change):
+        """
+        Keeps the checkpoints and the line names aligned with the document
+        lines, and marks the changed lines as needing lexing.
+        """
+        index = change.line_number - 1
+        lines_removed = change.lines_removed
+        lines_added = change.lines_added
+        checkpoints = self._checkpoints
+
+        for names in self._line_names[index:index+lines_removed]:
+            self._removeNames(names)
+        self._line_names[index:index+lines_removed] = [()] * lines_added
+
+        # The checkpoint after the last new line is the one that was after the
+        # last replaced line. It is kept to check if the lexing is back in sync.
+        if lines_removed == 0:
+            reference = ('root',) if index == 0 else checkpoints[index-1]
+        else:
+            reference = checkpoints[index+lines_removed-1]
+
+        if lines_added == 0:
+            checkpoints[index:index+lines_removed] = []
+        else:
+            checkpoints[index:index+lines_removed] = [None] * (lines_added-1) + [reference]
+
+        last = index + lines_added - 1
+        if self._dirty_range is not None:
+            dirty_first, dirty_last = self._dirty_range
+            if dirty_last >= index + lines_removed:
+                dirty_last += lines_added - lines_removed
+            elif dirty_last >= index:
+                dirty_last = last
+            index = min(index, dirty_first)
+            last = max(last, dirty_last)
+
+        self._dirty_range = (index, last)
+
     def _lexContents(self):
         """
         Perform lexing of the document every time it changes.
         Fills the meta information on the document.
         """
+        if self._background:
+            self._startJob()
+        elif self._lazy:
+            self._lexVisible()
+            self._scheduleIdleLexing()
+        else:
+            self._lex()
+        self._emitLinesLexed()
+
+    def _lexVisible(self):
+        """
+        Lexes up to the visible lines plus a margin. If they are too far
+        from the lines whose state is known, they are lexed approximately.
+        """
+        if self._lexer is None or self._dirty_range is None:
+            return
+
+        if not self._lexApproximateIfFar():
+            last_visible = self._visible_lines[1] if self._visible_lines else 0
+            self._lex(last_visible + PREFETCH_LINES)
+
+    def _lexApproximateIfFar(self):
+        """
+        Lexes the visible lines approximately if they are too far from the
+        lines whose state is known. Returns True if it did.
+        """
+        if self._visible_lines is None or not _supportsCheckpoints(self._lexer):
+            return False
+
+        first_visible, last_visible = self._visible_lines
+        if first_visible - self._restartIndex(self._dirty_range[0]) <= APPROXIMATE_DISTANCE:
+            return False
+
+        self._lexApproximate(first_visible, last_visible)
+        return True
+
+    def _startJob(self):
+        """
+        Submits the lexing of the dirty lines to the worker thread.
+        A job already running is cancelled, as its result is outdated.
+        """
+        if self._lexer is None or self._dirty_range is None:
+            return
+
+        if not _supportsCheckpoints(self._lexer):
+            self._lex()
+            self._emitLinesLexed()
+            self.lexingCompleted.emit(self._document.version())
+            return
+
+        self._cancelJob()
+
+        first, last = self._dirty_range
+        first = self._restartIndex(first)
+        limit = None
+        if self._lazy:
+            last_visible = self._visible_lines[1] if self._visible_lines else 0
+            limit = max(first + IDLE_LINES, last_visible + PREFETCH_LINES)
+
+        # Only a window of the text is taken, so the cost of a job does not
+        # depend on the size of the document
+        num_lines = self._document.numLines()
+        end = min((first if limit is None else limit) + self._job_lines, num_lines)
+        checkpoints_end = len(self._checkpoints) if limit is None else limit+1
+        job = _LexingJob(self._document.version(),
+                         self._document.linesText2(first+1, end-first),
+                         end == num_lines,
+                         ('root',) if first == 0 else self._checkpoints[first-1],
+                         first,
+                         last,
+                         limit,
+                         self._checkpoints[first:checkpoints_end])
+
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        self._job = job
+        job.future = self._executor.submit(self._runJob, job)
+        job.future.add_done_callback(self._jobDone)
 
-        if self._lexer is None:
+    def _runJob(self, job):
+        """
+        Runs on the worker thread. Only reads the job snapshot.
+        """
+        line_index = job.first
+        for line_tokens, end_stack in _tokenizeLines(self._lexer, _textChunks(job.texts), job.stack, job.complete):
+            if job.cancelled.is_set():
+                return
+
+            meta, names = self._lineMeta(line_tokens)
+            job.lines.append((meta, names, end_stack))
+
+            offset = line_index - job.first
+            old_end_stack = job.checkpoints[offset] if offset < len(job.checkpoints) else None
+            if line_index >= job.last and end_stack is not None and old_end_stack == end_stack:
+                job.in_sync = True
+                break
+
+            line_index += 1
+            if job.limit is not None and line_index > job.limit:
+                break
+
+    def _jobDone(self, future):
+        """
+        Called on the worker thread when a job is finished. The results are
+        applied on the main thread, when the event is delivered.
+        """
+        app = core.VCoreApplication.vApp
+        if app is not None:
+            app.postEvent(self, LexingDoneEvent())
+
+    def _applyJob(self):
+        """
+        Applies the results of the finished job, if still valid, and starts
+        the next one if there are lines left to lex.
+        """
+        job = self._job
+        if job is None or not job.future.done():
             return
 
+        self._job = None
+        if job.future.exception() is not None:
+            self._lex()
+            return
+
+        if job.cancelled.is_set() or job.version != self._document.version():
+            self._startJob()
+            return
+
+        for offset, (meta, names, end_stack) in enumerate(job.lines):
+            self._setLineNames(job.first+offset, names)
+            self._document.updateCharMeta((job.first+offset+1, 1), {CharMeta.LexerToken: meta})
+            self._checkpoints[job.first+offset] = end_stack
+        self._addLexedRange(job.first, job.first+len(job.lines)-1)
+
+        line_index = job.first + len(job.lines)
+        if job.in_sync or line_index >= self._document.numLines():
+            self._dirty_range = None
+            self._job_lines = JOB_LINES
+        else:
+            self._dirty_range = (line_index, max(job.last, line_index))
+            if len(job.lines) == 0:
+                # A token goes past the window: take more lines next time
+                self._job_lines *= 2
+
+        self._emitLinesLexed()
+        if self._dirty_range is None:
+            self.lexingCompleted.emit(job.version)
+        else:
+            self._startJob()
+
+    def _cancelJob(self):
+        if self._job is not None:
+            self._job.cancelled.set()
+            self._job = None
+
+    def _waitForJobs(self):
+        """
+        Waits for the background jobs and applies their results, until
+        the document is completely lexed. Used when there is no event loop.
+        """
+        while self._job is not None:
+            self._job.future.result()
+            self._applyJob()
+
+    def _idleLex(self):
+        """
+        Lexes the next group of lines when the application is idle.
+        """
+        if self._lexer is None or self._dirty_range is None:
+            return
+
+        self._lex(self._restartIndex(self._dirty_range[0]) + IDLE_LINES)
+        self._emitLinesLexed()
+        self._scheduleIdleLexing()
+
+    def _scheduleIdleLexing(self):
+        if self._dirty_range is None or core.VCoreApplication.vApp is None:
+            return
+
+        if self._idle_timer is None:
+            self._idle_timer = core.VTimer()
+            self._idle_timer.setSingleShot(True)
+            self._idle_timer.setInterval(IDLE_INTERVAL)
+            self._idle_timer.timeout.connect(self._idleLex)
+
+        # A single shot timer must be stopped before it can be started again
+        self._idle_timer.stop()
+        self._idle_timer.start()
+
+    def _lex(self, limit=None):
+        """
+        Lexes from the first dirty line, until the lexer state is back in sync
+        with the checkpoints, or after the line index limit has been lexed.
+        """
+        if self._lexer is None or self._dirty_range is None:
+            return
+
+        if not _supportsCheckpoints(self._lexer):
+            self._lexAll()
+            return
+
+        first, last = self._dirty_range
+        self._dirty_range = None
+        first = self._restartIndex(first)
+
+        stack = ('root',) if first == 0 else self._checkpoints[first-1]
+
+        # The lines are read as the lexing goes, up to a few lines past
+        # the last one tokenized
+        line_index = first
+        for line_tokens, end_stack in _tokenizeLines(self._lexer, self._documentChunks(first), stack):
+            self._applyLineTokens(line_index+1, line_tokens)
+
+            in_sync = (line_index >= last
+                       and end_stack is not None
+                       and self._checkpoints[line_index] == end_stack)
+            self._checkpoints[line_index] = end_stack
+            line_index += 1
+
+            if in_sync:
+                break
+
+            if limit is not None and line_index > limit:
+                self._dirty_range = (line_index, max(last, line_index))
+                break
+
+        self._addLexedRange(first, line_index-1)
+
+    def _lexApproximate(self, first, last):
+        """
+        Lexes the lines from first to last (indexes) starting from a clean
+        lexer state. Checkpoints are not changed, so the lines will be lexed
+        again correctly when the lexing reaches them.
+        """
+        last = min(last, self._document.numLines()-1)
+        texts = self._document.linesText2(first+1, last-first+1)
+        for offset, (line_tokens, _) in enumerate(_tokenizeLines(self._lexer, _textChunks(texts), ('root',))):
+            self._applyLineTokens(first+offset+1, line_tokens)
+        self._addLexedRange(first, last)
+
+    def _documentChunks(self, first):
+        """
+        Generator. Joins the document lines from the index first to the
+        end, in chunks of CHUNK_LINES lines.
+        """
+        num_lines = self._document.numLines()
+        for index in range(first, num_lines, CHUNK_LINES):
+            yield "".join(self._document.linesText2(index+1, min(CHUNK_LINES, num_lines-index)))
+
+    def _restartIndex(self, line_index):
+        """
+        Returns the closest line index at or before line_index where lexing
+        can restart, that is, where the state at the end of the previous line
+        is known.
+        """
+        line_index = min(line_index, self._document.numLines()-1)
+        while line_index > 0 and self._checkpoints[line_index-1] is None:
+            line_index -= 1
+        return line_index
+
+    def _lexAll(self):
+        """
+        Lexes the full document in one pass. Used for lexers that
+        cannot be restarted at a given line.
+        """
+        self._dirty_range = None
         tokens = self._lexer.get_tokens(self._document.documentText())
         current_line = 1
         current_col = 1
-        SymbolLookupDb.clear()
+        line_names = [[] for _ in range(self._document.numLines())]
         # Skip the space token
 
         tokens = self._processTokens(tokens)
         for tok in tokens:
             ttype, token_string = tok
             if ttype in [token.Name, token.Name.Class, token.Name.Function]:
-                SymbolLookupDb.add(token_string)
+                line_names[current_line-1].append(token_string)
 
             ttype = self._processToken(ttype, token_string)
 
@@ -99,6 +745,70 @@ class Lexer:
                     current_line += 1
                     current_col = 1
 
+        self._symbol_lookup_db.clear()
+        self._line_names = [()] * len(line_names)
+        for line_index, names in enumerate(line_names):
+            self._setLineNames(line_index, names)
+        self._addLexedRange(0, len(line_names)-1)
+
+    def _addLexedRange(self, first, last):
+        """
+        Adds the line indexes from first to last to the lines
+        reported at the next linesLexed.
+        """
+        if first > last:
+            return
+        if self._lexed_range is not None:
+            first = min(first, self._lexed_range[0])
+            last = max(last, self._lexed_range[1])
+        self._lexed_range = (first, last)
+
+    def _emitLinesLexed(self):
+        """
+        Emits linesLexed for the lines lexed since the last emission
+        """
+        if self._lexed_range is None:
+            return
+        first, last = self._lexed_range
+        self._lexed_range = None
+        self.linesLexed.emit(first+1, last+1)
+
+    def _applyLineTokens(self, line_number, line_tokens):
+        """
+        Set the char meta of a line from its tokens.
+        """
+        meta, names = self._lineMeta(line_tokens)
+        self._setLineNames(line_number-1, names)
+        self._document.updateCharMeta((line_number, 1), {CharMeta.LexerToken: meta})
+
+    def _setLineNames(self, line_index, names):
+        """
+        Replaces the names of a line in the SymbolLookupDb.
+        """
+        self._removeNames(self._line_names[line_index])
+        for name in names:
+            self._symbol_lookup_db.add(name)
+        self._line_names[line_index] = tuple(names)
+
+    def _removeNames(self, names):
+        for name in names:
+            self._symbol_lookup_db.remove(name)
+
+    def _lineMeta(self, line_tokens):
+        """
+        Returns the char meta for a line from its tokens, and the names
+        found in it. Does not modify anything, so it can run in the worker.
+        """
+        runs = []
+        names = []
+        for ttype, token_string in self._processTokens(line_tokens):
+            if ttype in [token.Name, token.Name.Class, token.Name.Function]:
+                names.append(token_string)
+
+            runs.append((self._processToken(ttype, token_string), len(token_string)))
+
+        return RunLengthList.fromRuns(runs), names
+
     def _processToken(self, ttype, token_string):
         if token_string.startswith("__") and token_string.endswith("__") and ttype is token.Name.Function:
             return token.Name.Function.PythonMagic
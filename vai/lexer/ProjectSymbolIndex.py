@@ -0,0 +1,301 @@
+from vaitk import core
+from .Lexer import EXTENSION_TO_LEXER, _getLexerInstance
+from . import token
+from .. import paths
+from ..SymbolLookupDb import SymbolLookupDb
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import threading
+
+_logger = logging.getLogger(__name__)
+
+# Version of the cache file format
+CACHE_VERSION = 1
+
+# Files bigger than this (in bytes) are not indexed, as they are
+# usually generated
+MAX_FILE_SIZE = 1024 * 1024
+
+# Maximum number of files indexed in a project
+MAX_FILES = 20000
+
+class ScanDoneEvent(core.VEvent):
+    """
+    Posted to the ProjectSymbolIndex from the scanning thread
+    when a scan is finished.
+    """
+    def __init__(self):
+        super().__init__(core.VEvent.EventType.NoEvent)
+
+class ProjectSymbolIndex(core.VObject):
+    """
+    Index of the symbols defined in the source files of a project directory,
+    for completion. The files recognized by the lexer extensions are
+    tokenized in a process pool, and the names found in each file are kept
+    in a cache file, together with the file mtime and size. When the
+    project is scanned again, only the new or changed files are tokenized.
+
+    Scanning happens on a separate thread. The results are applied to
+    symbol_lookup_db from the event loop, then scanCompleted is emitted.
+    A scan that fails is logged, and the symbols are left as they were.
+    Every name counts once per file where it appears.
+    """
+    def __init__(self, project_dir, cache_file=None):
+        super().__init__()
+        self._project_dir = os.path.abspath(project_dir)
+        self._cache_file = cache_file
+        self._symbol_lookup_db = SymbolLookupDb()
+
+        # path -> (mtime, size, names) of the indexed files
+        self._files = {}
+
+        self._executor = None
+        self._future = None
+        self._cancelled = threading.Event()
+        self._rescan = False
+        self.scanCompleted = core.VSignal(self)
+
+    @property
+    def project_dir(self):
+        return self._project_dir
+
+    @property
+    def symbol_lookup_db(self):
+        return self._symbol_lookup_db
+
+    def contains(self, filename):
+        """
+        True if filename is inside the project directory
+        """
+        path = os.path.abspath(filename)
+        return os.path.commonprefix([path, self._project_dir + os.sep]) == self._project_dir + os.sep
+
+    def scan(self):
+        """
+        Starts scanning the project directory for new, changed and removed
+        files. If a scan is already running, another one follows it.
+        """
+        if self._future is not None:
+            self._rescan = True
+            return
+
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        if self._cache_file is None:
+            self._cache_file = paths.symbolIndexFile(self._project_dir)
+
+        self._future = self._executor.submit(_scanProject, self._project_dir, self._cache_file, self._cancelled)
+        self._future.add_done_callback(self._scanDone)
+
+    def close(self):
+        """
+        Stops the running scan, if any, and the scanning thread.
+        Meant to be called when the index is no longer used.
+        """
+        self._cancelled.set()
+        self._future = None
+        self._rescan = False
+        if self._executor is not None:
+            _shutdown(self._executor)
+            self._executor = None
+
+    def event(self, event):
+        if isinstance(event, ScanDoneEvent):
+            self._applyScan()
+            return True
+        return super().event(event)
+
+    def _scanDone(self, future):
+        """
+        Called on the scanning thread. The results are applied on the main
+        thread, when the event is delivered.
+        """
+        app = core.VCoreApplication.vApp
+        if app is not None:
+            app.postEvent(self, ScanDoneEvent())
+
+    def _applyScan(self):
+        """
+        Updates the symbols database with the files that changed
+        since the previous scan.
+        """
+        future = self._future
+        if future is None or not future.done():
+            return
+
+        self._future = None
+        if future.exception() is not None:
+            _logger.error("Scan of project %s failed", self._project_dir,
+                          exc_info=future.exception())
+        else:
+            files = future.result()
+            old_files = self._files
+            for path, (_, _, names) in old_files.items():
+                if files.get(path) != old_files[path]:
+                    for name in names:
+                        self._symbol_lookup_db.remove(name)
+
+            for path, (_, _, names) in files.items():
+                if old_files.get(path) != files[path]:
+                    for name in names:
+                        self._symbol_lookup_db.add(name)
+
+            self._files = files
+            self.scanCompleted.emit()
+
+        if self._rescan:
+            self._rescan = False
+            self.scan()
+
+    def _waitForScan(self):
+        """
+        Waits for the running scan and applies its results.
+        Used when there is no event loop.
+        """
+        while self._future is not None:
+            self._future.exception()
+            self._applyScan()
+
+def _scanProject(project_dir, cache_file, cancelled):
+    """
+    Runs on the scanning thread. Returns the new table of the indexed files,
+    tokenizing only the files not found in the cache, and updates the cache.
+    Returns None, without touching the cache, if cancelled is set meanwhile.
+    """
+    cached = _readCache(cache_file, project_dir)
+
+    files = {}
+    to_tokenize = []
+    for path, mtime, size in _projectFiles(project_dir):
+        entry = cached.get(path)
+        if entry is not None and entry[0] == mtime and entry[1] == size:
+            files[path] = entry
+        else:
+            to_tokenize.append((path, mtime, size))
+
+    if cancelled.is_set():
+        return None
+
+    if len(to_tokenize) != 0:
+        pool = _processPool()
+        try:
+            all_names = pool.map(_fileSymbols, [path for path, _, _ in to_tokenize], chunksize=16)
+            for (path, mtime, size), names in zip(to_tokenize, all_names):
+                if cancelled.is_set():
+                    return None
+                files[path] = (mtime, size, tuple(names))
+        finally:
+            _shutdown(pool)
+
+    if files != cached:
+        _writeCache(cache_file, project_dir, files)
+
+    return files
+
+def _processPool():
+    """
+    Returns the pool tokenizing the files. Its processes are not forked
+    from this one, which has other threads running.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    try:
+        return concurrent.futures.ProcessPoolExecutor(mp_context=context)
+    except TypeError:
+        # Before python 3.7, the start method cannot be chosen per pool
+        return concurrent.futures.ProcessPoolExecutor()
+
+def _shutdown(executor):
+    """
+    Shuts down executor without waiting, dropping the work not started
+    """
+    try:
+        executor.shutdown(wait=False, cancel_futures=True)
+    except TypeError:
+        # Before python 3.9, the pending work cannot be dropped
+        executor.shutdown(wait=False)
+
+def _projectFiles(project_dir):
+    """
+    Generator. Yields (path, mtime, size) for the files in the project
+    that the lexer recognizes, skipping hidden directories.
+    """
+    count = 0
+    for dirpath, dirnames, filenames in os.walk(project_dir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and d != "__pycache__")
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1] not in EXTENSION_TO_LEXER:
+                continue
+
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            if stat.st_size > MAX_FILE_SIZE:
+                continue
+
+            yield path, stat.st_mtime, stat.st_size
+            count += 1
+            if count >= MAX_FILES:
+                return
+
+def _fileSymbols(path):
+    """
+    Runs in the process pool. Returns the sorted names found in a file,
+    or none if the file cannot be read or tokenized.
+    """
+    names = set()
+    try:
+        with open(path, "r", errors="replace") as f:
+            text = f.read()
+
+        lexer = _getLexerInstance(path)
+        for ttype, token_string in lexer.get_tokens(text):
+            if ttype in [token.Name, token.Name.Class, token.Name.Function]:
+                names.add(token_string)
+    except Exception:
+        # A single bad file must not stop the scan of the project
+        return []
+
+    return sorted(names)
+
+def _readCache(cache_file, project_dir):
+    """
+    Returns the files table stored in the cache, or an empty
+    table if the cache is missing or not usable.
+    """
+    try:
+        with open(cache_file, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if data.get("version") != CACHE_VERSION or data.get("project_dir") != project_dir:
+        return {}
+
+    return { path: (mtime, size, tuple(names)) for path, (mtime, size, names) in data["files"].items() }
+
+def _writeCache(cache_file, project_dir, files):
+    """
+    Writes the files table to the cache. The file is replaced atomically,
+    so that a concurrent reader never finds it half written.
+    """
+    data = {
+        "version": CACHE_VERSION,
+        "project_dir": project_dir,
+        "files": { path: [mtime, size, list(names)] for path, (mtime, size, names) in files.items() }
+    }
+
+    temp_file = cache_file + ".tmp"
+    try:
+        with open(temp_file, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_file, cache_file)
+    except OSError:
+        pass
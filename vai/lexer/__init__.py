@@ -1,2 +1,3 @@
 from .Lexer import Lexer
+from .ProjectSymbolIndex import ProjectSymbolIndex
 
@@ -4,16 +4,23 @@ from .TextDocument import TextDocument
 from .TextDocumentCursor import TextDocumentCursor
 from .EditAreaModel import EditAreaModel
 from .CommandHistory import CommandHistory
+from .Configuration import Configuration
 from .Selection import Selection
+from .LineHashTree import LineHashTree
+from ..SymbolLookupDb import SymbolLookupDb
 
 class Buffer:
     """
     Represents an editable buffer, and contains the document, the cursor
     position, the command history, and all the state that is local to a
-    specific buffer.
+    specific buffer. The optional storage is handed to the TextDocument.
+
+    Unless the document is read-only, its lines are hashed in a
+    LineHashTree. After every command, undo and redo, the buffer is
+    modified if and only if its text differs from the saved one.
     """
-    def __init__(self):
-        self._document = TextDocument()
+    def __init__(self, storage=None):
+        self._document = TextDocument(storage)
         self._document.createDocumentMetaInfo("Modified", False)
         self._document.createDocumentMetaInfo("Filename", None)
         self._document.createDocumentMetaInfo("InitialMD5", None)
@@ -23,8 +30,22 @@ class Buffer:
         self._document.createLineMetaInfo("Bookmark")
         self._document_cursor = TextDocumentCursor(self._document)
         self._edit_area_model = EditAreaModel()
-        self._command_history = CommandHistory()
+        self._command_history = CommandHistory(Configuration.get("undo.max_steps"),
+                                               Configuration.get("undo.max_memory"))
         self._selection = Selection()
+        self._symbol_lookup_db = SymbolLookupDb()
+        self._undo_journal = None
+        self._loader = None
+        self._saver = None
+
+        self._line_hashes = None
+        if not self._document.isReadOnly():
+            self._line_hashes = LineHashTree(self._document)
+        self._saved_digest = self.digest()
+
+        self._command_history.commandAdded.connect(self._updateModified)
+        self._command_history.commandUndone.connect(self._updateModified)
+        self._command_history.commandRedone.connect(self._updateModified)
 
     def isEmpty(self):
         """
@@ -32,12 +53,37 @@ class Buffer:
         """
         return self._document.isEmpty()
 
+    def isReadOnly(self):
+        """
+        Returns True if the document can not be modified
+        """
+        return self._document.isReadOnly()
+
     def isModified(self):
         """
         Returns True if the document is modified
         """
         return self._document.documentMetaInfo("Modified").data()
 
+    def digest(self):
+        """
+        Returns a value identifying the current text, as given by
+        LineHashTree.digest, or None for a read-only document
+        """
+        if self._line_hashes is None:
+            return None
+        return self._line_hashes.digest()
+
+    def markSaved(self, digest=None):
+        """
+        Records the text with the given digest, by default the current
+        one, as the text of the file. The buffer is modified if the current
+        text is different, as after a save in the background.
+        Meant to be called once the file is read or written.
+        """
+        self._saved_digest = self.digest() if digest is None else digest
+        self._document.documentMetaInfo("Modified").setData(self.digest() != self._saved_digest)
+
     @property
     def document(self):
         return self._document
@@ -58,3 +104,48 @@ class Buffer:
     def selection(self):
         return self._selection
 
+    @property
+    def symbol_lookup_db(self):
+        return self._symbol_lookup_db
+
+    @property
+    def undo_journal(self):
+        """
+        The UndoJournal keeping the command history across
+        sessions, or None
+        """
+        return self._undo_journal
+
+    @undo_journal.setter
+    def undo_journal(self, undo_journal):
+        self._undo_journal = undo_journal
+
+    @property
+    def loader(self):
+        """
+        The DocumentLoader still reading the file of the document, or None
+        """
+        return self._loader
+
+    @loader.setter
+    def loader(self, loader):
+        self._loader = loader
+
+    @property
+    def saver(self):
+        """
+        The DocumentSaver still writing the file of the document, or None
+        """
+        return self._saver
+
+    @saver.setter
+    def saver(self, saver):
+        self._saver = saver
+
+    # Private
+
+    def _updateModified(self, *args):
+        if self._line_hashes is None:
+            return
+
+        self._document.documentMetaInfo("Modified").setData(self.digest() != self._saved_digest)
@@ -1,20 +1,86 @@
+from vaitk import core
+import collections
+from .commands.BufferCommand import BufferCommand
+
 class CommandHistory:
-    def __init__(self):
-        self._past = []
-        self._future = []
+    """
+    The executed commands that can be undone (past), and the undone
+    commands that can be redone (future).
+
+    A command added right after another one can be merged into it, so that
+    a typing run is undone in a single step. The oldest commands are
+    dropped when there are more than max_steps commands, or when the memory
+    they keep goes above max_memory bytes. None means no limit.
+
+    commandAdded is emitted with the command, whether it was merged into
+    the previous one, and how many old commands were dropped. commandUndone
+    and commandRedone are emitted by undo and redo, once the command has
+    changed the document.
+    """
+    def __init__(self, max_steps=None, max_memory=None):
+        self._max_steps = max_steps
+        self._max_memory = max_memory
+
+        # (command, memory usage) pairs, oldest first
+        self._past = collections.deque()
+        self._future = collections.deque()
+        self._memory_usage = 0
+
+        self.commandAdded = core.VSignal(self)
+        self.commandUndone = core.VSignal(self)
+        self.commandRedone = core.VSignal(self)
 
     def add(self, command):
-        self._past.append(command)
-        self._future = []
+        # After an undo, a new command always starts a new step
+        can_merge = len(self._past) != 0 and len(self._future) == 0
+
+        for _, usage in self._future:
+            self._memory_usage -= usage
+        self._future.clear()
+
+        if can_merge:
+            last, usage = self._past[-1]
+            if isinstance(last, BufferCommand) and last.mergeWith(command):
+                new_usage = _memoryUsage(last)
+                self._past[-1] = (last, new_usage)
+                self._memory_usage += new_usage - usage
+                self.commandAdded.emit(command, True, 0)
+                return
+
+        usage = _memoryUsage(command)
+        self._past.append((command, usage))
+        self._memory_usage += usage
+        num_evicted = self._evict()
+        self.commandAdded.emit(command, False, num_evicted)
 
     def prev(self):
-        command = self._past.pop(-1)
-        self._future.insert(0, command)
-        return command
+        entry = self._past.pop()
+        self._future.appendleft(entry)
+        return entry[0]
 
     def next(self):
-        command = self._future.pop(0)
-        self._past.append(command)
+        entry = self._future.popleft()
+        self._past.append(entry)
+        return entry[0]
+
+    def undo(self):
+        """
+        Undoes the last command, and returns it.
+        Raises IndexError if there is nothing to undo.
+        """
+        command = self.prev()
+        command.undo()
+        self.commandUndone.emit(command)
+        return command
+
+    def redo(self):
+        """
+        Executes again the last undone command, and returns it.
+        Raises IndexError if there is nothing to redo.
+        """
+        command = self.next()
+        command.execute()
+        self.commandRedone.emit(command)
         return command
 
     def numUndoableCommands(self):
@@ -22,3 +88,34 @@ class CommandHistory:
 
     def numRedoableCommands(self):
         return len(self._future)
+
+    def memoryUsage(self):
+        """
+        Returns an estimate of the memory, in bytes, kept by the commands
+        """
+        return self._memory_usage
+
+    def _evict(self):
+        """
+        Drops the oldest commands until the history is within its
+        limits. The last command is always kept. Returns how many
+        commands were dropped.
+        """
+        num_evicted = 0
+        while len(self._past) > 1:
+            too_many = self._max_steps is not None and len(self._past) > self._max_steps
+            too_big = self._max_memory is not None and self._memory_usage > self._max_memory
+            if not (too_many or too_big):
+                break
+
+            _, usage = self._past.popleft()
+            self._memory_usage -= usage
+            num_evicted += 1
+
+        return num_evicted
+
+def _memoryUsage(command):
+    # Other objects (e.g. mocks in tests) are not accounted
+    if isinstance(command, BufferCommand):
+        return command.memoryUsage()
+    return 0
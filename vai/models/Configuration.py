@@ -12,6 +12,12 @@ class Configuration:
                  "colors.side_ruler.fg"     : "cyan",
                  "colors.side_ruler.bg"     : "transparent",
                  "icons.collection"         : "unicode1",
+                 "completion.all_buffers"   : False,
+                 "completion.project_index" : False,
+                 "search.regex"             : False,
+                 "undo.max_steps"           : 10000,
+                 "undo.max_memory"          : 64 * 1024 * 1024,
+                 "undo.journal_max_size"    : 1024 * 1024,
                  }
 
     # Singleton
@@ -67,8 +73,8 @@ class Configuration:
     def get(cls, key):
         # We override, but not alter, the configuration if the current encoding
         # is not supporting utf-8 encoding, or if we don't have wide ncurses
-        if (key == "icons.collection" and locale.getpreferredencoding(False) != "UTF-8") \
-            or not cls.flags.get("has_wide_ncurses"):
+        if key == "icons.collection" and (locale.getpreferredencoding(False) != "UTF-8"
+                                          or not cls.flags.get("has_wide_ncurses")):
             return "ascii"
         return cls.instance()[key]
 
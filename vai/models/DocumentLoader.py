@@ -0,0 +1,207 @@
+import hashlib
+import io
+import os
+from vaitk import core
+
+EOL = '\n'
+
+# Number of characters read before the document is first shown
+FIRST_CHUNK_SIZE = 64 * 1024
+
+# Number of characters read at every following step, and delay in
+# msecs between steps, letting the events in
+CHUNK_SIZE = 1024 * 1024
+LOAD_INTERVAL = 1
+
+# Number of bytes indexed at every step, for a read-only document
+INDEX_CHUNK_SIZE = 16 * 1024 * 1024
+
+class DocumentLoader:
+    """
+    Reads a file into a TextDocument in chunks. The first chunk replaces
+    the document content, so the first lines can be shown at once, and
+    the lines of the next chunks are appended when the application is
+    idle. Without an event loop, the whole file is read by start.
+
+    A read-only document maps the file instead, and only its line index
+    is built in chunks, of INDEX_CHUNK_SIZE bytes.
+
+    The md5 of the text is computed along the way, except for read-only
+    documents. progress is emitted after each chunk with the number of
+    bytes read and the file size, and finished once the load is over,
+    either completed, cancelled or failed on a read error. In the last
+    two cases, the document only holds the lines read so far.
+    """
+    def __init__(self, document, chunk_size=CHUNK_SIZE, first_chunk_size=FIRST_CHUNK_SIZE):
+        self._document = document
+        self._chunk_size = chunk_size
+        self._first_chunk_size = first_chunk_size
+
+        self._file = None
+        self._leftover = ""
+        self._has_lines = False
+        self._md5 = hashlib.md5()
+        self._bytes_read = 0
+        self._total_bytes = 0
+        self._cancelled = False
+        self._error = None
+        self._timer = None
+
+        self.progress = core.VSignal(self)
+        self.finished = core.VSignal(self)
+
+    def start(self, filename):
+        """
+        Opens the file and reads the first chunk. Errors opening the file
+        are raised.
+        """
+        self._file = open(filename, "r")
+        try:
+            self._total_bytes = os.fstat(self._file.fileno()).st_size
+        except OSError:
+            pass
+
+        if self._document.isReadOnly():
+            self._document.read(self._file)
+            self._md5 = None
+
+        self._loadChunk(self._first_chunk_size)
+        self._scheduleNextChunk()
+
+    def cancel(self):
+        """
+        Stops reading. The document keeps the lines read so far.
+        """
+        if self._file is None:
+            return
+
+        self._cancelled = True
+        self._finish()
+
+    def isLoading(self):
+        return self._file is not None
+
+    def isCancelled(self):
+        return self._cancelled
+
+    def isComplete(self):
+        """
+        True if the whole file was read
+        """
+        return self._file is None and not self._cancelled and self._error is None
+
+    def error(self):
+        """
+        The exception that stopped the load, or None
+        """
+        return self._error
+
+    def md5(self):
+        """
+        The hashlib md5 object of the text read so far, or None
+        for a read-only document
+        """
+        return self._md5
+
+    def bytesRead(self):
+        return self._bytes_read
+
+    def totalBytes(self):
+        return self._total_bytes
+
+    # Private
+
+    def _loadChunk(self, chunk_size):
+        """
+        Reads a chunk and adds its whole lines to the document. The last,
+        incomplete line is kept until the next chunk.
+        """
+        if self._document.isReadOnly():
+            self._indexChunk()
+            return
+
+        try:
+            chunk = self._file.read(chunk_size)
+        except Exception as e:
+            self._error = e
+            self._finish()
+            return
+
+        text = self._leftover + chunk
+        if len(chunk) == 0:
+            self._leftover = ""
+            if len(text) != 0:
+                text += EOL
+        else:
+            cut = text.rfind(EOL) + 1
+            text, self._leftover = text[:cut], text[cut:]
+
+        if not self._has_lines:
+            # The document is replaced only once there is a line
+            # to show, or if the file is empty
+            if len(text) != 0 or len(chunk) == 0:
+                self._document.read(io.StringIO(text))
+                self._has_lines = True
+        elif len(text) != 0:
+            self._document.appendText(text)
+
+        data = text.encode("utf-8")
+        self._md5.update(data)
+        self._bytes_read += len(data)
+        self.progress.emit(self._bytes_read, self._total_bytes)
+
+        if len(chunk) == 0:
+            self._finish()
+
+    def _indexChunk(self):
+        try:
+            indexed = self._document.indexMore(INDEX_CHUNK_SIZE)
+        except Exception as e:
+            self._error = e
+            self._finish()
+            return
+
+        self._bytes_read = self._document.storage().indexedSize()
+        self.progress.emit(self._bytes_read, self._total_bytes)
+
+        if indexed:
+            self._finish()
+
+    def _idleLoad(self):
+        if self._file is None:
+            return
+
+        self._loadChunk(self._chunk_size)
+        self._scheduleNextChunk()
+
+    def _scheduleNextChunk(self):
+        if self._file is None:
+            return
+
+        if core.VCoreApplication.vApp is None:
+            while self._file is not None:
+                self._loadChunk(self._chunk_size)
+            return
+
+        if self._timer is None:
+            self._timer = core.VTimer()
+            self._timer.setSingleShot(True)
+            self._timer.setInterval(LOAD_INTERVAL)
+            self._timer.timeout.connect(self._idleLoad)
+
+        # A single shot timer must be stopped before it can be started again
+        self._timer.stop()
+        self._timer.start()
+
+    def _finish(self):
+        if self._file is None:
+            # Already cancelled by a progress slot
+            return
+
+        if self._timer is not None:
+            self._timer.stop()
+
+        self._file.close()
+        self._file = None
+        self._leftover = ""
+        self.finished.emit()
@@ -34,6 +34,11 @@ class DocumentMetaInfo:
             self.notifyObservers()
 
     def notifyObservers(self):
+        # During a transaction, the observers are notified at its end
+        if self._document.isInTransaction():
+            self._document.deferNotification(self)
+            return
+
         self.contentChanged.emit(self._data)
 
     @property
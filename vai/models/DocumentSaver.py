@@ -0,0 +1,211 @@
+import hashlib
+import os
+import stat
+import tempfile
+import threading
+from vaitk import core
+
+# Number of lines joined and written at a time
+CHUNK_LINES = 4096
+
+# Delay in msecs between checks of a background save
+POLL_INTERVAL = 20
+
+class DocumentSaver:
+    """
+    Writes a TextDocument to a file, without ever leaving the file
+    truncated. The lines are written in chunks to a temporary file in the
+    same directory, which is synced to disk and then renamed over the file,
+    with the mode and owner of the file. If anything fails, the file is
+    left untouched.
+
+    A new file, a file with hard links, or a file in a directory where the
+    temporary file cannot be created, is written in place instead. A new
+    file is removed if the save fails, the others may be left truncated.
+
+    start takes a snapshot of the text, so the document can be modified
+    while the snapshot is written by a background thread. Without an event
+    loop, or if asked, the file is written by start. finished is emitted
+    once the save is over, successful or not.
+
+    The md5 of the text written is computed along the way.
+    """
+    def __init__(self, document):
+        self._document = document
+        self._parts = None
+        self._filename = None
+        self._md5 = hashlib.md5()
+        self._error = None
+        self._thread = None
+        self._timer = None
+
+        self.finished = core.VSignal(self)
+
+    def start(self, filename, background=True):
+        """
+        Takes the snapshot of the document and starts writing it.
+        """
+        # Write through symbolic links, instead of replacing them
+        self._filename = os.path.realpath(filename)
+        self._parts = self._document.snapshot()
+
+        if not background or core.VCoreApplication.vApp is None:
+            self._write()
+            self._finish()
+            return
+
+        self._thread = threading.Thread(target=self._write)
+        self._thread.start()
+
+        self._timer = core.VTimer()
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(POLL_INTERVAL)
+        self._timer.timeout.connect(self._poll)
+        self._timer.start()
+
+    def isSaving(self):
+        return self._parts is not None
+
+    def isComplete(self):
+        """
+        True if the file was written successfully
+        """
+        return self._parts is None and self._filename is not None and self._error is None
+
+    def error(self):
+        """
+        The exception that stopped the save, or None
+        """
+        return self._error
+
+    def md5(self):
+        """
+        The hashlib md5 object of the text written
+        """
+        return self._md5
+
+    def filename(self):
+        return self._filename
+
+    # Private
+
+    def _write(self):
+        """
+        Writes the snapshot. Runs in the background thread, if any.
+        """
+        try:
+            info = os.stat(self._filename)
+        except OSError:
+            info = None
+
+        if info is None or info.st_nlink > 1:
+            # A new file gets its mode from the umask, and hard links
+            # must keep sharing the file
+            self._writeInPlace(remove_on_error=info is None)
+            return
+
+        directory = os.path.dirname(self._filename)
+        try:
+            fd, temp_filename = tempfile.mkstemp(prefix="."+os.path.basename(self._filename)+".",
+                                                 suffix=".tmp",
+                                                 dir=directory)
+        except OSError:
+            # The directory may not be writable, while the file is
+            self._writeInPlace(remove_on_error=False)
+            return
+
+        try:
+            with open(fd, "w") as f:
+                self._writeChunks(f)
+
+            os.chmod(temp_filename, stat.S_IMODE(info.st_mode))
+            _copyOwner(temp_filename, info)
+            os.replace(temp_filename, self._filename)
+            temp_filename = None
+            _syncDirectory(directory)
+        except Exception as e:
+            self._error = e
+        finally:
+            if temp_filename is not None:
+                try:
+                    os.remove(temp_filename)
+                except OSError:
+                    pass
+
+    def _writeInPlace(self, remove_on_error):
+        try:
+            with open(self._filename, "w") as f:
+                self._writeChunks(f)
+        except Exception as e:
+            self._error = e
+            if remove_on_error:
+                try:
+                    os.remove(self._filename)
+                except OSError:
+                    pass
+
+    def _writeChunks(self, f):
+        for text in _chunks(self._parts):
+            f.write(text)
+            self._md5.update(text.encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _poll(self):
+        if self._thread.is_alive():
+            # A single shot timer must be stopped before it can be started again
+            self._timer.stop()
+            self._timer.start()
+            return
+
+        self._thread.join()
+        self._thread = None
+        self._finish()
+
+    def _finish(self):
+        self._parts = None
+        if self._error is None:
+            self._document.documentSaved.emit()
+        self.finished.emit()
+
+def _copyOwner(filename, info):
+    # Only possible for the owner of the file, or for root. Otherwise
+    # the file gets the user as owner.
+    if not hasattr(os, "chown"):
+        return
+
+    try:
+        os.chown(filename, info.st_uid, info.st_gid)
+    except OSError:
+        pass
+
+def _chunks(parts):
+    """
+    Generator. Yields the text of the snapshot parts, joining
+    the line texts CHUNK_LINES at a time
+    """
+    for part in parts:
+        if isinstance(part, str):
+            yield part
+            continue
+
+        for index in range(0, len(part), CHUNK_LINES):
+            yield "".join(part[index:index+CHUNK_LINES])
+
+def _syncDirectory(directory):
+    # Makes the rename durable. Not possible on every platform, and
+    # the file is saved anyway.
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+
+    try:
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,168 @@
+# Lines per leaf when leaves are built. A leaf holds at most
+# twice as many lines before it is split.
+LEAF_SIZE = 64
+
+# Prime modulus and base of the polynomial hash combining the line hashes
+_MODULUS = (1 << 61) - 1
+_BASE = 0x5DEECE66D
+
+# Hash, base power and number of lines of an empty range
+_EMPTY = (0, 1, 0)
+
+class LineHashTree:
+    """
+    Merkle tree over the lines of a TextDocument, kept up to date as the
+    document changes. digest identifies the whole text, so that two states
+    of the document can be compared without going through the lines.
+
+    The leaves are groups of line hashes, and each node keeps the hash of
+    its lines as a polynomial in _BASE. The hash of two adjacent ranges is
+    found from theirs, so it does not depend on how the lines are grouped:
+    the same text always gives the same digest. A change rehashes the lines
+    it touches, their leaf and the nodes above it.
+
+    The line hashes come from the builtin hash, so digests can only be
+    compared within the same process.
+    """
+    def __init__(self, document):
+        self._document = document
+        self.reset()
+        self._document.changed.connect(self._documentChanged)
+
+    def digest(self):
+        """
+        Returns a value identifying the text of the document. Equal texts
+        give equal digests, different texts almost surely do not.
+        """
+        return (self._hashes[1], self._counts[1])
+
+    def numLines(self):
+        return self._counts[1]
+
+    def reset(self):
+        """
+        Hashes again all the lines of the document
+        """
+        texts = self._document.iterLinesText(1, self._document.numLines())
+        self._leaves = _chunked([_lineHash(text) for text in texts]) or [[]]
+        self._leaf_nodes = [_leafHash(leaf) for leaf in self._leaves]
+        self._rebuild()
+
+    def replaceLines(self, index, how_many, texts):
+        """
+        Replaces the how_many line hashes starting at the zero based
+        index with the hashes of texts.
+        Meant to be called when the document changes.
+        """
+        hashes = [_lineHash(text) for text in texts]
+        leaf_index, offset = self._findLeaf(index)
+        leaf = self._leaves[leaf_index]
+
+        if offset + how_many <= len(leaf) and 0 < len(leaf) - how_many + len(hashes) <= 2*LEAF_SIZE:
+            leaf[offset:offset+how_many] = hashes
+            self._leaf_nodes[leaf_index] = _leafHash(leaf)
+            self._updateNodes(leaf_index, leaf_index+1)
+            return
+
+        # The lines of the leaves touched are grouped again
+        last_index = leaf_index
+        end = offset + how_many
+        while end > len(self._leaves[last_index]):
+            end -= len(self._leaves[last_index])
+            last_index += 1
+
+        lines = leaf[:offset] + hashes + self._leaves[last_index][end:]
+        new_leaves = _chunked(lines)
+        if len(new_leaves) == 0 and len(self._leaves) == last_index-leaf_index+1:
+            new_leaves = [[]]
+
+        old_num_leaves = len(self._leaves)
+        self._leaves[leaf_index:last_index+1] = new_leaves
+        self._leaf_nodes[leaf_index:last_index+1] = [_leafHash(leaf) for leaf in new_leaves]
+
+        if len(self._leaves) > self._capacity:
+            self._rebuild()
+        elif len(self._leaves) == old_num_leaves:
+            self._updateNodes(leaf_index, last_index+1)
+        else:
+            # The following leaves moved, but their hashes are the same
+            self._updateNodes(leaf_index, max(len(self._leaves), old_num_leaves))
+
+    # Private
+
+    def _documentChanged(self, change):
+        texts = []
+        if change.lines_added != 0:
+            texts = self._document.iterLinesText(change.line_number, change.lines_added)
+        self.replaceLines(change.line_number-1, change.lines_removed, texts)
+
+    def _rebuild(self):
+        self._capacity = 1
+        while self._capacity < len(self._leaves):
+            self._capacity *= 2
+
+        self._hashes = [0] * (2*self._capacity)
+        self._powers = [1] * (2*self._capacity)
+        self._counts = [0] * (2*self._capacity)
+        self._updateNodes(0, len(self._leaves))
+
+    def _updateNodes(self, start, end):
+        """
+        Computes again the nodes of the leaves between start and end,
+        and the nodes above them
+        """
+        capacity = self._capacity
+        for position in range(start, end):
+            node = capacity + position
+            if position < len(self._leaf_nodes):
+                node_hash, power, count = self._leaf_nodes[position]
+            else:
+                node_hash, power, count = _EMPTY
+            self._hashes[node] = node_hash
+            self._powers[node] = power
+            self._counts[node] = count
+
+        start += capacity
+        end += capacity
+        while start > 1:
+            start //= 2
+            end = (end + 1) // 2
+            for node in range(start, end):
+                left = 2 * node
+                right = left + 1
+                self._hashes[node] = (self._hashes[left] * self._powers[right] + self._hashes[right]) % _MODULUS
+                self._powers[node] = self._powers[left] * self._powers[right] % _MODULUS
+                self._counts[node] = self._counts[left] + self._counts[right]
+
+    def _findLeaf(self, index):
+        """
+        Returns the position of the leaf holding the line at index, and
+        the position of the line in the leaf. An index past the last line
+        gives the end of the last leaf.
+        """
+        if index >= self._counts[1]:
+            return (len(self._leaves)-1, len(self._leaves[-1]))
+
+        node = 1
+        while node < self._capacity:
+            left = 2 * node
+            if index < self._counts[left]:
+                node = left
+            else:
+                index -= self._counts[left]
+                node = left + 1
+
+        return (node - self._capacity, index)
+
+def _lineHash(text):
+    # Never 0, so that leading lines count in the polynomial
+    return hash(text) % (_MODULUS - 1) + 1
+
+def _leafHash(hashes):
+    leaf_hash = 0
+    for line_hash in hashes:
+        leaf_hash = (leaf_hash * _BASE + line_hash) % _MODULUS
+    return (leaf_hash, pow(_BASE, len(hashes), _MODULUS), len(hashes))
+
+def _chunked(hashes):
+    return [hashes[i:i+LEAF_SIZE] for i in range(0, len(hashes), LEAF_SIZE)]
@@ -0,0 +1,41 @@
+class LineMarker:
+    """
+    A value attached to a line of a document by a LineMetaInfo, such as
+    a bookmark or a lint result. The marker follows its line when lines
+    are inserted or deleted before it. It stops being valid when its
+    line is deleted or its value is removed.
+    """
+    def __init__(self, line_index, value):
+        self._line_index = line_index
+        self._value = value
+
+    @property
+    def line(self):
+        """
+        The current line number, or None if the marker is no longer valid
+        """
+        if self._line_index is None:
+            return None
+        return self._line_index + 1
+
+    @property
+    def value(self):
+        return self._value
+
+    def isValid(self):
+        return self._line_index is not None
+
+    # Meant to be called by LineMetaInfo.
+    def shift(self, how_many):
+        self._line_index += how_many
+
+    # Meant to be called by LineMetaInfo.
+    def setValue(self, value):
+        self._value = value
+
+    # Meant to be called by LineMetaInfo.
+    def invalidate(self):
+        self._line_index = None
+
+    def __repr__(self):
+        return "LineMarker(line=%s, value=%r)" % (self.line, self._value)
@@ -1,38 +1,73 @@
 from vaitk import core
+import bisect
 import collections
 import copy
+from .LineMarker import LineMarker
 
 # New class to store meta information in a separate
 # object, so that we can listen to specific notifications
 # from specific meta objects. We need to keep it synchronized
 # to the current document though.
 class LineMetaInfo:
+    """
+    Meta information attached to the lines of a document. Most lines
+    have no information (None), so only the other lines are stored, as
+    sorted line indexes with a LineMarker holding the value. Inserting or
+    deleting lines shifts the markers after them, at a cost depending on
+    the number of lines with information, not on the size of the document.
+
+    Markers are found by line range with bisect, and by value through
+    a dictionary, for the values that are hashable.
+    """
     def __init__(self, meta_type, document):
         self._meta_type = meta_type
         self._document = document
+        self._markers = []
         self.resetLines()
 
         self.contentChanged = core.VSignal(self)
 
     def numLines(self):
-        return len(self._data)
+        return self._num_lines
 
     # Meant to be called by document.
     def addLines(self, line_number, how_many):
-        for i in range(how_many):
-            self._data.insert(line_number-1, None)
+        start = bisect.bisect_left(self._indexes, line_number-1)
+        self._indexes[start:] = [index+how_many for index in self._indexes[start:]]
+        for marker in self._markers[start:]:
+            marker.shift(how_many)
+        self._num_lines += how_many
 
     # Meant to be called by document.
     def deleteLines(self, line_number, how_many):
-        for i in range(how_many):
-            self._data.pop(line_number-1)
+        first_index = line_number-1
+        start = bisect.bisect_left(self._indexes, first_index)
+        end = bisect.bisect_left(self._indexes, first_index+how_many, start)
+        for marker in self._markers[start:end]:
+            self._forgetMarker(marker)
+        del self._markers[start:end]
+        self._indexes[start:] = [index-how_many for index in self._indexes[end:]]
+        for marker in self._markers[start:]:
+            marker.shift(-how_many)
+        self._num_lines -= min(how_many, self._num_lines-first_index)
 
-        if len(self._data) == 0:
-            self._data = [None]
+        if self._num_lines == 0:
+            self._num_lines = 1
 
     # Meant to be called by document.
     def resetLines(self):
-        self._data = [None] * self._document.numLines()
+        for marker in self._markers:
+            marker.invalidate()
+
+        self._num_lines = self._document.numLines()
+
+        # Sorted indexes of the lines having a value other than None,
+        # and their markers
+        self._indexes = []
+        self._markers = []
+
+        # value -> set of markers, for hashable values
+        self._markers_by_value = {}
 
     def setData(self, data, from_line=1):
         # As a method, so we can bind to it via signal/slot. Property with slice needed.
@@ -41,7 +76,7 @@ class LineMetaInfo:
 
         try:
             for idx, d in enumerate(data):
-                self._data[from_line-1+idx] = d
+                self._setValue(from_line-1+idx, d)
         except IndexError:
             pass
 
@@ -49,36 +84,73 @@ class LineMetaInfo:
 
     def setDataForLines(self, data_dict):
         for k, v in data_dict.items():
-            self._data[k-1] = v
+            self._setValue(k-1, v)
 
         self.notifyObservers()
 
     def data(self, from_line=None, how_many=None):
         if from_line is not None:
             if how_many is None:
-                return self._data[from_line-1]
+                return self._value(from_line-1)
             else:
-                return self._data[from_line-1:from_line-1+how_many]
+                return self._valuesIn(range(self._num_lines)[from_line-1:from_line-1+how_many])
         else:
             if how_many is None:
-                return self._data
+                return self._valuesIn(range(self._num_lines))
             else:
-                return self._data[:how_many]
+                return self._valuesIn(range(self._num_lines)[:how_many])
 
     def notNoneData(self):
-        return self.findWhere(lambda x: x is not None)
+        return { index+1: marker.value for index, marker in zip(self._indexes, self._markers) }
 
     def findWhere(self, condition):
-        return { i+1: v for i,v in enumerate(self._data) if condition(v)}
+        if len(self._indexes) < self._num_lines and condition(None):
+            # Lines without information match too
+            return { i+1: v for i, v in enumerate(self.data()) if condition(v) }
+
+        return { index+1: marker.value for index, marker in zip(self._indexes, self._markers)
+                 if condition(marker.value) }
+
+    def marker(self, line_number):
+        """
+        Returns the LineMarker of a line, or None if the line has no value
+        """
+        position = self._position(range(self._num_lines)[line_number-1])
+        if position is None:
+            return None
+        return self._markers[position]
+
+    def markers(self, from_line=1, how_many=None):
+        """
+        Returns the LineMarkers of how_many lines starting at from_line,
+        or up to the end if how_many is None, sorted by line.
+        """
+        start = bisect.bisect_left(self._indexes, from_line-1)
+        if how_many is None:
+            return self._markers[start:]
+        end = bisect.bisect_left(self._indexes, from_line-1+how_many, start)
+        return self._markers[start:end]
+
+    def markersWithValue(self, value):
+        """
+        Returns the LineMarkers having the given value, sorted by line.
+        The value must be hashable.
+        """
+        return sorted(self._markers_by_value.get(value, ()), key=lambda marker: marker.line)
 
     def dataForLines(self, lines):
-        return {i: self._data[i-1] for i in lines}
+        return {i: self._value(i-1) for i in lines}
 
     def clear(self):
-        self._data = [None] * self._document.numLines()
+        self.resetLines()
         self.notifyObservers()
 
     def notifyObservers(self):
+        # During a transaction, the observers are notified at its end
+        if self._document.isInTransaction():
+            self._document.deferNotification(self)
+            return
+
         self.contentChanged.emit()
 
     @property
@@ -90,13 +162,105 @@ class LineMetaInfo:
         return self._document
 
     def memento(self, line):
-        return copy.deepcopy(self._data[line-1])
+        return _copy(self._value(line-1))
 
     def insertFromMemento(self, line, memento):
-        self._data.insert(line-1, copy.deepcopy(memento))
+        self.addLines(line, 1)
+        self._setValue(line-1, _copy(memento))
 
     def replaceFromMemento(self, line, memento):
-        self._data[line-1] = copy.deepcopy(memento)
+        self._setValue(line-1, _copy(memento))
 
     def __str__(self):
-        return str(self._data)
+        return str(self.data())
+
+    # Private
+
+    def _value(self, index):
+        """
+        Returns the value of a line index. Negative indexes count
+        from the end, as for lists.
+        """
+        position = self._position(range(self._num_lines)[index])
+        if position is None:
+            return None
+        return self._markers[position].value
+
+    def _position(self, index):
+        """
+        Returns the position of a line index in the stored lines,
+        or None if the line has no value.
+        """
+        position = bisect.bisect_left(self._indexes, index)
+        if position < len(self._indexes) and self._indexes[position] == index:
+            return position
+        return None
+
+    def _valuesIn(self, index_range):
+        """
+        Returns the list of the values for a range of line indexes
+        """
+        result = [None] * len(index_range)
+        if len(index_range) == 0:
+            return result
+
+        start = bisect.bisect_left(self._indexes, index_range.start)
+        end = bisect.bisect_left(self._indexes, index_range.stop, start)
+        for index, marker in zip(self._indexes[start:end], self._markers[start:end]):
+            result[index-index_range.start] = marker.value
+        return result
+
+    def _setValue(self, index, value):
+        """
+        Sets the value of a line index. None removes the information.
+        """
+        index = range(self._num_lines)[index]
+        position = bisect.bisect_left(self._indexes, index)
+        found = position < len(self._indexes) and self._indexes[position] == index
+
+        if value is None:
+            if found:
+                self._forgetMarker(self._markers[position])
+                del self._indexes[position]
+                del self._markers[position]
+        elif found:
+            marker = self._markers[position]
+            self._unindexMarker(marker)
+            marker.setValue(value)
+            self._indexMarker(marker)
+        else:
+            marker = LineMarker(index, value)
+            self._indexes.insert(position, index)
+            self._markers.insert(position, marker)
+            self._indexMarker(marker)
+
+    def _indexMarker(self, marker):
+        try:
+            self._markers_by_value.setdefault(marker.value, set()).add(marker)
+        except TypeError:
+            # Not hashable, so it can not be looked up by value
+            pass
+
+    def _unindexMarker(self, marker):
+        try:
+            markers = self._markers_by_value.get(marker.value)
+        except TypeError:
+            return
+
+        if markers is not None:
+            markers.discard(marker)
+            if len(markers) == 0:
+                del self._markers_by_value[marker.value]
+
+    def _forgetMarker(self, marker):
+        self._unindexMarker(marker)
+        marker.invalidate()
+
+def _copy(value):
+    """
+    Copies a value for a memento. Strings and None are immutable,
+    and the most common values, so they are not deep copied.
+    """
+    if value is None or isinstance(value, str):
+        return value
+    return copy.deepcopy(value)
@@ -0,0 +1,202 @@
+import bisect
+import itertools
+
+class RunLengthList:
+    """
+    Sequence storing consecutive equal values as a single run.
+    Used for the char meta of a line, where a token type spans
+    many characters. Behaves like a list for indexing, slicing,
+    slice assignment, iteration, concatenation and comparison.
+    """
+    __slots__ = ("_values", "_lengths", "_length", "_ends")
+
+    def __init__(self, iterable=()):
+        if isinstance(iterable, RunLengthList):
+            # Runs are immutable tuples, so they can be shared
+            self._values = iterable._values
+            self._lengths = iterable._lengths
+            self._length = iterable._length
+            self._ends = iterable._ends
+        else:
+            self._setRuns((value, sum(1 for _ in group)) for value, group in itertools.groupby(iterable))
+
+    @classmethod
+    def fromRuns(cls, runs):
+        """
+        Creates a new instance from an iterable of (value, length) pairs
+        """
+        ret = cls()
+        ret._setRuns(runs)
+        return ret
+
+    @classmethod
+    def repeat(cls, value, count):
+        return cls.fromRuns([(value, count)])
+
+    def runs(self):
+        """
+        Returns a list of (value, length) pairs
+        """
+        return list(zip(self._values, self._lengths))
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for value, length in zip(self._values, self._lengths):
+            yield from itertools.repeat(value, length)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop = self._sliceBounds(key)
+            if start == 0 and stop == self._length:
+                return RunLengthList(self)
+            return RunLengthList.fromRuns(self._runsBetween(start, stop))
+
+        if key < 0:
+            key += self._length
+        if not (0 <= key < self._length):
+            raise IndexError("RunLengthList index out of range")
+
+        return self._values[bisect.bisect_right(self._runEnds(), key)]
+
+    def __setitem__(self, key, values):
+        if not isinstance(key, slice):
+            key = slice(key, key+1) if key >= 0 else slice(self._length+key, self._length+key+1)
+            values = [values]
+
+        start, stop = self._sliceBounds(key)
+        if not isinstance(values, RunLengthList):
+            values = RunLengthList(values)
+
+        self._splice(start, stop, values.runs())
+
+    def __delitem__(self, key):
+        self[key] = ()
+
+    def __add__(self, other):
+        if not isinstance(other, RunLengthList):
+            other = RunLengthList(other)
+        ret = RunLengthList(self)
+        ret._splice(ret._length, ret._length, other.runs())
+        return ret
+
+    def __radd__(self, other):
+        return RunLengthList(other) + self
+
+    def __eq__(self, other):
+        if isinstance(other, RunLengthList):
+            return self._values == other._values and self._lengths == other._lengths
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __repr__(self):
+        return "RunLengthList(%r)" % list(self)
+
+    def __getstate__(self):
+        return (self._values, self._lengths, self._length)
+
+    def __setstate__(self, state):
+        self._values, self._lengths, self._length = state
+        self._ends = None
+
+    # Private
+
+    def _setRuns(self, runs):
+        """
+        Replaces the content with the given (value, length) pairs.
+        Runs are stored as tuples, as they are smaller than lists.
+        """
+        self._values, self._lengths = _merged(runs)
+        self._length = sum(self._lengths)
+        self._ends = None
+
+    def _runEnds(self):
+        """
+        Returns the offsets where each run ends. They are computed again
+        only after the runs change.
+        """
+        if self._ends is None:
+            self._ends = tuple(itertools.accumulate(self._lengths))
+        return self._ends
+
+    def _splice(self, start, stop, runs):
+        """
+        Replaces the interval [start, stop) with the given runs.
+        Only the runs around the interval are examined, the others
+        are copied with tuple slicing.
+        """
+        values = self._values
+        lengths = self._lengths
+        ends = self._runEnds()
+        first = bisect.bisect_right(ends, start)
+        last = bisect.bisect_right(ends, stop)
+
+        middle = []
+        run_start = ends[first-1] if first > 0 else 0
+        if start > run_start:
+            middle.append((values[first], start - run_start))
+        middle.extend(runs)
+        if last < len(values):
+            middle.append((values[last], ends[last] - stop))
+
+        # Include the neighbouring runs, in case they have to be merged
+        low, high = first, last+1
+        if low > 0:
+            low -= 1
+            middle.insert(0, (values[low], lengths[low]))
+        if high < len(values):
+            middle.append((values[high], lengths[high]))
+            high += 1
+
+        middle_values, middle_lengths = _merged(middle)
+        self._values = values[:low] + middle_values + values[high:]
+        self._lengths = lengths[:low] + middle_lengths + lengths[high:]
+        self._length += sum(length for _, length in runs) - (stop - start)
+        self._ends = None
+
+    def _sliceBounds(self, key):
+        if key.step not in (None, 1):
+            raise ValueError("RunLengthList does not support extended slices")
+
+        start, stop, _ = key.indices(self._length)
+        return start, max(start, stop)
+
+    def _runsBetween(self, start, stop):
+        """
+        Returns the (value, length) pairs covering the interval [start, stop)
+        """
+        if start >= stop:
+            return []
+
+        values = self._values
+        ends = self._runEnds()
+        first = bisect.bisect_right(ends, start)
+        last = bisect.bisect_left(ends, stop)
+        if first == last:
+            return [(values[first], stop - start)]
+
+        runs = [(values[first], ends[first] - start)]
+        runs.extend(zip(values[first+1:last], self._lengths[first+1:last]))
+        runs.append((values[last], stop - ends[last-1]))
+        return runs
+
+def _merged(runs):
+    """
+    Returns the values and lengths tuples for the given runs, dropping
+    empty runs and merging adjacent runs with the same value.
+    """
+    values = []
+    lengths = []
+    for value, length in runs:
+        if length <= 0:
+            continue
+
+        if values and values[-1] == value:
+            lengths[-1] += length
+        else:
+            values.append(value)
+            lengths.append(length)
+
+    return tuple(values), tuple(lengths)
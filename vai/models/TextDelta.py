@@ -0,0 +1,147 @@
+import collections
+
+class TextDelta(collections.namedtuple("TextDelta",
+                                       ["line_number",
+                                        "column",
+                                        "old_text",
+                                        "new_text"])):
+    """
+    A modification of a document text: old_text, starting at (line_number,
+    column), is replaced by new_text. The texts can span several lines,
+    and contain only what changed, so a typed character is a one character
+    new_text.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def between(cls, old_lines, new_lines, line_number):
+        """
+        Returns the TextDelta transforming the lines old_lines into new_lines,
+        both starting at line_number, or None if they have the same text.
+        """
+        old_text = "".join(old_lines)
+        new_text = "".join(new_lines)
+        if old_text == new_text:
+            return None
+
+        max_common = min(len(old_text), len(new_text))
+        prefix = 0
+        while prefix < max_common and old_text[prefix] == new_text[prefix]:
+            prefix += 1
+
+        suffix = 0
+        while suffix < max_common-prefix and old_text[-1-suffix] == new_text[-1-suffix]:
+            suffix += 1
+
+        line_number, column = _advance((line_number, 1), old_text[:prefix])
+        return cls(line_number,
+                   column,
+                   old_text[prefix:len(old_text)-suffix],
+                   new_text[prefix:len(new_text)-suffix])
+
+    def inverse(self):
+        """
+        Returns the TextDelta undoing this one
+        """
+        return TextDelta(self.line_number, self.column, self.new_text, self.old_text)
+
+    def endPos(self):
+        """
+        Returns the position after new_text, once the delta is applied
+        """
+        return _advance((self.line_number, self.column), self.new_text)
+
+    def composed(self, next_delta, lines):
+        """
+        Returns the TextDelta equivalent to this delta followed by
+        next_delta. lines are the lines of the text between the two.
+        """
+        end_pos = self.endPos()
+        next_end_pos = _advance((next_delta.line_number, next_delta.column), next_delta.old_text)
+
+        first_line = min(self.line_number, next_delta.line_number)
+        last_line = min(max(end_pos[0], next_end_pos[0]), len(lines))
+        window = lines[first_line-1:last_line]
+
+        start = _offset(window, first_line, (self.line_number, self.column))
+        before = "".join(window)
+        before = before[:start] + self.old_text + before[start+len(self.new_text):]
+
+        after = next_delta.applyToLines(list(window), first_line)
+        return TextDelta.between([before], after, first_line)
+
+    def isEquivalent(self, other, lines):
+        """
+        True if the two deltas give the same text when applied to lines.
+        An insertion in a repeated text can be described at several positions.
+        """
+        first_line = min(self.line_number, other.line_number)
+        last_line = max(_advance((self.line_number, self.column), self.old_text)[0],
+                        _advance((other.line_number, other.column), other.old_text)[0])
+        window = lines[first_line-1:last_line]
+        try:
+            return self.applyToLines(list(window), first_line) == other.applyToLines(list(window), first_line)
+        except ValueError:
+            return False
+
+    def applyToLines(self, lines, first_line=1):
+        """
+        Applies the delta to a list of lines, whose first element is the
+        line first_line. Returns the list.
+        """
+        first, last, new_lines = self._replacement(lines[self.line_number-first_line:], self.line_number)
+        lines[first-first_line:last-first_line] = new_lines
+        return lines
+
+    def applyToDocument(self, document):
+        """
+        Applies the delta to a TextDocument, replacing only the lines
+        whose text changes.
+        """
+        num_lines = self.old_text.count("\n") + 1
+        num_lines = min(num_lines, document.numLines()-self.line_number+1)
+        old_lines = []
+        if num_lines > 0:
+            # Otherwise, the text is added at the end
+            old_lines = document.linesText2(self.line_number, num_lines)
+        first, last, new_lines = self._replacement(old_lines, self.line_number)
+
+        with document.transaction():
+            common = min(last-first, len(new_lines))
+            for i in range(common):
+                if document.lineText(first+i) != new_lines[i]:
+                    document.replaceLine(first+i, new_lines[i])
+
+            if len(new_lines) > common:
+                document.insertLines(first+common, new_lines[common:])
+            elif last-first > common:
+                document.deleteLines(first+common, last-first-common)
+
+    def _replacement(self, lines, line_number):
+        """
+        Returns (first line, last line + 1, new lines) replacing the
+        old text, given the lines starting at line_number.
+        """
+        num_lines = min(self.old_text.count("\n") + 1, len(lines))
+        text = "".join(lines[:num_lines])
+        start = self.column - 1
+        if text[start:start+len(self.old_text)] != self.old_text:
+            raise ValueError("Text delta does not match the document")
+
+        text = text[:start] + self.new_text + text[start+len(self.old_text):]
+        return line_number, line_number+num_lines, text.splitlines(True)
+
+def _advance(pos, text):
+    """
+    Returns the position following text, if it starts at pos
+    """
+    num_breaks = text.count("\n")
+    if num_breaks == 0:
+        return (pos[0], pos[1]+len(text))
+    return (pos[0]+num_breaks, len(text)-text.rfind("\n"))
+
+def _offset(lines, first_line, pos):
+    """
+    Returns the offset of pos in the text of lines, starting at first_line
+    """
+    return sum(len(line) for line in lines[:pos[0]-first_line]) + pos[1] - 1
@@ -1,16 +1,22 @@
 import re
 import time
-import copy
 import os
 from vaitk import core
 import contextlib
 from .TextDocumentCursor import TextDocumentCursor
 from .LineMetaInfo import LineMetaInfo
 from .DocumentMetaInfo import DocumentMetaInfo
+from .RunLengthList import RunLengthList
+from .TextDocumentChange import TextDocumentChange
+from .storage import ListStorage
 
 EOL='\n'
-CHAR_META_INDEX = 0
-TEXT_INDEX = 1
+
+# Number of lines joined and written at a time by write
+WRITE_CHUNK_LINES = 4096
+
+# Default split function for wordAt
+_WORD_SPLIT = re.compile(r"(\w+)").finditer
 
 class CharMeta:
     LexerToken = "LexerToken"
@@ -18,37 +24,59 @@ class CharMeta:
 class TextDocument(core.VObject):
     """
     Represents the contents of a file.
+    The lines are kept in a storage object. By default, a ListStorage
+    is used. A RopeStorage can be passed for very large files, and
+    a MmapStorage to view huge files, read-only.
     """
 
-    def __init__(self):
+    def __init__(self, storage=None):
         self._initSignals()
 
         # New dictionary to store meta info objects. This will outdate the current format.
         self._meta_info = {}
 
-        # Char meta will be outdated, leaving just the text as the contents
-        self._contents = [ ({}, EOL) ]
+        # Text and char meta of each line
+        self._storage = ListStorage() if storage is None else storage
 
         self._cursors = []
 
+        # Incremented at every change of the text
+        self._version = 0
+
+        # Nesting level of transactions, and what they have to notify
+        self._transaction_depth = 0
+        self._pending_change = None
+        self._pending_meta_content_changed = False
+        self._deferred_notifications = []
+
     def __str__(self):
         return self.documentText()
 
+    def storage(self):
+        """
+        Returns the storage object keeping the lines
+        """
+        return self._storage
+
     # Query routines
+    def isReadOnly(self):
+        """
+        True if the storage can not be modified, as a MmapStorage
+        """
+        return self._storage.isReadOnly()
+
     def isEmpty(self):
-        return len(self._contents) == 1 \
-                and len(self._contents[0][TEXT_INDEX]) == 1 \
-                and self._contents[0][TEXT_INDEX][0] == EOL
+        return self._storage.numLines() == 1 \
+                and self._storage.text(0) == EOL
 
     def isLineEmpty(self, line_number):
         line_index = line_number - 1
-        return len(self._contents[line_index][TEXT_INDEX]) == 1 \
-                and self._contents[line_index][TEXT_INDEX][0] == EOL
+        return self._storage.text(line_index) == EOL
 
     def lineText(self, line_number):
         self._checkLineNumber(line_number)
         line_index = line_number - 1
-        return self._contents[line_index][TEXT_INDEX]
+        return self._storage.text(line_index)
 
     # deprecated
     def linesText(self, start, end):
@@ -56,13 +84,22 @@ class TextDocument(core.VObject):
         self._checkLineNumber(end)
         start_index = start - 1
         end_index = end - 1
-        return [self._contents[line_index][TEXT_INDEX] for line_index in range(start_index, end_index+1)]
+        return self._storage.texts(start_index, end_index-start_index+1)
 
     def linesText2(self, start, how_many):
         self._checkLineNumber(start)
         self._checkLineNumber(start+how_many-1)
         start_index = start - 1
-        return [self._contents[line_index][TEXT_INDEX] for line_index in range(start_index, start_index+how_many)]
+        return self._storage.texts(start_index, how_many)
+
+    def iterLinesText(self, start, how_many):
+        """
+        Like linesText2, but returns an iterator. The storage does not
+        keep the lines apart if it did not already.
+        """
+        self._checkLineNumber(start)
+        self._checkLineNumber(start+how_many-1)
+        return self._storage.iterTexts(start-1, how_many)
 
     def hasLine(self, line_number):
         try:
@@ -74,11 +111,25 @@ class TextDocument(core.VObject):
     def lineLength(self, line_number):
         return len(self.lineText(line_number))
 
-    def documentText(self):
-        return "".join([x[TEXT_INDEX] for x in self._contents])
+    def documentText(self, from_line=1):
+        return self._storage.documentText(from_line-1)
 
     def numLines(self):
-        return len(self._contents)
+        return self._storage.numLines()
+
+    def snapshot(self):
+        """
+        Returns the text of the document as a list of parts, each a string
+        or a tuple of line texts, that later changes do not affect.
+        The lines are not copied, so it can be taken at every save.
+        """
+        return self._storage.snapshot()
+
+    def version(self):
+        """
+        Returns a number that changes every time the text is modified.
+        """
+        return self._version
 
     ## Meta info routines
     # Document Meta
@@ -123,8 +174,7 @@ class TextDocument(core.VObject):
         line_index = line_number - 1
         char_index = char_number - 1
 
-        how_many = char_number - self.lineLength(line_number)
-        char_meta = self._contents[line_index][CHAR_META_INDEX]
+        char_meta = self._storage.charMeta(line_index)
         ret = {}
         for key, value in char_meta.items():
             ret[key] = value[char_index:]
@@ -137,32 +187,37 @@ class TextDocument(core.VObject):
         line_index = line_number - 1
         char_index = char_number - 1
 
-        char_meta = self._contents[line_index][CHAR_META_INDEX]
-        text = self._contents[line_index][TEXT_INDEX]
+        char_meta, text = self._storage.line(line_index)
         for key, value in meta_dict.items():
+            if char_index == 0 and len(value) == len(text):
+                char_meta[key] = RunLengthList(value)
+                continue
+
             if not key in char_meta:
-                char_meta[key] = [None]*len(text)
+                char_meta[key] = RunLengthList.repeat(None, len(text))
 
-            char_meta[key][char_index:char_index+len(value)] = value
-            char_meta[key] = char_meta[key][0:len(text)]
+            values = char_meta[key]
+            values[char_index:char_index+len(value)] = value
+            if len(values) > len(text):
+                del values[len(text):]
 
-        self.metaContentChanged.emit()
+        self._notifyMetaContentChanged()
 
     def deleteCharMeta(self, pos, how_many, keys):
         line_number, char_number = pos
         line_index = line_number - 1
         char_index = char_number - 1
 
-        char_meta = self._contents[line_index][CHAR_META_INDEX]
+        char_meta = self._storage.charMeta(line_index)
         for key in keys:
             try:
                 meta_values = char_meta[key]
             except KeyError:
                 continue
-            meta_values[char_index:char_index+how_many] = None
-            char_meta[key] = meta_values
+            deleted = len(meta_values[char_index:char_index+how_many])
+            meta_values[char_index:char_index+how_many] = RunLengthList.repeat(None, deleted)
 
-        self.metaContentChanged.emit()
+        self._notifyMetaContentChanged()
 
     def wordAt(self, pos, split_func=None):
         """
@@ -173,7 +228,7 @@ class TextDocument(core.VObject):
         self._checkPos(pos)
 
         if split_func == None:
-            split_func = re.compile("(\w+)").finditer
+            split_func = _WORD_SPLIT
 
         line_text = self.lineText(pos[0])
 
@@ -196,6 +251,35 @@ class TextDocument(core.VObject):
 
         return line_text[pos[1]-1]
 
+    ## Transactions
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Context manager grouping several modifications. The signals are
+        emitted once, when the outermost transaction ends, with a single
+        TextDocumentChange covering all the changed lines. The notifications
+        of the meta info objects are also deferred until then.
+        """
+        self._transaction_depth += 1
+        try:
+            yield self
+        finally:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._endTransaction()
+
+    def isInTransaction(self):
+        return self._transaction_depth > 0
+
+    def deferNotification(self, meta_info):
+        """
+        Called by the meta info objects during a transaction, so that
+        their observers are notified when it ends.
+        """
+        if meta_info not in self._deferred_notifications:
+            self._deferred_notifications.append(meta_info)
+
     ## Modify document routines
     # Line operations
     def newLineAfter(self, line_number):
@@ -203,11 +287,10 @@ class TextDocument(core.VObject):
         line_index = line_number - 1
 
         # Add an EOL if not already there
-        self._contents[line_index] = ( self._contents[line_index][CHAR_META_INDEX],
-                                       _withEOL(self._contents[line_index][TEXT_INDEX])
-                                      )
+        char_meta, text = self._storage.line(line_index)
+        self._storage.setLine(line_index, char_meta, _withEOL(text))
 
-        self._contents.insert(line_index+1, ({}, EOL))
+        self._storage.insertLines(line_index+1, [({}, EOL)])
 
         for meta in self.allLineMetaInfo().values():
             meta.addLines(line_number+1, 1)
@@ -215,13 +298,11 @@ class TextDocument(core.VObject):
         for meta in self.allLineMetaInfo().values():
             meta.notifyObservers()
 
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
-        self.numLinesChanged.emit()
+        self._notifyChange(TextDocumentChange.INSERT_LINES, line_number, 1, 2)
 
     def newLine(self, line_number):
         line_index = line_number - 1
-        self._contents.insert(line_index, ({}, EOL))
+        self._storage.insertLines(line_index, [({}, EOL)])
 
         for meta in self.allLineMetaInfo().values():
             meta.addLines(line_number, 1)
@@ -229,9 +310,7 @@ class TextDocument(core.VObject):
         for meta in self.allLineMetaInfo().values():
             meta.notifyObservers()
 
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
-        self.numLinesChanged.emit()
+        self._notifyChange(TextDocumentChange.INSERT_LINES, line_number, 0, 1)
 
     def insertLine(self, line_number, text, char_meta=None):
         if not (1 <= line_number <= self.numLines()+1):
@@ -239,7 +318,7 @@ class TextDocument(core.VObject):
 
         line_index = line_number - 1
         char_meta = {} if char_meta is None else char_meta
-        self._contents.insert(line_index, [char_meta, _withEOL(text)])
+        self._storage.insertLines(line_index, [(char_meta, _withEOL(text))])
 
         for meta in self.allLineMetaInfo().values():
             meta.addLines(line_number, 1)
@@ -247,17 +326,14 @@ class TextDocument(core.VObject):
         for meta in self.allLineMetaInfo().values():
             meta.notifyObservers()
 
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
-        self.numLinesChanged.emit()
+        self._notifyChange(TextDocumentChange.INSERT_LINES, line_number, 0, 1)
 
     def insertLines(self, insert_at, text_lines):
         if not (1 <= insert_at <= self.numLines()+1):
             raise IndexError("Invalid insertion line %d" % insert_at)
 
         insert_at_index = insert_at - 1
-        for idx, text in enumerate(text_lines):
-            self._contents.insert(insert_at_index+idx, ( {}, _withEOL(text)))
+        self._storage.insertLines(insert_at_index, [({}, _withEOL(text)) for text in text_lines])
 
         for meta in self.allLineMetaInfo().values():
             meta.addLines(insert_at, len(text_lines))
@@ -265,16 +341,16 @@ class TextDocument(core.VObject):
 
         for meta in self.allLineMetaInfo().values():
             meta.notifyObservers()
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
-        self.numLinesChanged.emit()
+        self._notifyChange(TextDocumentChange.INSERT_LINES, insert_at, 0, len(text_lines))
 
     def deleteLine(self, line_number):
         self._checkLineNumber(line_number)
         line_index = line_number - 1
-        self._contents.pop(line_index)
-        if len(self._contents) == 0:
-            self._contents.append(({}, EOL))
+        self._storage.deleteLines(line_index, 1)
+        lines_added = 0
+        if self._storage.numLines() == 0:
+            self._storage.insertLines(0, [({}, EOL)])
+            lines_added = 1
 
         for meta in self.allLineMetaInfo().values():
             meta.deleteLines(line_number, 1)
@@ -282,18 +358,18 @@ class TextDocument(core.VObject):
         for meta in self.allLineMetaInfo().values():
             meta.notifyObservers()
 
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
-        self.numLinesChanged.emit()
+        self._notifyChange(TextDocumentChange.DELETE_LINES, line_number, 1, lines_added)
 
     def deleteLines(self, from_line, how_many):
         self._checkLineNumber(from_line)
         self._checkLineNumber(from_line+how_many-1)
         from_line_index = from_line - 1
-        self._contents = self._contents[:from_line_index] + self._contents[from_line_index+how_many:]
+        self._storage.deleteLines(from_line_index, how_many)
 
-        if len(self._contents) == 0:
-            self._contents.append(({}, EOL))
+        lines_added = 0
+        if self._storage.numLines() == 0:
+            self._storage.insertLines(0, [({}, EOL)])
+            lines_added = 1
 
         for meta in self.allLineMetaInfo().values():
             meta.deleteLines(from_line, how_many)
@@ -301,20 +377,16 @@ class TextDocument(core.VObject):
         for meta in self.allLineMetaInfo().values():
             meta.notifyObservers()
 
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
-        self.numLinesChanged.emit()
+        self._notifyChange(TextDocumentChange.DELETE_LINES, from_line, how_many, lines_added)
 
     def replaceLine(self, line_number, text, char_meta=None):
         self._checkLineNumber(line_number)
 
         line_index = line_number - 1
-        self._contents.pop(line_index)
         char_meta = {} if char_meta is None else char_meta
 
-        self._contents.insert(line_index, (char_meta, _withEOL(text)))
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
+        self._storage.setLine(line_index, char_meta, _withEOL(text))
+        self._notifyChange(TextDocumentChange.REPLACE_LINES, line_number, 1, 1)
 
     def breakLine(self, pos):
         self._checkPos(pos)
@@ -322,38 +394,26 @@ class TextDocument(core.VObject):
         line_index = line_number - 1
         char_index = char_number - 1
 
-        current_line_contents = self._contents.pop(line_index)
-
-        orig_char_meta = current_line_contents[CHAR_META_INDEX]
-        orig_text      = current_line_contents[TEXT_INDEX]
+        orig_char_meta, orig_text = self._storage.line(line_index)
 
         above_char_meta = {}
         below_char_meta = {}
         for key, values in orig_char_meta.items():
-           above_char_meta[key] = values[:char_index] + [None]
+           above_char_meta[key] = values[:char_index] + RunLengthList.repeat(None, 1)
            below_char_meta[key] = values[char_index:]
 
         above_text = _withEOL(orig_text[:char_index])
         below_text = _withEOL(orig_text[char_index:])
 
-        self._contents.insert(line_index, (below_char_meta,
-                                           below_text
-                                          )
-                            )
-
-        self._contents.insert(line_index, ( above_char_meta,
-                                           above_text
-                                          )
-                            )
+        self._storage.setLine(line_index, above_char_meta, above_text)
+        self._storage.insertLines(line_index+1, [(below_char_meta, below_text)])
 
         for meta in self.allLineMetaInfo().values():
             meta.addLines(line_number, 1)
 
         for meta in self.allLineMetaInfo().values():
             meta.notifyObservers()
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
-        self.numLinesChanged.emit()
+        self._notifyChange(TextDocumentChange.BREAK_LINE, line_number, 1, 2, char_number, 0, 0)
 
     def joinWithNextLine(self, line_number):
         self._checkLineNumber(line_number)
@@ -365,23 +425,16 @@ class TextDocument(core.VObject):
 
         if self.isLineEmpty(line_number):
             if not self.isEmpty():
-                self._contents.pop(line_index)
+                self._storage.deleteLines(line_index, 1)
                 for meta in self.allLineMetaInfo().values():
                     meta.deleteLines(line_number, 1)
                 for meta in self.allLineMetaInfo().values():
                     meta.notifyObservers()
-                self.contentChanged.emit()
-                self.metaContentChanged.emit()
-                self.numLinesChanged.emit()
+                self._notifyChange(TextDocumentChange.DELETE_LINES, line_number, 1, 0)
             return
 
-        current_line_contents = self._contents.pop(line_index)
-        current_line_char_meta = current_line_contents[CHAR_META_INDEX]
-        current_line_text = current_line_contents[TEXT_INDEX]
-
-        next_line_contents = self._contents.pop(line_index)
-        next_line_char_meta = next_line_contents[CHAR_META_INDEX]
-        next_line_text = next_line_contents[TEXT_INDEX]
+        current_line_char_meta, current_line_text = self._storage.line(line_index)
+        next_line_char_meta, next_line_text = self._storage.line(line_index+1)
 
         # Merge char meta. Collisions: meta will be merged.
         # [1,1] + [2,2] = [1,1,2,2]
@@ -392,16 +445,17 @@ class TextDocument(core.VObject):
             current_line_char_values = current_line_char_meta.get(key)
             next_line_char_values = next_line_char_meta.get(key)
             if current_line_char_values is None:
-                current_line_char_values = [None] * len(_withoutEOL(current_line_text))
+                current_line_char_values = RunLengthList.repeat(None, len(_withoutEOL(current_line_text)))
             if next_line_char_values is None:
-                next_line_char_values = [None] * len(_withEOL(next_line_text))
+                next_line_char_values = RunLengthList.repeat(None, len(_withEOL(next_line_text)))
 
-            new_char_meta[key] = current_line_char_values + next_line_char_values
+            new_char_meta[key] = current_line_char_values[:len(_withoutEOL(current_line_text))] \
+                                 + next_line_char_values
 
-        self._contents.insert(line_index, ( new_char_meta,
-                                             _withoutEOL(current_line_text) + _withEOL(next_line_text)
-                                        )
-                             )
+        self._storage.setLine(line_index,
+                              new_char_meta,
+                              _withoutEOL(current_line_text) + _withEOL(next_line_text))
+        self._storage.deleteLines(line_index+1, 1)
 
         for meta in self.allLineMetaInfo().values():
             meta.deleteLines(line_number+1, 1)
@@ -409,9 +463,8 @@ class TextDocument(core.VObject):
         for meta in self.allLineMetaInfo().values():
             meta.notifyObservers()
 
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
-        self.numLinesChanged.emit()
+        self._notifyChange(TextDocumentChange.JOIN_LINES, line_number, 2, 1,
+                           len(_withoutEOL(current_line_text))+1, 0, 0)
 
     # Char operations
     def insertChars(self, pos, string):
@@ -420,26 +473,18 @@ class TextDocument(core.VObject):
         line_index = line_number - 1
         char_index = char_number - 1
 
-        contents = self._contents.pop(line_index)
-        text = contents[TEXT_INDEX]
+        char_meta, text = self._storage.line(line_index)
 
         new_text = text[:char_index] + \
                    string + \
                    text[char_index:]
 
-        char_meta = contents[CHAR_META_INDEX]
-        for key, values in char_meta.items():
-            char_meta[key] = values[:char_index] + \
-                             [None] * len(string) + \
-                             values[char_index:]
+        for values in char_meta.values():
+            values[char_index:char_index] = RunLengthList.repeat(None, len(string))
 
-        self._contents.insert(line_index, ( char_meta,
-                                            new_text
-                                          )
-                                )
+        self._storage.setLine(line_index, char_meta, new_text)
 
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
+        self._notifyChange(TextDocumentChange.INSERT_CHARS, line_number, 1, 1, char_number, 0, len(string))
 
     def deleteChars(self, pos, how_many):
         """
@@ -465,29 +510,22 @@ class TextDocument(core.VObject):
         if char_index+how_many > line_length-1:
             how_many = line_length-char_index-1
 
-        contents = self._contents.pop(line_index)
-        text = contents[TEXT_INDEX]
+        char_meta, text = self._storage.line(line_index)
 
         new_text = text[:char_index] + text[char_index+how_many:]
         deleted_text = text[char_index:char_index+how_many]
 
-        new_eol_meta = []
-        if not _hasEOL(new_text):
-            new_eol_meta = [None]
 
-        char_meta = contents[CHAR_META_INDEX]
         deleted_char_meta = {}
         for key, values in char_meta.items():
-            char_meta[key] = values[:char_index] + values[char_index+how_many:] + new_eol_meta
             deleted_char_meta[key] = values[char_index:char_index+how_many]
+            del values[char_index:char_index+how_many]
+            if not _hasEOL(new_text):
+                values[len(values):] = [None]
 
-        self._contents.insert(line_index, ( char_meta,
-                                            new_text
-                                        )
-                                )
+        self._storage.setLine(line_index, char_meta, new_text)
 
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
+        self._notifyChange(TextDocumentChange.DELETE_CHARS, line_number, 1, 1, char_number, how_many, 0)
         return (deleted_text, deleted_char_meta)
 
     def replaceChars(self, pos, how_many, string):
@@ -508,29 +546,22 @@ class TextDocument(core.VObject):
         if char_index+how_many > line_length-1:
             how_many = line_length-char_index-1
 
-        contents = self._contents.pop(line_index)
-        text = contents[TEXT_INDEX]
+        char_meta, text = self._storage.line(line_index)
 
         new_text = text[:char_index] + string + text[char_index+how_many:]
         deleted_text = text[char_index:char_index+how_many]
 
-        new_eol_meta = []
-        if not _hasEOL(new_text):
-            new_eol_meta = [None]
 
-        char_meta = contents[CHAR_META_INDEX]
         deleted_char_meta = {}
         for key, values in char_meta.items():
-            char_meta[key] = values[:char_index] + [None]*len(string) + values[char_index+how_many:] + new_eol_meta
             deleted_char_meta[key] = values[char_index:char_index+how_many]
+            values[char_index:char_index+how_many] = RunLengthList.repeat(None, len(string))
+            if not _hasEOL(new_text):
+                values[len(values):] = [None]
 
-        self._contents.insert(line_index, ( char_meta,
-                                            new_text
-                                        )
-                                )
+        self._storage.setLine(line_index, char_meta, new_text)
 
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
+        self._notifyChange(TextDocumentChange.REPLACE_CHARS, line_number, 1, 1, char_number, how_many, len(string))
         return (deleted_text, deleted_char_meta)
 
     # Input Output
@@ -539,14 +570,8 @@ class TextDocument(core.VObject):
         """
         Reads the content from the file and replaces any content currently in the TextDocument
         """
-        contents = []
-        for textline in file_handler:
-            contents.append(({}, _withEOL(textline)))
-
-        if len(contents) == 0:
-            contents.append(({}, EOL))
-
-        self._contents = contents
+        old_num_lines = self._storage.numLines()
+        self._storage.load(file_handler)
         self._cursors = []
 
         for meta in self.allLineMetaInfo().values():
@@ -555,14 +580,36 @@ class TextDocument(core.VObject):
         for meta in self.allLineMetaInfo().values():
             meta.notifyObservers()
 
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
+        self._notifyChange(TextDocumentChange.RESET, 1, old_num_lines, self._storage.numLines())
+
+    def appendText(self, text):
+        """
+        Adds the lines of text at the end of the document, as read from
+        a file. The text must be made of whole lines, each ending with EOL.
+        """
+        old_num_lines = self._storage.numLines()
+        self._storage.appendText(text)
+        self._notifyLinesAppended(old_num_lines)
+
+    def indexMore(self, num_bytes):
+        """
+        For a storage indexing its file lazily, such as MmapStorage, indexes
+        num_bytes more of the file. The lines found are notified as added
+        at the end. Returns True once the whole file is indexed.
+        """
+        old_num_lines = self._storage.numLines()
+        indexed = self._storage.indexMore(num_bytes)
+        self._notifyLinesAppended(old_num_lines)
+        return indexed
 
     def write(self, file_handler):
         """
-        Write the contents of the file to a specified file object
+        Write the contents of the file to a specified file object, a few
+        lines at a time. DocumentSaver writes a file safely.
         """
-        file_handler.write(self.documentText())
+        num_lines = self._storage.numLines()
+        for index in range(0, num_lines, WRITE_CHUNK_LINES):
+            file_handler.write("".join(self._storage.texts(index, min(WRITE_CHUNK_LINES, num_lines-index))))
 
         self.documentSaved.emit()
 
@@ -574,61 +621,65 @@ class TextDocument(core.VObject):
         return TextDocumentCursor(self)
 
     def isValidLine(self, line_number):
-        return (1 <= line_number <= len(self._contents))
+        return (1 <= line_number <= self._storage.numLines())
 
     def isValidPos(self, pos):
         return (self.isValidLine(pos[0]) and (1 <= pos[1] <= self.lineLength(pos[0])))
 
     # Memento extraction for a line
     def lineMemento(self, line_number):
-        memento = [ copy.deepcopy(self._contents[line_number-1]) ]
+        """
+        Returns the state of a line, to restore it with insertFromMemento
+        or replaceFromMemento: ((None, text), {line meta type: value}).
+        Nothing is copied, as the text is immutable. The char meta is not
+        kept, and it is recomputed (e.g. by the lexer) when restored.
+        """
+        text = self._storage.text(line_number-1)
         meta_info = {}
         for name, meta in self.allLineMetaInfo().items():
             meta_info[name] = meta.memento(line_number)
 
-        memento.append(meta_info)
-        return memento
+        return ((None, text), meta_info)
 
     def insertFromMemento(self, line_number, memento):
-        self._contents.insert(line_number-1, copy.deepcopy(memento[0]))
+        _, text = memento[0]
+        self._storage.insertLines(line_number-1, [({}, text)])
         for name, meta_info in memento[1].items():
             self._meta_info[name].insertFromMemento(line_number, meta_info)
 
         for meta in self.allLineMetaInfo().values():
             meta.notifyObservers()
 
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
-        self.numLinesChanged.emit()
+        self._notifyChange(TextDocumentChange.INSERT_LINES, line_number, 0, 1)
 
     def replaceFromMemento(self, line_number, memento):
-        self._contents[line_number-1] = copy.deepcopy(memento[0])
+        _, text = memento[0]
+        self._storage.setLine(line_number-1, {}, text)
         for name, meta_info in memento[1].items():
             self._meta_info[name].replaceFromMemento(line_number, meta_info)
 
         for meta in self.allLineMetaInfo().values():
             meta.notifyObservers()
 
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
+        self._notifyChange(TextDocumentChange.REPLACE_LINES, line_number, 1, 1)
 
     # Fragments. Will replace mementos.
     def extractFragment(self, from_line, how_many=1):
         """
-        Extract a fragment of a document, together with its line and char metainfo.
-        Returns a new TextDocument containing the extracted data.
+        Extract a fragment of a document, together with its line metainfo.
+        Returns a new TextDocument containing the extracted data. As for
+        mementos, the char metainfo is not kept.
         """
         fragment = TextDocument()
-
-        for frag_line_number, line_number in enumerate(range(from_line, from_line+how_many), 2):
-            fragment.insertLine(frag_line_number, self.lineText(line_number), copy.deepcopy(self.charMeta( (line_number,1) )))
+        fragment.insertLines(2, self.linesText2(from_line, how_many))
 
         # Remove the top line that contains an empty line
         fragment.deleteLine(1)
 
         for name, meta_info in self.allLineMetaInfo().items():
             fragment_meta = fragment.createLineMetaInfo(name)
-            fragment_meta.setData(copy.deepcopy(meta_info.data(from_line, how_many)))
+            fragment_meta.setDataForLines({ marker.line-from_line+1: meta_info.memento(marker.line)
+                                            for marker in meta_info.markers(from_line, how_many) })
 
         return fragment
 
@@ -636,20 +687,15 @@ class TextDocument(core.VObject):
         """
         Insert a fragment in the document at the specified line
         """
-        self.insertLines(line_number, fragment.linesText2(1, fragment.numLines()))
-        for frag_num, num in enumerate(range(line_number, line_number+fragment.numLines()),1):
-            self.updateCharMeta((num, 1), fragment.charMeta((frag_num,1)))
+        with self.transaction():
+            self.insertLines(line_number, fragment.linesText2(1, fragment.numLines()))
 
-        for frag_meta_info_name, frag_meta_info in fragment.allLineMetaInfo().items():
-            self_meta_info = self.createLineMetaInfo(frag_meta_info_name)
-            self_meta_info.setData(frag_meta_info.data(), line_number)
+            for frag_meta_info_name, frag_meta_info in fragment.allLineMetaInfo().items():
+                self_meta_info = self.createLineMetaInfo(frag_meta_info_name)
+                self_meta_info.setData(frag_meta_info.data(), line_number)
 
-        for meta in self.allLineMetaInfo().values():
-            meta.notifyObservers()
-
-        self.contentChanged.emit()
-        self.metaContentChanged.emit()
-        self.numLinesChanged.emit()
+            for meta in self.allLineMetaInfo().values():
+                meta.notifyObservers()
 
 #    def replaceWithFragment(self, line_number, fragment):
 #        for frag_num, num in enumerate(range(line_number, line_number+fragment.numLines()),1):
@@ -676,9 +722,77 @@ class TextDocument(core.VObject):
         self.documentSaved = core.VSignal(self)
         self.numLinesChanged = core.VSignal(self)
 
+        # Emitted with a TextDocumentChange describing every modification,
+        # before the other signals.
+        self.changed = core.VSignal(self)
+
+    def _notifyLinesAppended(self, old_num_lines):
+        how_many = self._storage.numLines() - old_num_lines
+        if how_many == 0:
+            return
+
+        for meta in self.allLineMetaInfo().values():
+            meta.addLines(old_num_lines+1, how_many)
+
+        for meta in self.allLineMetaInfo().values():
+            meta.notifyObservers()
+
+        self._notifyChange(TextDocumentChange.INSERT_LINES, old_num_lines+1, 0, how_many)
+
+    def _notifyChange(self, kind, line_number, lines_removed, lines_added,
+                      column=None, chars_removed=0, chars_added=0):
+        """
+        Increments the version and emits the signals for a change, or
+        merges the change with the pending one during a transaction.
+        """
+        self._version += 1
+        change = TextDocumentChange(kind, self._version, line_number, lines_removed, lines_added,
+                                    column, chars_removed, chars_added)
+
+        if self._transaction_depth > 0:
+            if self._pending_change is not None:
+                change = self._pending_change.merged(change)
+            self._pending_change = change
+            return
+
+        self._emitChange(change)
+
+    def _emitChange(self, change):
+        """
+        numLinesChanged is emitted only if the number of lines changed.
+        """
+        self.changed.emit(change)
+        self.contentChanged.emit()
+        self.metaContentChanged.emit()
+        if change.num_lines_delta != 0:
+            self.numLinesChanged.emit()
+
+    def _notifyMetaContentChanged(self):
+        if self._transaction_depth > 0:
+            self._pending_meta_content_changed = True
+            return
+
+        self.metaContentChanged.emit()
+
+    def _endTransaction(self):
+        """
+        Notifies the meta info observers, then emits the merged change
+        """
+        change, self._pending_change = self._pending_change, None
+        meta_content_changed, self._pending_meta_content_changed = self._pending_meta_content_changed, False
+        deferred, self._deferred_notifications = self._deferred_notifications, []
+
+        for meta_info in deferred:
+            meta_info.notifyObservers()
+
+        if change is not None:
+            self._emitChange(change)
+        elif meta_content_changed:
+            self.metaContentChanged.emit()
+
     def _checkLineNumber(self, line_number):
         if not self.isValidLine(line_number):
-            raise IndexError("Out of bound. line_number = %d, len = %d" % (line_number, len(self._contents)))
+            raise IndexError("Out of bound. line_number = %d, len = %d" % (line_number, self._storage.numLines()))
 
     def _checkPos(self, pos):
         if not self.isValidPos(pos):
@@ -0,0 +1,69 @@
+import collections
+
+class TextDocumentChange(collections.namedtuple("TextDocumentChange",
+                                                ["kind",
+                                                 "version",
+                                                 "line_number",
+                                                 "lines_removed",
+                                                 "lines_added",
+                                                 "column",
+                                                 "chars_removed",
+                                                 "chars_added"])):
+    """
+    Describes a modification of a TextDocument, as emitted by its changed
+    signal. Starting at line_number, lines_removed old lines have been
+    replaced by lines_added new lines. version is the document version
+    after the change, and increases at every change.
+
+    For changes inside a single line, column is the first changed column,
+    where chars_removed characters were replaced by chars_added characters.
+    column is None when whole lines changed.
+
+    The changes made in a transaction are merged in a single MULTIPLE
+    change, covering the lines touched by any of them.
+    """
+    INSERT_CHARS = "InsertChars"
+    DELETE_CHARS = "DeleteChars"
+    REPLACE_CHARS = "ReplaceChars"
+    BREAK_LINE = "BreakLine"
+    JOIN_LINES = "JoinLines"
+    INSERT_LINES = "InsertLines"
+    DELETE_LINES = "DeleteLines"
+    REPLACE_LINES = "ReplaceLines"
+    RESET = "Reset"
+
+    # Several changes merged by a transaction
+    MULTIPLE = "Multiple"
+
+    __slots__ = ()
+
+    @property
+    def last_line_added(self):
+        """
+        The last of the new lines, or line_number-1 if no line was added
+        """
+        return self.line_number + self.lines_added - 1
+
+    @property
+    def num_lines_delta(self):
+        """
+        How much the number of lines of the document changed
+        """
+        return self.lines_added - self.lines_removed
+
+    def merged(self, next_change):
+        """
+        Returns a MULTIPLE change equivalent to this change followed by
+        next_change, whose line numbers refer to the document after this one.
+        Unchanged lines between the two are counted as replaced.
+        """
+        start = min(self.line_number, next_change.line_number)
+        end = max(self.line_number+self.lines_added,
+                  next_change.line_number+next_change.lines_removed)
+
+        return TextDocumentChange(TextDocumentChange.MULTIPLE,
+                                  next_change.version,
+                                  start,
+                                  end-start-self.lines_added+self.lines_removed,
+                                  end-start+next_change.lines_added-next_change.lines_removed,
+                                  None, 0, 0)
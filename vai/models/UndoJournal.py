@@ -0,0 +1,338 @@
+import json
+import os
+from .TextDelta import TextDelta
+from .commands.JournalCommand import JournalCommand
+from .. import paths
+
+# Version of the journal file format
+JOURNAL_VERSION = 1
+
+# A step not changing the text
+_EMPTY_DELTA = TextDelta(1, 1, "", "")
+
+# Maximum number of journal files kept. The least recently saved
+# are removed.
+MAX_JOURNALS = 500
+
+class UndoJournal:
+    """
+    Keeps the undo history of a buffer across sessions. Every undo step is
+    recorded as a TextDelta, and the records are appended to a journal file
+    when the document is saved. The file is named after the md5 of the saved
+    text, so that it is found again when a file with that content is opened.
+
+    When the journal is loaded, each step becomes a JournalCommand in the
+    command history, applying its delta only if it is undone or redone.
+
+    The journal text is made of JSON lists, one per line:
+        ["vai-undo", version]             header
+        ["d", line, column, old, new]     new step, discarding the redo steps
+        ["m", line, column, old, new]     the last step, merged with a change
+        ["u"], ["r"]                      undo, redo
+        ["u", line, column, old, new]     undo, giving the redo step
+        ["r", line, column, old, new]     redo, giving the undo step
+        ["e", how_many]                   oldest steps dropped
+        ["x", how_many]                   oldest undo steps unknown
+        ["z"]                             redo steps unknown
+        ["s", md5]                        document saved
+    A step is unknown when an undo or a redo did not give back the text
+    of the previous step exactly, or when it was dropped from the file by
+    a compaction. Records without a delta give an unknown step. Only the
+    known steps next to the saved text are restored.
+
+    When the file grows above max_size bytes, it is rewritten with only
+    the current steps, dropping the oldest ones if needed.
+    """
+    def __init__(self, buffer, key=None, max_size=1024*1024, journal_dir=None):
+        self._buffer = buffer
+        self._document = buffer.document
+        self._history = buffer.command_history
+        self._key = key
+        self._max_size = max_size
+        self._journal_dir = journal_dir
+
+        # TextDeltas of the undoable and redoable steps,
+        # or None for the unknown ones
+        self._past = []
+        self._future = []
+
+        # Records not yet written to the file
+        self._records = []
+
+        # The lines of the document at the last step, and the lines
+        # changed since, as first line and number of unchanged lines
+        # at the end of the document
+        self._lines = self._document.linesText2(1, self._document.numLines())
+        self._first_changed_line = None
+        self._num_unchanged_end_lines = None
+
+        self._loading = False
+
+        # True if the records can be appended to the journal file
+        self._in_file = False
+
+        if key is not None:
+            self._load()
+
+        self._document.changed.connect(self._documentChanged)
+        self._history.commandAdded.connect(self._commandAdded)
+        self._history.commandUndone.connect(self._commandUndone)
+        self._history.commandRedone.connect(self._commandRedone)
+
+    @property
+    def key(self):
+        return self._key
+
+    def numSteps(self):
+        """
+        Returns the number of undoable and redoable steps in the journal
+        """
+        return len(self._past) + len(self._future)
+
+    def save(self, key):
+        """
+        Writes the steps recorded since the last save, once the document
+        is saved with md5 key. The journal file is renamed after key.
+        """
+        # Changes made outside of the command history, if any,
+        # are merged in the last step
+        self._takeChanges(merge=True)
+        self._records.append(["s", key])
+
+        old_file = self._filename(self._key) if self._key is not None else None
+        new_file = self._filename(key)
+        self._key = key
+
+        try:
+            if self._in_file and os.path.exists(old_file):
+                with open(old_file, "a") as f:
+                    f.write("".join(_dumps(record) for record in self._records))
+                os.replace(old_file, new_file)
+                if os.path.getsize(new_file) > self._max_size:
+                    self._compact()
+            elif self.numSteps() != 0:
+                self._compact()
+        except OSError:
+            self._in_file = False
+        else:
+            self._in_file = os.path.exists(new_file)
+
+        self._records = []
+        _pruneJournals(os.path.dirname(new_file))
+
+    # Private
+
+    def _load(self):
+        """
+        Reads the steps from the journal file. Nothing is done if the file
+        is missing or not usable.
+        """
+        past = []
+        future = []
+        saved = None
+        try:
+            with open(self._filename(self._key), "r") as f:
+                if json.loads(f.readline()) != ["vai-undo", JOURNAL_VERSION]:
+                    return
+
+                for line in f:
+                    record = json.loads(line)
+                    op = record[0]
+                    delta = TextDelta(*record[1:]) if len(record) == 5 else None
+                    if op == "d":
+                        past.append(delta)
+                        future = []
+                    elif op == "m":
+                        past[-1] = delta
+                    elif op == "u":
+                        step = past.pop()
+                        future.insert(0, delta if len(record) == 5 else step)
+                    elif op == "r":
+                        step = future.pop(0)
+                        past.append(delta if len(record) == 5 else step)
+                    elif op == "e":
+                        del past[:record[1]]
+                    elif op == "x":
+                        past[:record[1]] = [None] * record[1]
+                    elif op == "z":
+                        future = [None] * len(future)
+                    elif op == "s" and record[1] == self._key:
+                        saved = (list(past), list(future))
+        except (OSError, ValueError, IndexError, TypeError):
+            return
+
+        if saved is None:
+            return
+
+        # Records after the last save, if any, do not match the text.
+        # Only the known steps next to it can be used.
+        past, future = saved
+        first_known = len(past)
+        while first_known > 0 and past[first_known-1] is not None:
+            first_known -= 1
+        past = past[first_known:]
+        if None in future:
+            future = future[:future.index(None)]
+
+        self._loading = True
+        try:
+            for delta in past + future:
+                self._history.add(JournalCommand(self._buffer, delta))
+            for delta in future:
+                self._history.prev()
+        finally:
+            self._loading = False
+
+        # The history may keep fewer steps
+        self._past = past[len(past)-self._history.numUndoableCommands():]
+        self._future = future
+        self._in_file = self._past == saved[0] and self._future == saved[1]
+
+    def _compact(self):
+        """
+        Rewrites the journal file with the current steps only. The oldest
+        ones are dropped if they do not fit in max_size.
+        """
+        records = [_dumps(["d"]+list(delta) if delta is not None else ["d"])
+                   for delta in self._past+self._future]
+        records += [_dumps(["u"])] * len(self._future)
+        records.append(_dumps(["s", self._key]))
+
+        header = _dumps(["vai-undo", JOURNAL_VERSION])
+        size = len(header) + sum(len(record) for record in records)
+        num_dropped = 0
+        while num_dropped < len(self._past) and \
+                (size > self._max_size // 2 or self._past[num_dropped] is None):
+            size -= len(records[num_dropped])
+            num_dropped += 1
+
+        # The dropped steps are still in the history. They are written as
+        # unknown steps, so that the next records apply to the file.
+        if num_dropped != 0:
+            records[:num_dropped] = [_dumps(["x", num_dropped])]
+
+        filename = self._filename(self._key)
+        temp_file = filename + ".tmp"
+        with open(temp_file, "w") as f:
+            f.write(header)
+            f.write("".join(records))
+        os.replace(temp_file, filename)
+
+    def _filename(self, key):
+        journal_dir = self._journal_dir
+        if journal_dir is None:
+            journal_dir = paths.undoJournalDir()
+        return os.path.join(journal_dir, key+".journal")
+
+    def _documentChanged(self, change):
+        num_unchanged = self._document.numLines() - max(change.last_line_added, change.line_number-1)
+        if self._first_changed_line is None:
+            self._first_changed_line = change.line_number
+            self._num_unchanged_end_lines = num_unchanged
+        else:
+            self._first_changed_line = min(self._first_changed_line, change.line_number)
+            self._num_unchanged_end_lines = min(self._num_unchanged_end_lines, num_unchanged)
+
+    def _takeChanges(self, merge=False):
+        """
+        Returns the TextDelta of the changes since the last step, or None if
+        the text did not change. If merge is True, the changes are merged
+        in the last step instead.
+        """
+        if self._first_changed_line is None:
+            return None
+
+        first_line = self._first_changed_line
+        end_index = len(self._lines) - self._num_unchanged_end_lines
+        num_new_lines = self._document.numLines() - self._num_unchanged_end_lines - first_line + 1
+        self._first_changed_line = None
+        self._num_unchanged_end_lines = None
+
+        new_lines = []
+        if num_new_lines > 0:
+            new_lines = self._document.linesText2(first_line, num_new_lines)
+
+        delta = TextDelta.between(self._lines[first_line-1:end_index], new_lines, first_line)
+        if merge and delta is not None and len(self._past) != 0:
+            merged_delta = None
+            if self._past[-1] is not None:
+                # If the two changes cancel out, keep an empty step
+                merged_delta = self._past[-1].composed(delta, self._lines) or _EMPTY_DELTA
+            self._past[-1] = merged_delta
+            self._records.append(["m"]+list(merged_delta) if merged_delta is not None else ["m"])
+
+        self._lines[first_line-1:end_index] = new_lines
+        return delta
+
+    def _commandAdded(self, command, merged, num_evicted):
+        if self._loading:
+            return
+
+        self._future = []
+        if merged and len(self._past) != 0:
+            self._takeChanges(merge=True)
+        else:
+            delta = self._takeChanges() or _EMPTY_DELTA
+            self._past.append(delta)
+            self._records.append(["d"]+list(delta))
+
+        if num_evicted != 0:
+            del self._past[:num_evicted]
+            self._records.append(["e", num_evicted])
+
+    def _commandUndone(self, command):
+        if self._loading or len(self._past) == 0:
+            return
+
+        step = self._past.pop()
+        redo_delta = (self._takeChanges() or _EMPTY_DELTA).inverse()
+        if step is not None and step.isEquivalent(redo_delta, self._lines):
+            self._future.insert(0, step)
+            self._records.append(["u"])
+            return
+
+        self._future.insert(0, redo_delta)
+        self._records.append(["u"]+list(redo_delta))
+
+        # The text is not the one the undo steps start from
+        if len(self._past) != 0:
+            self._past = [None] * len(self._past)
+            self._records.append(["x", len(self._past)])
+
+    def _commandRedone(self, command):
+        if self._loading or len(self._future) == 0:
+            return
+
+        step = self._future.pop(0)
+        undo_delta = self._takeChanges() or _EMPTY_DELTA
+        if step is not None and step.inverse().isEquivalent(undo_delta.inverse(), self._lines):
+            self._past.append(step)
+            self._records.append(["r"])
+            return
+
+        self._past.append(undo_delta)
+        self._records.append(["r"]+list(undo_delta))
+
+        # The text is not the one the redo steps start from
+        if len(self._future) != 0:
+            self._future = [None] * len(self._future)
+            self._records.append(["z"])
+
+def _dumps(record):
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+def _pruneJournals(journal_dir):
+    """
+    Removes the least recently saved journals, if there are too many
+    """
+    try:
+        journals = [os.path.join(journal_dir, name) for name in os.listdir(journal_dir)
+                    if name.endswith(".journal")]
+        if len(journals) <= MAX_JOURNALS:
+            return
+
+        journals.sort(key=os.path.getmtime)
+        for path in journals[:len(journals)-MAX_JOURNALS]:
+            os.remove(path)
+    except OSError:
+        pass
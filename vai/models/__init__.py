@@ -4,6 +4,13 @@ from .EditAreaModel import EditAreaModel
 from .GlobalState import GlobalState
 from .TextDocumentCursor import TextDocumentCursor
 from .TextDocument import TextDocument
+from .TextDocumentChange import TextDocumentChange
+from .LineMarker import LineMarker
+from .TextDelta import TextDelta
+from .UndoJournal import UndoJournal
+from .DocumentLoader import DocumentLoader
+from .DocumentSaver import DocumentSaver
+from .LineHashTree import LineHashTree
 from .EditorMode import EditorMode
 from .Configuration import Configuration
 from .EditorState import EditorState
@@ -1,3 +1,10 @@
+import sys
+
+# Estimate of the memory kept by a command, and by each of its line
+# mementos, besides the line text
+COMMAND_OVERHEAD = 600
+MEMENTO_OVERHEAD = 300
+
 class BufferCommand(object):
     """A base class for commands modifying a buffer"""
     MEMENTO_INSERT, MEMENTO_REPLACE = list(range(2))
@@ -52,15 +59,38 @@ class BufferCommand(object):
 
         return result
 
+    def mergeWith(self, command):
+        """
+        Merges command, executed right after this one, so that both are undone
+        and redone as a single step. Returns True if merged. By default,
+        commands are not merged.
+        """
+        return False
+
+    def memoryUsage(self):
+        """
+        Returns an estimate of the memory, in bytes, that the command keeps
+        to be undone.
+        """
+        usage = COMMAND_OVERHEAD
+        for _, _, ((_, text), _) in self._line_memento_data:
+            usage += MEMENTO_OVERHEAD + sys.getsizeof(text)
+
+        if self._sub_command is not None:
+            usage += self._sub_command.memoryUsage()
+
+        return usage
+
     def undo(self):
         if self._sub_command is not None:
             self._sub_command.undo()
             self._sub_command = None
             return
 
-        for i in range(len(self._line_memento_data)):
-            self.restoreLineMemento()
+        with self._document.transaction():
+            for i in range(len(self._line_memento_data)):
+                self.restoreLineMemento()
 
-        self.restoreCursorPos()
-        self.restoreModifiedState()
+            self.restoreCursorPos()
+            self.restoreModifiedState()
 
@@ -0,0 +1,39 @@
+from .BufferCommand import BufferCommand
+from .CommandResult import CommandResult
+
+class CompleteWordCommand(BufferCommand):
+    """
+    Replaces the partial word before the cursor with its completion,
+    and moves the cursor after it.
+    """
+    def __init__(self, buffer, partial_word, completion):
+        super().__init__(buffer)
+        self._partial_word = partial_word
+        self._completion = completion
+
+    def execute(self):
+        cursor = self._cursor
+        document = self._document
+
+        if self.savedCursorPos() is None:
+            self.saveCursorPos()
+
+        pos = self.savedCursorPos()
+        start_pos = (pos[0], pos[1]-len(self._partial_word))
+        if start_pos[1] < 1 or document.lineText(pos[0])[start_pos[1]-1:pos[1]-1] != self._partial_word:
+            return CommandResult(success=False, info=None)
+
+        line_meta = document.lineMetaInfo("Change")
+        changed = line_meta.data(pos[0])
+
+        self.saveModifiedState()
+        self.saveLineMemento(pos[0], BufferCommand.MEMENTO_REPLACE)
+
+        if changed is None:
+            line_meta.setData("modified", pos[0])
+
+        document.replaceChars(start_pos, len(self._partial_word), self._completion)
+        cursor.toPos( (pos[0], start_pos[1]+len(self._completion)) )
+        document.documentMetaInfo("Modified").setData(True)
+
+        return CommandResult(success=True, info=None)
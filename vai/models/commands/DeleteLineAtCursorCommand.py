@@ -1,6 +1,5 @@
 from .BufferCommand import BufferCommand
 from .CommandResult import CommandResult
-import copy
 
 class DeleteLineAtCursorCommand(BufferCommand):
     def execute(self):
@@ -18,7 +17,7 @@ class DeleteLineAtCursorCommand(BufferCommand):
 
         self.saveModifiedState()
         self.saveLineMemento(pos[0], BufferCommand.MEMENTO_INSERT)
-        old_line = copy.deepcopy(self.lastSavedMemento()[2])
+        old_line = self.lastSavedMemento()[2]
         self._old_line_meta_info = {}
 
         if pos[0] == document.numLines():
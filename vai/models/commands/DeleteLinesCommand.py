@@ -1,6 +1,7 @@
 from .BufferCommand import BufferCommand
 from .CommandResult import CommandResult
 import copy
+import sys
 
 class DeleteLinesCommand(BufferCommand):
     """
@@ -31,18 +32,19 @@ class DeleteLinesCommand(BufferCommand):
 
         self._fragment = document.extractFragment(self._from_line, self._num_lines)
 
-        if document.lineMetaInfo("Change").data(pos[0]) != "added":
-            # Add markers above and below
-            if line_above is not None:
-                self._old_line_meta_info[-1] = document.lineMetaInfo("Change").data(line_above)
-                document.lineMetaInfo("Change").setData("deletion_before", line_above)
+        with document.transaction():
+            if document.lineMetaInfo("Change").data(pos[0]) != "added":
+                # Add markers above and below
+                if line_above is not None:
+                    self._old_line_meta_info[-1] = document.lineMetaInfo("Change").data(line_above)
+                    document.lineMetaInfo("Change").setData("deletion_before", line_above)
 
-            if line_below is not None:
-                self._old_line_meta_info[1] = document.lineMetaInfo("Change").data(line_below)
-                document.lineMetaInfo("Change").setData("deletion_after", line_below)
+                if line_below is not None:
+                    self._old_line_meta_info[1] = document.lineMetaInfo("Change").data(line_below)
+                    document.lineMetaInfo("Change").setData("deletion_after", line_below)
 
-        document.deleteLines(self._from_line, self._num_lines)
-        document.documentMetaInfo("Modified").setData(True)
+            document.deleteLines(self._from_line, self._num_lines)
+            document.documentMetaInfo("Modified").setData(True)
 
         self._repositionCursor(self._from_line, line_above, line_below)
 
@@ -61,17 +63,23 @@ class DeleteLinesCommand(BufferCommand):
             cursor.toPos((from_line, 1))
 
     def undo(self):
-        super().undo()
         document = self._document
-        cursor = self._cursor
-        pos = cursor.pos
+        with document.transaction():
+            super().undo()
+            cursor = self._cursor
+            pos = cursor.pos
 
-        if -1 in self._old_line_meta_info:
-            document.lineMetaInfo("Change").setData(self._old_line_meta_info[-1], pos[0]-1)
+            if -1 in self._old_line_meta_info:
+                document.lineMetaInfo("Change").setData(self._old_line_meta_info[-1], pos[0]-1)
 
-        if 1 in self._old_line_meta_info:
-            document.lineMetaInfo("Change").setData(self._old_line_meta_info[1], pos[0]+1)
+            if 1 in self._old_line_meta_info:
+                document.lineMetaInfo("Change").setData(self._old_line_meta_info[1], pos[0]+1)
 
-        document.insertFragment(self._from_line, self._fragment)
+            document.insertFragment(self._from_line, self._fragment)
         self._fragment = None
 
+    def memoryUsage(self):
+        usage = super().memoryUsage()
+        if self._fragment is not None:
+            usage += sum(map(sys.getsizeof, self._fragment.linesText2(1, self._fragment.numLines())))
+        return usage
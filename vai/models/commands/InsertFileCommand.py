@@ -27,9 +27,10 @@ class InsertFileCommand(BufferCommand):
         cursor.toPos((line_pos, 1))
 
         self._how_many = len(lines)
-        document.insertLines(line_pos, lines)
-        document.lineMetaInfo("Change").setData(["added"] * self._how_many, line_pos)
-        document.documentMetaInfo("Modified").setData(True)
+        with document.transaction():
+            document.insertLines(line_pos, lines)
+            document.lineMetaInfo("Change").setData(["added"] * self._how_many, line_pos)
+            document.documentMetaInfo("Modified").setData(True)
 
         return CommandResult(True, None)
 
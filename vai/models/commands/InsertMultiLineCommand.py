@@ -19,9 +19,10 @@ class InsertMultiLineCommand(BufferCommand):
         self.saveModifiedState()
         pos = self.savedCursorPos()
 
-        document.insertLines(pos[0]+self._position, self._text)
-        document.lineMetaInfo("Change").setData(["added"]*len(self._text), pos[0]+self._position)
-        document.documentMetaInfo("Modified").setData(True)
+        with document.transaction():
+            document.insertLines(pos[0]+self._position, self._text)
+            document.lineMetaInfo("Change").setData(["added"]*len(self._text), pos[0]+self._position)
+            document.documentMetaInfo("Modified").setData(True)
         cursor.toCharFirstNonBlankForLine(pos[0]+self._position)
         return CommandResult(True, None)
 
@@ -33,3 +33,21 @@ class InsertStringCommand(BufferCommand):
 
         return CommandResult(success=True, info=None)
 
+    def mergeWith(self, command):
+        """
+        Merges another InsertStringCommand continuing the typing on the same
+        line, right after the text inserted by this one. Undoing restores
+        the line as it was before this command.
+        """
+        if type(command) is not InsertStringCommand or command._buffer is not self._buffer:
+            return False
+
+        if "\n" in self._text or "\n" in command._text:
+            return False
+
+        pos = self.savedCursorPos()
+        if pos is None or command.savedCursorPos() != (pos[0], pos[1]+len(self._text)):
+            return False
+
+        self._text += command._text
+        return True
@@ -0,0 +1,36 @@
+from .BufferCommand import BufferCommand, COMMAND_OVERHEAD
+from .CommandResult import CommandResult
+import sys
+
+class JournalCommand(BufferCommand):
+    """
+    An undo step restored from the UndoJournal of a previous session.
+    It applies its TextDelta, so nothing is replayed until it is
+    undone or redone.
+    """
+    def __init__(self, buffer, delta):
+        super().__init__(buffer)
+        self._delta = delta
+
+    @property
+    def delta(self):
+        return self._delta
+
+    def execute(self):
+        self.saveModifiedState()
+        self._delta.applyToDocument(self._document)
+        self._cursor.toPos(self._delta.endPos())
+        self._document.documentMetaInfo("Modified").setData(True)
+        return CommandResult(success=True, info=None)
+
+    def undo(self):
+        self._delta.inverse().applyToDocument(self._document)
+        self._cursor.toPos((self._delta.line_number, self._delta.column))
+        if self._saved_modified_state is None:
+            # Undone before being executed in this session
+            self._document.documentMetaInfo("Modified").setData(True)
+        else:
+            self.restoreModifiedState()
+
+    def memoryUsage(self):
+        return COMMAND_OVERHEAD + sys.getsizeof(self._delta.old_text) + sys.getsizeof(self._delta.new_text)
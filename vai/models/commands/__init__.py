@@ -18,3 +18,5 @@ from .InsertFileCommand import InsertFileCommand
 from .IndentCommand import IndentCommand
 from .DedentCommand import DedentCommand
 from .DeleteLinesCommand import DeleteLinesCommand
+from .CompleteWordCommand import CompleteWordCommand
+from .JournalCommand import JournalCommand
@@ -0,0 +1,81 @@
+EOL = '\n'
+
+class ListStorage:
+    """
+    Line storage for TextDocument. Keeps the lines text and their char
+    meta dictionaries in two parallel python lists. Indexes are zero based.
+    Fast and simple for ordinary files.
+    """
+    def __init__(self):
+        self._texts = [EOL]
+        self._metas = [{}]
+
+    def isReadOnly(self):
+        return False
+
+    def numLines(self):
+        return len(self._texts)
+
+    def text(self, index):
+        return self._texts[index]
+
+    def texts(self, index, how_many):
+        return self._texts[index:index+how_many]
+
+    def iterTexts(self, index, how_many):
+        return iter(self._texts[index:index+how_many])
+
+    def charMeta(self, index):
+        return self._metas[index]
+
+    def line(self, index):
+        """
+        Returns the (char_meta, text) pair at index
+        """
+        return (self._metas[index], self._texts[index])
+
+    def setLine(self, index, char_meta, text):
+        self._metas[index] = char_meta
+        self._texts[index] = text
+
+    def insertLines(self, index, lines):
+        """
+        Inserts a list of (char_meta, text) pairs before index
+        """
+        self._metas[index:index] = [char_meta for char_meta, _ in lines]
+        self._texts[index:index] = [text for _, text in lines]
+
+    def deleteLines(self, index, how_many):
+        del self._metas[index:index+how_many]
+        del self._texts[index:index+how_many]
+
+    def documentText(self, from_index=0):
+        return "".join(self._texts[from_index:])
+
+    def snapshot(self):
+        """
+        Returns the text as a list of parts, each a string or a tuple of
+        line texts, not affected by later changes
+        """
+        return [tuple(self._texts)]
+
+    def load(self, source):
+        """
+        Replaces the whole content with the lines from source, which can
+        be a file object or any iterable of strings.
+        """
+        texts = [text if text.endswith(EOL) else text+EOL for text in source]
+        if len(texts) == 0:
+            texts = [EOL]
+
+        self._texts = texts
+        self._metas = [{} for _ in texts]
+
+    def appendText(self, text):
+        """
+        Adds the lines of text at the end. The text must be made of
+        whole lines, each ending with EOL.
+        """
+        texts = [line+EOL for line in text.split(EOL)[:-1]]
+        self._texts.extend(texts)
+        self._metas.extend({} for _ in texts)
@@ -0,0 +1,223 @@
+import array
+import bisect
+import collections
+import io
+import mmap
+import re
+
+EOL = '\n'
+
+# Number of bytes of each block of the line index
+BLOCK_SIZE = 1024 * 1024
+
+# Number of blocks whose line offsets are kept
+CACHED_BLOCKS = 16
+
+# Lines longer than this number of bytes are cut when read
+MAX_LINE_LENGTH = 64 * 1024
+
+_NEWLINE = re.compile(b"\n")
+
+class MmapStorage:
+    """
+    Read-only line storage for TextDocument, meant for viewing huge files.
+    The file is memory mapped, and only the requested lines are decoded.
+
+    The line index keeps the number of lines starting before each block
+    of BLOCK_SIZE bytes. It is built a few blocks at a time with indexMore,
+    and the lines are available as their blocks are indexed. The offsets
+    of the lines inside a block are found when needed, and kept for the
+    last CACHED_BLOCKS blocks used. Mapped pages are released once scanned,
+    if the platform allows it, so that the memory used does not depend on
+    the size of the file. Indexes are zero based.
+    """
+    def __init__(self, block_size=BLOCK_SIZE):
+        self._block_size = block_size
+        self._map = None
+        self._size = 0
+        self._resetIndex()
+
+    def numLines(self):
+        num_lines = self._line_counts[-1]
+        if self.isIndexed() and (self._size == 0 or self._map[self._size-1] != ord(EOL)):
+            # The last line has no EOL, or the file is empty
+            num_lines += 1
+        return max(num_lines, 1)
+
+    def isReadOnly(self):
+        return True
+
+    def isIndexed(self):
+        """
+        True if the whole file is indexed
+        """
+        return self._indexed_size == self._size
+
+    def indexedSize(self):
+        """
+        Returns the number of bytes indexed
+        """
+        return self._indexed_size
+
+    def size(self):
+        return self._size
+
+    def data(self):
+        """
+        Returns the mapped bytes of the file
+        """
+        return self._map if self._map is not None else b""
+
+    def text(self, index):
+        if not (0 <= index < self.numLines()):
+            raise IndexError("Out of bound. index = %d, len = %d" % (index, self.numLines()))
+
+        start = self.lineStart(index)
+        if index < self._line_counts[-1]:
+            end = self.lineStart(index+1)
+        else:
+            # The end of the line is not indexed yet
+            end = self.data().find(b"\n", start, start+MAX_LINE_LENGTH) + 1 or self._size
+
+        text = self.data()[start:min(end, start+MAX_LINE_LENGTH)].decode("utf-8", "replace")
+        if text.endswith(EOL):
+            text = text[:-1]
+        if text.endswith("\r"):
+            text = text[:-1]
+        return text + EOL
+
+    def texts(self, index, how_many):
+        return [self.text(i) for i in range(index, index+how_many)]
+
+    def iterTexts(self, index, how_many):
+        return iter(self.texts(index, how_many))
+
+    def charMeta(self, index):
+        # Nothing is stored. Read-only documents are not lexed.
+        return {}
+
+    def line(self, index):
+        """
+        Returns the (char_meta, text) pair at index
+        """
+        return (self.charMeta(index), self.text(index))
+
+    def setLine(self, index, char_meta, text):
+        raise io.UnsupportedOperation("MmapStorage is read-only")
+
+    def insertLines(self, index, lines):
+        raise io.UnsupportedOperation("MmapStorage is read-only")
+
+    def deleteLines(self, index, how_many):
+        raise io.UnsupportedOperation("MmapStorage is read-only")
+
+    def appendText(self, text):
+        raise io.UnsupportedOperation("MmapStorage is read-only")
+
+    def documentText(self, from_index=0):
+        return "".join(self.texts(from_index, self.numLines()-from_index))
+
+    def snapshot(self):
+        """
+        Returns the text as a list of parts, each a string or a tuple of
+        line texts
+        """
+        return [tuple(self.texts(0, self.numLines()))]
+
+    def load(self, source):
+        """
+        Maps the file of source, which must be a file object. Nothing
+        is indexed yet.
+        """
+        self.close()
+        source.seek(0, io.SEEK_END)
+        self._size = source.tell()
+        if self._size != 0:
+            self._map = mmap.mmap(source.fileno(), self._size, access=mmap.ACCESS_READ)
+        self._resetIndex()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = None
+        self._size = 0
+        self._resetIndex()
+
+    def indexMore(self, num_bytes):
+        """
+        Indexes at least num_bytes more of the file. Returns True once
+        the whole file is indexed.
+        """
+        end = min(self._indexed_size + max(num_bytes, 1), self._size)
+        while self._indexed_size < end:
+            start = self._indexed_size
+            block_end = min(start + self._block_size, self._size)
+            self._line_counts.append(self._line_counts[-1] + self._map[start:block_end].count(b"\n"))
+            self.release(start, block_end)
+            self._indexed_size = block_end
+
+        return self.isIndexed()
+
+    def lineStart(self, index):
+        """
+        Returns the offset of the first byte of the line at index
+        """
+        if index == 0:
+            return 0
+
+        # The line starts after the EOL number index-1
+        eol_index = index - 1
+        block_index = bisect.bisect_right(self._line_counts, eol_index) - 1
+        return self._blockLineStarts(block_index)[eol_index - self._line_counts[block_index]]
+
+    def lineIndex(self, offset):
+        """
+        Returns the index of the line containing the byte at offset
+        """
+        if offset >= self._indexed_size:
+            return self.numLines() - 1
+
+        block_index = offset // self._block_size
+        line_starts = self._blockLineStarts(block_index)
+        index = self._line_counts[block_index] + bisect.bisect_right(line_starts, offset)
+        return min(index, self.numLines() - 1)
+
+    def release(self, start, end):
+        """
+        Tells the system that the mapped pages between the offsets start
+        and end are no longer needed. They are read again if accessed.
+        """
+        if self._map is None or not hasattr(self._map, "madvise"):
+            return
+
+        start -= start % mmap.PAGESIZE
+        if end > start:
+            self._map.madvise(mmap.MADV_DONTNEED, start, end-start)
+
+    # Private
+
+    def _resetIndex(self):
+        # Number of EOLs before each indexed block, and at the end
+        # of the indexed bytes
+        self._line_counts = array.array("Q", [0])
+        self._indexed_size = 0
+
+        # Block index -> offsets of the lines starting in the block
+        self._line_starts = collections.OrderedDict()
+
+    def _blockLineStarts(self, block_index):
+        line_starts = self._line_starts.get(block_index)
+        if line_starts is not None:
+            self._line_starts.move_to_end(block_index)
+            return line_starts
+
+        start = block_index * self._block_size
+        end = min(start + self._block_size, self._size)
+        line_starts = array.array("Q", (m.end() for m in _NEWLINE.finditer(self._map, start, end)))
+        self.release(start, end)
+
+        self._line_starts[block_index] = line_starts
+        if len(self._line_starts) > CACHED_BLOCKS:
+            self._line_starts.popitem(last=False)
+
+        return line_starts
@@ -0,0 +1,386 @@
+EOL = '\n'
+
+# Target number of lines in a block. Blocks are split when they grow past
+# twice this size.
+BLOCK_SIZE = 1024
+
+# Number of characters read at once when loading from a file object.
+CHUNK_SIZE = 1024 * 1024
+
+class RopeStorage:
+    """
+    Line storage for TextDocument, meant for very large files.
+    Lines are kept in blocks, and a Fenwick tree over the block sizes
+    finds the block holding a given line in O(log n), so that edits only
+    touch a single block instead of the whole document.
+
+    When loading from a file, each block just holds the raw chunk of text
+    as it was read. The chunk is split into lines the first time one of
+    them is accessed, so opening a large file does not create one python
+    object per line. Indexes are zero based.
+    """
+    def __init__(self, block_size=BLOCK_SIZE, chunk_size=CHUNK_SIZE):
+        self._block_size = block_size
+        self._chunk_size = chunk_size
+        self._blocks = [_Block.fromTexts([EOL])]
+        self._rebuildIndex()
+
+    def isReadOnly(self):
+        return False
+
+    def numLines(self):
+        return self._num_lines
+
+    def text(self, index):
+        _, block, offset = self._locate(index)
+        return block.texts[offset]
+
+    def texts(self, index, how_many):
+        return [self.text(i) for i in range(index, index+how_many)]
+
+    def iterTexts(self, index, how_many):
+        """
+        Generator. Yields the texts of the how_many lines from index.
+        The blocks still holding their raw text are not split.
+        """
+        if how_many <= 0:
+            return
+
+        if not (0 <= index and index+how_many <= self._num_lines):
+            raise IndexError("Out of bound. index = %d, how_many = %d, len = %d" % (index, how_many, self._num_lines))
+
+        block_index, offset = self._find(index)
+        while how_many > 0:
+            block = self._blocks[block_index]
+            texts = block.texts if block.raw is None else _splitRaw(block.raw)
+            count = min(how_many, block.size - offset)
+            yield from texts[offset:offset+count]
+            how_many -= count
+            block_index += 1
+            offset = 0
+
+    def charMeta(self, index):
+        _, block, offset = self._locate(index)
+        char_meta = block.metas[offset]
+        if char_meta is None:
+            char_meta = {}
+            block.metas[offset] = char_meta
+        return char_meta
+
+    def line(self, index):
+        """
+        Returns the (char_meta, text) pair at index
+        """
+        return (self.charMeta(index), self.text(index))
+
+    def setLine(self, index, char_meta, text):
+        _, block, offset = self._locate(index)
+        block.metas[offset] = char_meta
+        block.texts[offset] = text
+
+    def insertLines(self, index, lines):
+        """
+        Inserts a list of (char_meta, text) pairs before index
+        """
+        if len(lines) == 0:
+            return
+
+        if self._num_lines == 0:
+            self._blocks = [_Block.fromTexts([])]
+            self._rebuildIndex()
+            block_index, block, offset = 0, self._blocks[0], 0
+        elif index == self._num_lines:
+            block_index, block, offset = self._locate(index-1)
+            offset += 1
+        else:
+            block_index, block, offset = self._locate(index)
+
+        block.metas[offset:offset] = [char_meta for char_meta, _ in lines]
+        block.texts[offset:offset] = [text for _, text in lines]
+        block.size += len(lines)
+
+        if block.size > 2 * self._block_size:
+            self._splitBlock(block_index)
+        else:
+            self._updateIndex(block_index, len(lines))
+
+    def deleteLines(self, index, how_many):
+        if how_many <= 0:
+            return
+
+        block_index, offset = self._find(index)
+        if _isInside(self._blocks[block_index], offset, how_many):
+            # Materializing a raw block can split it, so check again
+            block_index, block, offset = self._locate(index)
+
+        if _isInside(self._blocks[block_index], offset, how_many):
+            block = self._blocks[block_index]
+            del block.metas[offset:offset+how_many]
+            del block.texts[offset:offset+how_many]
+            block.size -= how_many
+            self._updateIndex(block_index, -how_many)
+            self._mergeBlocks(block_index-1, block_index)
+            return
+
+        # Only the blocks at the two ends are split into lines. The whole
+        # blocks in between go away at once.
+        first = self._splitAt(index)
+        last = self._splitAt(index + how_many)
+        del self._blocks[first:last]
+        if not self._mergeBlocks(first-1, first):
+            self._rebuildIndex()
+
+    def documentText(self, from_index=0):
+        if from_index >= self._num_lines:
+            return ""
+
+        block_index, offset = self._find(from_index)
+        if offset != 0:
+            block_index, _, offset = self._locate(from_index)
+
+        parts = [self._blocks[block_index].text(offset)]
+        parts.extend(block.text() for block in self._blocks[block_index+1:])
+        return "".join(parts)
+
+    def snapshot(self):
+        """
+        Returns the text as a list of parts, each a string or a tuple of
+        line texts, not affected by later changes. Raw blocks give their
+        text as it is, without being split.
+        """
+        return [block.raw if block.raw is not None else tuple(block.texts)
+                for block in self._blocks]
+
+    def load(self, source):
+        """
+        Replaces the whole content with the lines from source, which can
+        be a file object or any iterable of strings. File objects are read
+        in chunks, which are only split into lines when accessed.
+        """
+        blocks = []
+        if hasattr(source, "read"):
+            leftover = ""
+            while True:
+                chunk = source.read(self._chunk_size)
+                if len(chunk) == 0:
+                    break
+
+                chunk = leftover + chunk
+                cut = chunk.rfind(EOL) + 1
+                leftover = chunk[cut:]
+                if cut != 0:
+                    blocks.append(_Block.fromRaw(chunk[:cut]))
+
+            if len(leftover) != 0:
+                blocks.append(_Block.fromRaw(leftover+EOL))
+        else:
+            texts = [text if text.endswith(EOL) else text+EOL for text in source]
+            for start in range(0, len(texts), self._block_size):
+                blocks.append(_Block.fromTexts(texts[start:start+self._block_size]))
+
+        if len(blocks) == 0:
+            blocks = [_Block.fromTexts([EOL])]
+
+        self._blocks = blocks
+        self._rebuildIndex()
+
+    def appendText(self, text):
+        """
+        Adds the lines of text at the end, as a raw block split only when
+        accessed. The text must be made of whole lines, each ending with EOL.
+        """
+        if len(text) == 0:
+            return
+
+        self._blocks.append(_Block.fromRaw(text))
+        self._rebuildIndex()
+
+    # Private
+
+    def _locate(self, index):
+        """
+        Returns the block index and the block containing the line at index,
+        already split in lines, and the offset of the line in the block.
+        """
+        if not (0 <= index < self._num_lines):
+            raise IndexError("Out of bound. index = %d, len = %d" % (index, self._num_lines))
+
+        block_index, offset = self._find(index)
+        block = self._blocks[block_index]
+        if block.raw is not None:
+            block.materialize()
+            if block.size > 2 * self._block_size:
+                self._splitBlock(block_index)
+                block_index, offset = self._find(index)
+                block = self._blocks[block_index]
+
+        return block_index, block, offset
+
+    def _find(self, index):
+        """
+        Fenwick tree descent. Returns the block index and the offset in
+        that block for the line at index.
+        """
+        tree = self._tree
+        position = 0
+        remaining = index
+        step = self._top_step
+        while step:
+            next_position = position + step
+            if next_position < len(tree) and tree[next_position] <= remaining:
+                position = next_position
+                remaining -= tree[next_position]
+            step >>= 1
+
+        return position, remaining
+
+    def _updateIndex(self, block_index, delta):
+        tree = self._tree
+        i = block_index + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+        self._num_lines += delta
+
+    def _rebuildIndex(self):
+        num_blocks = len(self._blocks)
+        tree = [0] * (num_blocks + 1)
+        for i, block in enumerate(self._blocks, 1):
+            tree[i] += block.size
+            parent = i + (i & -i)
+            if parent <= num_blocks:
+                tree[parent] += tree[i]
+
+        self._tree = tree
+        self._num_lines = sum(block.size for block in self._blocks)
+        self._top_step = 1 << (num_blocks.bit_length() - 1) if num_blocks else 0
+
+    def _splitAt(self, index):
+        """
+        Splits the block holding the line at index, so that the line is
+        the first one of a block. Returns the index of that block, or the
+        number of blocks if index is past the last line.
+        """
+        if index >= self._num_lines:
+            return len(self._blocks)
+
+        block_index, offset = self._find(index)
+        if offset == 0:
+            return block_index
+
+        block_index, block, offset = self._locate(index)
+        if offset == 0:
+            return block_index
+
+        tail = _Block.fromTexts(block.texts[offset:])
+        tail.metas = block.metas[offset:]
+        del block.texts[offset:]
+        del block.metas[offset:]
+        block.size = offset
+
+        self._blocks.insert(block_index+1, tail)
+        self._rebuildIndex()
+        return block_index+1
+
+    def _mergeBlocks(self, first, last):
+        """
+        Merges each block from first to last with the next one, if one of
+        the two is less than half full and they fit in a block. Keeps the
+        number of blocks bounded after deletions. Returns True if the index
+        was rebuilt.
+        """
+        merged = False
+        block_index = max(first, 0)
+        while block_index <= last and block_index+1 < len(self._blocks):
+            block = self._blocks[block_index]
+            next_block = self._blocks[block_index+1]
+            if (min(block.size, next_block.size) < self._block_size // 2
+                    and block.size + next_block.size <= 2 * self._block_size):
+                block.extend(next_block)
+                del self._blocks[block_index+1]
+                last -= 1
+                merged = True
+            else:
+                block_index += 1
+
+        if merged:
+            self._rebuildIndex()
+        return merged
+
+    def _splitBlock(self, block_index):
+        block = self._blocks[block_index]
+        size = self._block_size
+        new_blocks = []
+        for start in range(0, block.size, size):
+            new_block = _Block.fromTexts(block.texts[start:start+size])
+            new_block.metas = block.metas[start:start+size]
+            new_blocks.append(new_block)
+
+        self._blocks[block_index:block_index+1] = new_blocks
+        self._rebuildIndex()
+
+class _Block:
+    """
+    A run of consecutive lines. Either raw, holding the unsplit text as
+    loaded from file, or split into a list of texts and a parallel list
+    of char meta dictionaries (None until requested).
+    """
+    __slots__ = ("raw", "texts", "metas", "size")
+
+    def __init__(self):
+        self.raw = None
+        self.texts = None
+        self.metas = None
+        self.size = 0
+
+    @classmethod
+    def fromRaw(cls, raw):
+        block = cls()
+        block.raw = raw
+        block.size = raw.count(EOL)
+        return block
+
+    @classmethod
+    def fromTexts(cls, texts):
+        block = cls()
+        block.texts = texts
+        block.metas = [None] * len(texts)
+        block.size = len(texts)
+        return block
+
+    def materialize(self):
+        self.texts = _splitRaw(self.raw)
+        self.metas = [None] * self.size
+        self.raw = None
+
+    def extend(self, block):
+        """
+        Appends the lines of block
+        """
+        for part in (self, block):
+            if part.raw is not None:
+                part.materialize()
+
+        self.texts.extend(block.texts)
+        self.metas.extend(block.metas)
+        self.size += block.size
+
+    def text(self, offset=0):
+        if self.raw is not None and offset == 0:
+            return self.raw
+        return "".join(self.texts[offset:])
+
+def _isInside(block, offset, how_many):
+    """
+    True if deleting how_many lines from offset leaves part of
+    the block, and no line of the following ones
+    """
+    end = offset + how_many
+    return end < block.size or (offset != 0 and end == block.size)
+
+def _splitRaw(raw):
+    """
+    Returns the lines of a raw text, with their EOL
+    """
+    return [text+EOL for text in raw.split(EOL)[:-1]]
@@ -0,0 +1,3 @@
+from .ListStorage import ListStorage
+from .RopeStorage import RopeStorage
+from .MmapStorage import MmapStorage
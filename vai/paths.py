@@ -3,6 +3,7 @@ Module that centralizes specific paths we have an interest on.
 """
 
 import os
+import hashlib
 
 def configFile():
     """
@@ -36,6 +37,37 @@ def stateFile():
     state_dir = stateDir()
     return os.path.join(state_dir, 'vaistate')
 
+def undoJournalDir():
+    """
+    Returns the directory of the undo journals, in the state dir
+    """
+    journal_dir = os.path.join(stateDir(), 'undo')
+    if not os.path.isdir(journal_dir):
+        os.makedirs(journal_dir)
+    return journal_dir
+
+def cacheDir():
+    """
+    Returns the default cache dir in agreement with XDG rules
+    """
+    home = os.path.expanduser('~')
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME') or \
+                     os.path.join(home, '.cache')
+    cache_dir = os.path.join(xdg_cache_home, 'vai')
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    return cache_dir
+
+def symbolIndexFile(project_dir):
+    """
+    Returns the path of the symbol index cache for a project directory
+    """
+    index_dir = os.path.join(cacheDir(), 'symbols')
+    if not os.path.isdir(index_dir):
+        os.makedirs(index_dir)
+    digest = hashlib.md5(os.path.abspath(project_dir).encode("utf-8")).hexdigest()
+    return os.path.join(index_dir, digest+'.json')
+
 def pluginsDir(scope, category):
     if scope == "system":
         base_path = os.path.join( os.path.dirname(os.path.abspath(__file__)), 'plugins')
@@ -24,6 +24,7 @@ class CommandBar(gui.VWidget):
         self.returnPressed = core.VSignal(self)
         self.escapePressed = core.VSignal(self)
         self.tabPressed = core.VSignal(self)
+        self.textChanged = core.VSignal(self)
 
         self._editor_mode = EditorMode.COMMAND
 
@@ -32,6 +33,7 @@ class CommandBar(gui.VWidget):
 
         self._line_edit = gui.VLineEdit(parent=self)
         self._line_edit.returnPressed.connect(self.returnPressed)
+        self._line_edit.textChanged.connect(self._lineEditTextChanged)
         self._line_edit.setGeometry((1,0,self.width()-1,1))
         self._line_edit.installEventFilter(self)
         self._updateText()
@@ -76,6 +78,13 @@ class CommandBar(gui.VWidget):
             if event.key() == vaitk.Key.Key_Tab:
                 self.tabPressed.emit()
                 return True
+
+            # The line edit does not notify the changes made by typing
+            old_text = self._line_edit.text()
+            self._line_edit.keyEvent(event)
+            if self._line_edit.text() != old_text:
+                self.textChanged.emit(self.command_text)
+            return True
         return False
 
     def setErrorString(self, error_string):
@@ -86,6 +95,9 @@ class CommandBar(gui.VWidget):
 
     # Private
 
+    def _lineEditTextChanged(self, *args):
+        self.textChanged.emit(self.command_text)
+
     def _updateText(self):
         text = self.EDITOR_MODE_MAPPING.get(self._editor_mode, "")
         self._state_label.resize( (len(text), 1) )